@@ -1,32 +1,381 @@
+from __future__ import annotations
+
 import argparse
+import bisect
+import csv
+import glob
+import hashlib
+import importlib
 import json
 import math
 import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import List, Tuple, Optional
+from typing import Callable, List, Tuple, Optional
+
+# ===== Líné importy =====
+# cv2 / numpy / PIL / pytesseract (a pandas jen pro Table.to_dataframe) se naimportují až
+# při prvním použití => --help a volání ze skriptů neplatí start těžkých knihoven předem.
+# PyInstaller je přes importlib nevidí => při balení --hidden-import cv2 numpy PIL.Image pytesseract.
+
+class _LazyModule:
+    """Zástupce modulu; při prvním přístupu k atributu modul naimportuje a nahradí se jím v globals()."""
+    def __init__(self, name: str, alias: str):
+        self._name, self._alias = name, alias
 
-import cv2
-import numpy as np
-import pandas as pd
-from PIL import Image
-import pytesseract
+    def __getattr__(self, attr):
+        mod = importlib.import_module(self._name)
+        globals()[self._alias] = mod  # další přístupy už jdou přímo na modul
+        return getattr(mod, attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name}>"
+
+cv2 = _LazyModule("cv2", "cv2")
+np = _LazyModule("numpy", "np")
+pd = _LazyModule("pandas", "pd")
+Image = _LazyModule("PIL.Image", "Image")
+pytesseract = _LazyModule("pytesseract", "pytesseract")
+# ===== /Líné importy =====
 
 # ===== ZÓNOVÉ OCR – helpery =====
 # ===== ZÓNOVÉ OCR – helpery =====
 ALLOWED_BODY = {"R","D","N","DO","V","SC","PN","O","OV","SV","/"}
 
-def ocr_cell(img, lang="ces", whitelist=None, psm=6, extra_cfg=""):
-    """OCR jedné buňky s volitelným whitelistem a extra parametry."""
-    pil = Image.fromarray(img)
-    cfg = f"--oem 1 --psm {psm}"
-    if whitelist:
-        cfg += f" -c tessedit_char_whitelist={whitelist}"
-    if extra_cfg:
-        cfg += " " + extra_cfg
-    txt = pytesseract.image_to_string(pil, lang=lang, config=cfg)
+# ===== OCR engine =====
+# ocr_cell() jde přes vyměnitelný engine:
+#  - "tesserocr": teplý in-process handle libtesseract (jeden na kombinaci lang/psm/whitelist/cfg),
+#                 buňka se předává jako surový numpy buffer, žádný PNG ani nový proces
+#  - "pytesseract": původní cesta (temp soubor + subprocess tesseractu na každé volání)
+
+def _parse_tess_cfg(extra_cfg: str) -> dict:
+    """Z '-c klic=hodnota -c ...' udělá dict proměnných pro Tesseract API."""
+    variables = {}
+    parts = extra_cfg.split()
+    for i, part in enumerate(parts):
+        if part == "-c" and i + 1 < len(parts) and "=" in parts[i + 1]:
+            k, v = parts[i + 1].split("=", 1)
+            variables[k] = v
+    return variables
+
+class PytesseractEngine:
+    name = "pytesseract"
+
+    def image_to_string(self, img, lang, psm, whitelist=None, extra_cfg=""):
+        pil = Image.fromarray(img)
+        cfg = f"--oem 1 --psm {psm}"
+        if whitelist:
+            cfg += f" -c tessedit_char_whitelist={whitelist}"
+        if extra_cfg:
+            cfg += " " + extra_cfg
+        return pytesseract.image_to_string(pil, lang=lang, config=cfg)
+
+    def image_to_string_conf(self, img, lang, psm, whitelist=None, extra_cfg=""):
+        """(text, průměrná jistota slov 0..100) – jedno volání tesseractu přes image_to_data."""
+        words = self.image_to_data(img, lang, psm, whitelist=whitelist, extra_cfg=extra_cfg)
+        confs = [w["conf"] for w in words if w["conf"] >= 0]
+        return " ".join(w["text"] for w in words), (float(np.mean(confs)) if confs else 0.0)
+
+    def image_to_data(self, img, lang, psm, whitelist=None, extra_cfg=""):
+        pil = Image.fromarray(img)
+        cfg = f"--oem 1 --psm {psm}"
+        if whitelist:
+            cfg += f" -c tessedit_char_whitelist={whitelist}"
+        if extra_cfg:
+            cfg += " " + extra_cfg
+        d = pytesseract.image_to_data(pil, lang=lang, config=cfg, output_type=pytesseract.Output.DICT)
+        words = []
+        for i, text in enumerate(d["text"]):
+            if not str(text).strip():
+                continue
+            words.append({"text": str(text).strip(), "left": int(d["left"][i]), "top": int(d["top"][i]),
+                          "width": int(d["width"][i]), "height": int(d["height"][i]),
+                          "conf": float(d["conf"][i])})
+        return words
+
+class TesserocrEngine:
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr  # volitelná závislost
+        self._tr = tesserocr
+        # handle nejsou thread-safe => cache per vlákno
+        self._local = threading.local()
+
+    def _api(self, lang, psm, whitelist, extra_cfg):
+        apis = getattr(self._local, "apis", None)
+        if apis is None:
+            apis = self._local.apis = {}
+        key = (lang, psm, whitelist or "", extra_cfg or "")
+        api = apis.get(key)
+        if api is None:
+            variables = _parse_tess_cfg(extra_cfg or "")
+            if whitelist:
+                variables["tessedit_char_whitelist"] = whitelist
+            # load_*_dawg jsou init-only parametry => musí jít už do Init
+            api = self._tr.PyTessBaseAPI(lang=lang, psm=psm, oem=self._tr.OEM.LSTM_ONLY,
+                                         variables=variables)
+            apis[key] = api
+        return api
+
+    def _set_image(self, api, img):
+        buf = np.ascontiguousarray(img, dtype=np.uint8)
+        h, w = buf.shape[:2]
+        bpp = 1 if buf.ndim == 2 else buf.shape[2]
+        api.SetImageBytes(buf.tobytes(), w, h, bpp, w * bpp)
+
+    def image_to_string(self, img, lang, psm, whitelist=None, extra_cfg=""):
+        api = self._api(lang, psm, whitelist, extra_cfg)
+        self._set_image(api, img)
+        return api.GetUTF8Text()
+
+    def image_to_string_conf(self, img, lang, psm, whitelist=None, extra_cfg=""):
+        api = self._api(lang, psm, whitelist, extra_cfg)
+        self._set_image(api, img)
+        text = api.GetUTF8Text()
+        return text, float(api.MeanTextConf())
+
+    def image_to_data(self, img, lang, psm, whitelist=None, extra_cfg=""):
+        api = self._api(lang, psm, whitelist, extra_cfg)
+        self._set_image(api, img)
+        api.Recognize()
+        it = api.GetIterator()
+        words = []
+        if it is None:
+            return words
+        level = self._tr.RIL.WORD
+        for r in self._tr.iterate_level(it, level):
+            text = r.GetUTF8Text(level)
+            box = r.BoundingBox(level)
+            if not text or not text.strip() or box is None:
+                continue
+            x1, y1, x2, y2 = box
+            words.append({"text": text.strip(), "left": x1, "top": y1,
+                          "width": x2 - x1, "height": y2 - y1, "conf": float(r.Confidence(level))})
+        return words
+
+_ENGINE = None
+
+def set_engine(name: str = "auto"):
+    """Nastaví OCR engine pro tento proces ('auto' = tesserocr, pokud je k dispozici)."""
+    global _ENGINE
+    if name in ("auto", "tesserocr"):
+        try:
+            _ENGINE = TesserocrEngine()
+            return _ENGINE
+        except ImportError:
+            if name == "tesserocr":
+                raise
+    _ENGINE = PytesseractEngine()
+    return _ENGINE
+
+def get_engine():
+    return _ENGINE if _ENGINE is not None else set_engine("auto")
+
+def ocr_cell(img, lang="ces", whitelist=None, psm=6, extra_cfg="", with_conf=False):
+    """
+    OCR jedné buňky s volitelným whitelistem a extra parametry.
+    with_conf=True => vrací (text, jistota 0..100) místo samotného textu.
+    """
+    eng = get_engine()
+    if with_conf:
+        txt, conf = eng.image_to_string_conf(img, lang=lang, psm=psm, whitelist=whitelist, extra_cfg=extra_cfg)
+    else:
+        txt = eng.image_to_string(img, lang=lang, psm=psm, whitelist=whitelist, extra_cfg=extra_cfg)
     # základní očista
     txt = txt.replace("—","-").replace("–","-").replace("|"," ")
-    return " ".join(txt.split()).strip()
+    txt = " ".join(txt.split()).strip()
+    return (txt, conf) if with_conf else txt
+# ===== /OCR engine =====
+
+# ===== Profilování =====
+# --profile: čas po fázích pipeline, histogram latence OCR po kategoriích buněk
+# a počty fallbacků. Vypnutý profiler nic neměří.
+
+OCR_HIST_BINS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.stages = {}    # fáze -> sekundy (součet)
+        self.ocr = {}       # kategorie -> [sekundy, ...] po buňkách / stripech
+        self.counters = {}  # fallbacky, přeskočené buňky, ...
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - t0
+
+    def add_ocr(self, category: str, seconds: float):
+        if self.enabled:
+            self.ocr.setdefault(category, []).append(seconds)
+
+    def count(self, name: str, n: int = 1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self, **extra) -> dict:
+        ocr = {}
+        for cat, vals in self.ocr.items():
+            ms = np.sort(np.asarray(vals) * 1000.0)
+            edges = [0] + list(OCR_HIST_BINS_MS) + [float("inf")]
+            hist = np.histogram(ms, bins=edges)[0]
+            ocr[cat] = {
+                "count": int(ms.size), "total_ms": round(float(ms.sum()), 2),
+                "mean_ms": round(float(ms.mean()), 2),
+                "p50_ms": round(float(np.percentile(ms, 50)), 2),
+                "p90_ms": round(float(np.percentile(ms, 90)), 2),
+                "max_ms": round(float(ms[-1]), 2),
+                "histogram_ms": {f"<{hi}" if hi != float("inf") else f">={lo}": int(n)
+                                 for lo, hi, n in zip(edges[:-1], edges[1:], hist)},
+            }
+        return {**extra, "stages_s": {k: round(v, 4) for k, v in self.stages.items()},
+                "ocr": ocr, "counters": dict(self.counters)}
+
+    def save(self, path: str, **extra) -> dict:
+        report = self.report(**extra)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return report
+
+PROFILE = Profiler()
+# ===== /Profilování =====
+
+# ===== OCR cache =====
+# Perzistentní cache výsledků OCR na disku (sqlite). Klíč = hash předzpracovaného
+# výřezu + konfigurace OCR (engine, lang, psm, whitelist, extra_cfg), takže opakované
+# zpracování stejného (nebo jen lokálně opraveného) skenu přeskočí Tesseract.
+# Velikost je omezená, vyhazuje se nejdéle nepoužité (LRU).
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".cache", "image_extract", "ocr_cache.sqlite")
+
+class OcrCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_mb: float = 256,
+                 now: Callable[[], float] = time.time):
+        self.path = path
+        self._now = now  # hodiny pro čas použití (LRU); testy podstrčí deterministické
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = self.misses = 0
+        self._puts = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # autocommit; WAL + synchronous=NORMAL => zápis bez fsync, víc procesů najednou;
+        # jedno spojení sdílí i vlákna (batch --pipeline) => přístup přes zámek
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS ocr (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                         "size INTEGER NOT NULL, used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ocr_used ON ocr(used)")
+
+    @staticmethod
+    def key(img: np.ndarray, **cfg) -> str:
+        h = hashlib.blake2b(digest_size=20)
+        h.update(f"{img.shape}|{img.dtype}|".encode())
+        h.update(np.ascontiguousarray(img).tobytes())
+        h.update(json.dumps(cfg, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM ocr WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE ocr SET used = ? WHERE key = ?", (self._now(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value):
+        v = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO ocr (key, value, size, used) VALUES (?, ?, ?, ?)",
+                             (key, v, len(key) + len(v.encode("utf-8")) + 32, self._now()))
+            self._puts += 1
+            if self._puts % 256 == 0:
+                self.evict()
+
+    def evict(self):
+        """Smaže nejdéle nepoužité záznamy, dokud cache nespadne pod 90 % limitu."""
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM ocr").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            to_free = total - int(self.max_bytes * 0.9)
+            cutoff = None
+            for used, size in self._db.execute("SELECT used, size FROM ocr ORDER BY used"):
+                to_free -= size
+                cutoff = used
+                if to_free <= 0:
+                    break
+            if cutoff is not None:
+                self._db.execute("DELETE FROM ocr WHERE used <= ?", (cutoff,))
+
+    def close(self):
+        with self._lock:
+            if self._db is None:
+                return
+            self.evict()
+            self._db.close()
+            self._db = None
+
+_CACHE = None
+
+def set_cache(path: Optional[str] = DEFAULT_CACHE_PATH, max_mb: float = 256):
+    """Zapne (path) / vypne (None) OCR cache pro tento proces."""
+    global _CACHE
+    if _CACHE is not None:
+        _CACHE.close()
+    _CACHE = OcrCache(path, max_mb) if path else None
+    if _CACHE is not None:
+        # workery poolu nekončí přes atexit => uzavření (a eviction) přes finalizer multiprocessingu
+        import multiprocessing.util
+        multiprocessing.util.Finalize(_CACHE, _CACHE.close, exitpriority=10)
+    return _CACHE
+
+def cached_ocr_cell(img, lang="ces", whitelist=None, psm=6, extra_cfg="", with_conf=False):
+    """ocr_cell() přes OCR cache; při zásahu se Tesseract vůbec nevolá."""
+    if _CACHE is None:
+        return ocr_cell(img, lang=lang, whitelist=whitelist, psm=psm, extra_cfg=extra_cfg, with_conf=with_conf)
+    key = OcrCache.key(img, op="string_conf" if with_conf else "string", engine=get_engine().name,
+                       lang=lang, psm=psm, whitelist=whitelist or "", extra_cfg=extra_cfg or "")
+    res = _CACHE.get(key)
+    if res is None:
+        res = ocr_cell(img, lang=lang, whitelist=whitelist, psm=psm, extra_cfg=extra_cfg, with_conf=with_conf)
+        _CACHE.put(key, res)
+    return tuple(res) if with_conf else res
+
+def cached_image_to_data(img, lang="ces", whitelist=None, psm=7, extra_cfg=""):
+    """Engine.image_to_data() přes OCR cache (strip režim)."""
+    if _CACHE is None:
+        return get_engine().image_to_data(img, lang=lang, psm=psm, whitelist=whitelist, extra_cfg=extra_cfg)
+    key = OcrCache.key(img, op="data", engine=get_engine().name, lang=lang, psm=psm,
+                       whitelist=whitelist or "", extra_cfg=extra_cfg or "")
+    words = _CACHE.get(key)
+    if words is None:
+        words = get_engine().image_to_data(img, lang=lang, psm=psm, whitelist=whitelist, extra_cfg=extra_cfg)
+        _CACHE.put(key, words)
+    return words
+
+def _init_worker(engine_name: str, cache_path: Optional[str], cache_max_mb: float):
+    """Inicializace procesu v poolu: vlastní engine handle i připojení ke cache."""
+    set_engine(engine_name)
+    set_cache(cache_path, cache_max_mb)
+# ===== /OCR cache =====
 
 
 def normalize_name(s: str) -> str:
@@ -51,23 +400,187 @@ def normalize_body_token(s: str) -> str:
 
 # -------- Helpers --------
 
-def sort_with_tolerance(values, tol=10):
-    """Group nearly-equal coordinates together (to align rows/cols even když čáry nejsou 100% rovné)."""
-    values = sorted(values)
-    groups = []
-    for v in values:
-        if not groups or abs(v - groups[-1][-1]) > tol:
-            groups.append([v])
-        else:
-            groups[-1].append(v)
-    return [int(np.median(g)) for g in groups]
+LINE_MIN_REL_STRENGTH = 0.2  # čáry slabší než tento podíl nejsilnější čáry se zahodí
+
+def find_lines(profile: np.ndarray, tol: int = 10, span: Optional[int] = None,
+               min_rel_strength: float = LINE_MIN_REL_STRENGTH):
+    """
+    Seskupí téměř stejné souřadnice čar (čáry nejsou 100% rovné) nad projekčním profilem
+    masky čar. Běhy nenulového profilu se najdou přes np.diff, běhy s mezerou <= tol
+    se sloučí a pozice čáry je medián (zaokrouhlený dolů) zapnutých indexů ve skupině.
+    tol >= 1: sousední pixely jedné čáry patří vždy k sobě (tol=0 by je rozdělil
+    po jednom pixelu, proto se odmítá).
+    Vrací (pozice, tloušťka, síla); síla = max. pokrytí čáry (0..1 z `span` px),
+    slabé čáry (< min_rel_strength * nejsilnější) se zahodí.
+    """
+    if tol < 1:
+        raise ValueError(f"find_lines: tol musí být >= 1, dostal {tol}")
+    profile = np.asarray(profile).ravel()
+    on = profile > 0
+    empty = np.zeros(0, dtype=np.int64)
+    if not on.any():
+        return empty, empty, np.zeros(0)
+    d = np.diff(np.concatenate(([0], on.view(np.int8), [0])))
+    starts = np.flatnonzero(d == 1)
+    ends = np.flatnonzero(d == -1)  # exkluzivní
+
+    # nová skupina, když je od posledního zapnutého indexu dál než tol
+    first = np.concatenate(([True], starts[1:] - (ends[:-1] - 1) > tol))
+    gi = np.flatnonzero(first)
+    g_start = starts[gi]
+    g_end = ends[np.concatenate((gi[1:] - 1, [len(ends) - 1]))]
+
+    # medián zapnutých indexů ve skupině přes kumulativní počet
+    cum = np.cumsum(on)
+    base = np.where(g_start > 0, cum[g_start - 1], 0)
+    n = cum[g_end - 1] - base
+    lo = np.searchsorted(cum, base + (n - 1) // 2 + 1)
+    hi = np.searchsorted(cum, base + n // 2 + 1)
+    pos = (lo + hi) // 2
+
+    thickness = g_end - g_start
+    # max v [g_start, další g_start) = max ve skupině (mezery mají profil 0)
+    strength = np.maximum.reduceat(profile, g_start).astype(np.float64)
+    strength /= 255.0 * (span or max(1.0, strength.max() / 255.0))
+    if min_rel_strength > 0 and len(strength):
+        keep = strength >= min_rel_strength * strength.max()
+        pos, thickness, strength = pos[keep], thickness[keep], strength[keep]
+    return pos, thickness, strength
+
+# -------- Paměťově omezený režim --------
+# Velké skeny (A3 / 600 DPI, slepené rozpisy): stránka se načte rovnou šedá, lokální
+# filtry (odšum, adaptivní práh) běží po vodorovných pásech s překryvem a morfologie
+# čar po pásech bez plných mezivýsledků => v paměti zůstane jen pár kopií stránky.
 
-def deskew(image_gray):
-    """Automaticky narovná lehce pootočený dokument (Hough lines)."""
+TILE_ROWS = 1024        # výchozí výška pásu v px
+FULL_BYTES_PER_PX = 7   # odhad špičky běžného režimu (BGR + šedá + bw + 2 masky čar + temp)
+TILED_BYTES_PER_PX = 3  # odhad špičky dlaždicového režimu (šedá + bw + výstup filtru)
+OCR_BYTES_PER_PX = 2    # fáze OCR v obou režimech (šedá + binárka pro OCR; výřezy buněk jsou pohledy)
+BAND_BYTES_PER_PX = 10  # dočasné mapy jednoho pásu (nejhůř fallback: 2x labely int32 + 2 masky)
+
+def peak_rss_mb() -> Optional[float]:
+    """Špička RSS tohoto procesu v MB (resource na Linux/macOS, psutil na Windows), jinak None."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # macOS: bajty
+    except ImportError:
+        pass
+    try:
+        import psutil  # volitelná závislost
+        mi = psutil.Process().memory_info()
+        return getattr(mi, "peak_wset", mi.rss) / (1024 * 1024)
+    except ImportError:
+        return None
+
+def tile_rows_for(shape: Tuple[int, int], max_memory_mb: float = 0) -> int:
+    """Výška pásu: pás s dočasnými mapami (BAND_BYTES_PER_PX) má zabrat max. ~10 % limitu paměti."""
+    if max_memory_mb <= 0:
+        return TILE_ROWS
+    rows = int(max_memory_mb * 1024 * 1024 * 0.1 / (BAND_BYTES_PER_PX * max(1, shape[1])))
+    return max(64, min(TILE_ROWS, rows))
+
+def tiled_rows(fn, src: np.ndarray, overlap: int, rows: int) -> np.ndarray:
+    """
+    Lokální filtr fn po vodorovných pásech výšky `rows` s překryvem `overlap` řádků
+    (>= poloměr filtru => výsledek je stejný jako na celé stránce); výstup se skládá
+    do jednoho předalokovaného pole.
+    """
+    H = src.shape[0]
+    if rows <= 0 or H <= rows:
+        return fn(src)
+    out = None
+    for a in range(0, H, rows):
+        b = min(H, a + rows)
+        a0, b0 = max(0, a - overlap), min(H, b + overlap)
+        res = fn(src[a0:b0])
+        if out is None:
+            out = np.empty((H,) + res.shape[1:], dtype=res.dtype)
+        out[a:b] = res[a - a0: a - a0 + (b - a)]
+    return out
+
+def line_profiles_tiled(bw: np.ndarray, horiz_kernel, vert_kernel, rows: int):
+    """
+    Profily masek čar bez plných mezivýsledků: vodorovné otevření (jádro k x 1) závisí jen
+    na řádku => po pásech řádků, svislé (1 x k) jen na sloupci => po pásech sloupců.
+    Výsledek je stejný jako otevření celé stránky; vrací (h_prof, v_prof).
+    """
+    H, W = bw.shape[:2]
+    h_prof = np.zeros(H, dtype=np.int64)
+    v_prof = np.zeros(W, dtype=np.int64)
+    for a in range(0, H, rows):
+        band = cv2.morphologyEx(bw[a:a + rows], cv2.MORPH_OPEN, horiz_kernel, iterations=2)
+        h_prof[a:a + band.shape[0]] = cv2.reduce(band, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+    cols = max(16, rows * W // max(1, H))  # pás sloupců se stejnou plochou
+    for a in range(0, W, cols):
+        band = cv2.morphologyEx(np.ascontiguousarray(bw[:, a:a + cols]), cv2.MORPH_OPEN, vert_kernel, iterations=2)
+        v_prof[a:a + band.shape[1]] = cv2.reduce(band, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+    return h_prof, v_prof
+
+# Pod NOISE_LOW se neodšumuje (čisté exporty vychází ~0.0), jinak NL-means. Mezistupeň
+# s mediánem 3x3 auto nepoužívá: zbylé tečky šumu adaptivní práh (C=2) mění v inkoust
+# a prázdné buňky pak vypadají jako text už od sigmy ~1.1 (na syntetických rozpisech).
+NOISE_LOW = 0.9
+
+def estimate_noise(gray) -> float:
+    """
+    Rychlý odhad sigmy šumu (Immerkær): odezva na Laplaceovu masku jen na papíře,
+    tj. mimo rozšířenou Cannyho mapu hran. Canny běží na rozmazané stránce, takže
+    šum hrany nevyrobí, ale text a čáry (i s vyhlazeným okrajem) se vymaskují celé =>
+    hustota inkoustu odhad neovlivní (čistý export ~0, sigma 3/6/10 => ~3/6/10).
+    Velké stránky se vzorkují s krokem, aby odhad stál pár ms.
+    """
+    step = max(1, int(math.sqrt(gray.size / 2e6)))
+    g = gray[::step, ::step]
+    edges = cv2.Canny(cv2.GaussianBlur(g, (0, 0), 1.5), 30, 90)
+    edges = cv2.dilate(edges, cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5)))
+    flat = edges == 0
+    if flat.sum() < 1000:  # samé hrany => nic k měření
+        return 0.0
+    lap = cv2.filter2D(g.astype(np.float32), cv2.CV_32F,
+                       np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32))
+    return float(math.sqrt(math.pi / 2) * np.abs(lap[flat]).mean() / 6.0)
+
+def denoise_page(gray, mode: str = "auto", tile_rows: int = 0):
+    """
+    Odšum celé stránky podle úrovně:
+      none | median | bilateral | nlm | roi (stránka beze změny, odšumí se až OCR výřezy)
+      auto: podle estimate_noise -> none / nlm
+    tile_rows > 0: po pásech (tiled_rows) s překryvem podle okna filtru.
+    """
+    if mode == "auto":
+        sigma = estimate_noise(gray)
+        mode = "none" if sigma < NOISE_LOW else "nlm"
+        print(f"Odhad šumu: sigma={sigma:.2f} -> odšum '{mode}'")
+    if mode in ("none", "roi"):
+        return gray
+    if mode == "median":
+        return tiled_rows(lambda g: cv2.medianBlur(g, 3), gray, 2, tile_rows)
+    if mode == "bilateral":
+        return tiled_rows(lambda g: cv2.bilateralFilter(g, 5, 30, 5), gray, 3, tile_rows)
+    # search window 21 + template 7 => překryv 14
+    return tiled_rows(lambda g: cv2.fastNlMeansDenoising(g, h=12), gray, 14, tile_rows)
+
+def denoise_roi(gray, y1: int, y2: int, x1: int, x2: int, pad: int = 10):
+    """NL-means jen na výřezu buňky (s okrajem kvůli search window); vrací (roi_gray, roi_bin)."""
+    H, W = gray.shape[:2]
+    py1, py2 = max(0, y1 - pad), min(H, y2 + pad)
+    px1, px2 = max(0, x1 - pad), min(W, x2 + pad)
+    g = cv2.fastNlMeansDenoising(gray[py1:py2, px1:px2], h=12)
+    b = cv2.adaptiveThreshold(g, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2)
+    sl = (slice(y1 - py1, y2 - py1), slice(x1 - px1, x2 - px1))
+    return g[sl], b[sl]
+
+DESKEW_MAX_DIM = 1000      # úhel se odhaduje na zmenšenině s tímto max. rozměrem
+DESKEW_MAX_ANGLE = 10.0    # prohledávaný rozsah natočení (±°)
+DESKEW_MAX_POINTS = 60000  # strop počtu pixelů inkoustu v projekčním profilu
+
+def _deskew_angle_full(image_gray) -> Optional[float]:
+    """Původní odhad úhlu: HoughLines na plném rozlišení (pomalé, jen pro srovnání)."""
     edges = cv2.Canny(image_gray, 50, 150, apertureSize=3)
     lines = cv2.HoughLines(edges, 1, np.pi/180, 200)
     if lines is None:
-        return image_gray
+        return None
     angles = []
     for rho, theta in lines[:, 0]:
         angle = (theta * 180 / np.pi) - 90
@@ -75,12 +588,72 @@ def deskew(image_gray):
         if -45 <= angle <= 45:
             angles.append(angle)
     if not angles:
-        return image_gray
-    angle = np.median(angles)
+        return None
+    return float(np.median(angles))
+
+def estimate_skew_angle(image_gray, max_dim: int = DESKEW_MAX_DIM,
+                        max_angle: float = DESKEW_MAX_ANGLE,
+                        max_points: int = DESKEW_MAX_POINTS) -> Optional[float]:
+    """
+    Úhel natočení ve stupních odhadnutý projekčním profilem na zmenšenině:
+    pixely inkoustu se pro kandidátní úhel "sklopí" (y - x*tan(a)) a hledá se úhel
+    s nejostřejším histogramem řádků (čáry tabulky a řádky textu se slijí do špiček).
+    Nejdřív hrubě po 0.5°, pak jemně po 0.05° kolem maxima. Stejná konvence znaménka
+    jako původní Hough (kladný úhel = pravý konec čar níž).
+    """
+    small, _ = _thumbnail(image_gray, max_dim)
+    bw = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+    ys, xs = np.nonzero(bw)
+    if ys.size < 100:
+        return None
+    step = max(1, ys.size // max_points)
+    ys = ys[::step].astype(np.float32)
+    xs = xs[::step].astype(np.float32) - small.shape[1] / 2.0
+    offset = int(math.tan(math.radians(max_angle)) * small.shape[1] / 2.0) + 2
+
+    def sharpness(angle):
+        yy = (ys - xs * math.tan(math.radians(angle)) + offset).astype(np.int64)
+        hist = np.bincount(yy)
+        return int(np.dot(hist, hist))
+
+    coarse = np.arange(-max_angle, max_angle + 1e-6, 0.5)
+    best = max(coarse, key=sharpness)
+    fine = np.arange(best - 0.5, best + 0.5 + 1e-6, 0.05)
+    return float(round(max(fine, key=sharpness), 2))
+
+def deskew(image_gray, fast: bool = True, with_matrix: bool = False):
+    """
+    Automaticky narovná lehce pootočený dokument (úhel ze zmenšeniny, rotace jednou v plném rozlišení).
+    with_matrix=True: vrací (obrázek, 2x3 matice z narovnaných souřadnic do původních).
+    """
+    angle = estimate_skew_angle(image_gray) if fast else _deskew_angle_full(image_gray)
+    if angle is None or abs(angle) < 0.05:
+        return (image_gray, np.eye(2, 3)) if with_matrix else image_gray
     (h, w) = image_gray.shape[:2]
     M = cv2.getRotationMatrix2D((w//2, h//2), angle, 1.0)
     rotated = cv2.warpAffine(image_gray, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-    return rotated
+    return (rotated, cv2.invertAffineTransform(M)) if with_matrix else rotated
+
+def compare_deskew(img_paths: List[str], repeat: int = 3):
+    """Srovnání času a úhlu: původní Hough na plném rozlišení vs. projekční profil na zmenšenině."""
+    for path in img_paths:
+        gray = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"{path}: nelze načíst")
+            continue
+        res = {}
+        for name, fn in (("full", _deskew_angle_full), ("fast", estimate_skew_angle)):
+            t = []
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                angle = fn(gray)
+                t.append(time.perf_counter() - t0)
+            res[name] = (min(t), angle)
+        (tf, af), (tq, aq) = res["full"], res["fast"]
+        fmt = lambda a: "-" if a is None else f"{a:+.2f}°"
+        print(f"{os.path.basename(path)} {gray.shape[1]}x{gray.shape[0]}: "
+              f"full {tf*1000:.0f} ms ({fmt(af)}), fast {tq*1000:.0f} ms ({fmt(aq)}), "
+              f"zrychlení {tf / max(tq, 1e-9):.1f}x")
 
 def ocr_image(img, lang="eng"):
     pil = Image.fromarray(img)
@@ -98,126 +671,804 @@ class Cell:
     c: int
     bbox: Tuple[int, int, int, int]  # x, y, w, h
     text: str = ""
+    color: Optional[Tuple[float, float, float]] = None  # (podíl barevných px, a*, b*), viz cell_colors
 
 # -------- Pipeline --------
 
-def extract_grid_cells(img_path: str, debug_dir: Optional[str] = None) -> Tuple[np.ndarray, List[Cell]]:
+# -------- Pyramida (hrubě -> jemně) --------
+PYRAMID_MIN_DIM = 400  # nejmenší kratší strana úrovně pyramidy (jinak tenké čáry zmizí)
+
+def _refine_lines(bw: np.ndarray, coarse: np.ndarray, f: float, axis: int) -> np.ndarray:
+    """
+    Zpřesní pozice čar z úrovně pyramidy v plném rozlišení: pro každou čáru jen úzký pás
+    (±1/f + 2 px) binárky, profil inkoustu v pásu a pozice = medián řádků/sloupců s aspoň
+    polovinou maxima (střed tloušťky čáry, stejně jako find_lines). axis 0 = řádky (y), 1 = sloupce (x).
+    """
+    n = bw.shape[axis]
+    half = int(math.ceil(1.0 / f)) + 2
+    out = []
+    for c in coarse:
+        a = max(0, int(round(c / f)) - half)
+        b = min(n, int(round(c / f)) + half + 1)
+        band = bw[a:b, :] if axis == 0 else bw[:, a:b]
+        prof = cv2.reduce(band, 1 - axis, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+        if prof.max() <= 0:
+            out.append(int(round(c / f)))
+            continue
+        out.append(a + int(np.median(np.flatnonzero(prof >= prof.max() * 0.5))))
+    return np.asarray(out, dtype=np.int64)
+
+def detect_lines_pyramid(gray: np.ndarray, bw: np.ndarray, levels: int,
+                         debug_dir: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Detekce čar mřížky na zmenšené úrovni pyramidy (každá úroveň = poloviční rozlišení):
+    stejná binarizace + morfologie + find_lines jako v plném rozlišení, jen s jádry
+    zmenšenými v poměru f; pozice se pak zpřesní v úzkých pásech plné binárky `bw`.
+    Vrací (row_lines, col_lines) v plném rozlišení.
+    """
+    small, f = gray, 1.0
+    for _ in range(levels):
+        if min(small.shape[:2]) // 2 < PYRAMID_MIN_DIM:
+            break
+        small, f = cv2.pyrDown(small), f / 2
+    if f == 1.0:
+        small_bw = bw
+    else:
+        block = max(3, int(31 * f) | 1)
+        small_bw = cv2.adaptiveThreshold(small, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                         cv2.THRESH_BINARY_INV, block, 10)
+    scale = max(8, min(gray.shape[1], gray.shape[0]) // 60)
+    s = max(3, int(round(scale * f)))
+    horizontal = cv2.morphologyEx(small_bw, cv2.MORPH_OPEN,
+                                  cv2.getStructuringElement(cv2.MORPH_RECT, (s * 4, 1)), iterations=2)
+    vertical = cv2.morphologyEx(small_bw, cv2.MORPH_OPEN,
+                                cv2.getStructuringElement(cv2.MORPH_RECT, (1, s * 3)), iterations=2)
+    if debug_dir:
+        cv2.imwrite(os.path.join(debug_dir, "02_horizontal.png"), horizontal)
+        cv2.imwrite(os.path.join(debug_dir, "03_vertical.png"), vertical)
+    h_prof = cv2.reduce(horizontal, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+    v_prof = cv2.reduce(vertical, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+    rows, _, _ = find_lines(h_prof, tol=max(2, int(round(12 * f))), span=small.shape[1])
+    cols, _, _ = find_lines(v_prof, tol=max(2, int(round(8 * f))), span=small.shape[0])
+    if f == 1.0:
+        return rows, cols
+    return _refine_lines(bw, rows, f, 0), _refine_lines(bw, cols, f, 1)
+
+# -------- Oblast tabulky --------
+TABLE_THUMB    = 800   # px delší strany náhledu pro hledání tabulky
+TABLE_MIN_AREA = 0.05  # menší "tabulka" než tento podíl stránky => radši celá stránka
+TABLE_MAX_AREA = 0.85  # ořez přes víc než tento podíl stránky nic neušetří
+TABLE_MARGIN   = 0.015 # okraj kolem tabulky (podíl delší strany) kvůli natočení / krajním čarám
+
+def find_table_region(gray: np.ndarray, debug_dir: Optional[str] = None) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Levné hledání tabulky na náhledu: masku vodorovných a svislých čar spojí dilatace
+    a tabulka je komponenta s největším bounding boxem. Vrací (x1, y1, x2, y2) v plném
+    rozlišení včetně okraje, nebo None (bez čar / tabulka přes skoro celou stránku).
+    """
+    thumb, f = _thumbnail(gray, TABLE_THUMB)
+    th, tw = thumb.shape[:2]
+    bw = cv2.adaptiveThreshold(thumb, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 15, 10)
+    k = max(8, min(th, tw) // 40)
+    horiz = cv2.morphologyEx(bw, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (2 * k, 1)))
+    vert = cv2.morphologyEx(bw, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, 2 * k)))
+    grid = cv2.dilate(cv2.bitwise_or(horiz, vert), np.ones((5, 5), np.uint8))
+    n, _, stats, _ = cv2.connectedComponentsWithStats(grid, connectivity=8)
+    if n < 2:
+        return None
+    boxes = stats[1:, cv2.CC_STAT_WIDTH].astype(np.int64) * stats[1:, cv2.CC_STAT_HEIGHT]
+    i = 1 + int(np.argmax(boxes))
+    x, y, w, h = (int(v) for v in stats[i, :4])
+    if w * h < TABLE_MIN_AREA * th * tw:
+        return None
+    m = TABLE_MARGIN * max(th, tw)
+    H, W = gray.shape[:2]
+    x1, y1 = max(0, int((x - m) / f)), max(0, int((y - m) / f))
+    x2, y2 = min(W, int(math.ceil((x + w + m) / f))), min(H, int(math.ceil((y + h + m) / f)))
+    if debug_dir:
+        os.makedirs(debug_dir, exist_ok=True)
+        vis = cv2.cvtColor(thumb, cv2.COLOR_GRAY2BGR)
+        cv2.rectangle(vis, (int(x1 * f), int(y1 * f)), (int(x2 * f), int(y2 * f)), (0, 0, 255), 2)
+        cv2.imwrite(os.path.join(debug_dir, "00_table_region.png"), vis)
+    if (x2 - x1) * (y2 - y1) > TABLE_MAX_AREA * H * W:
+        return None
+    return x1, y1, x2, y2
+
+def extract_grid_cells(img_path: str, debug_dir: Optional[str] = None,
+                       template: Optional[str] = None,
+                       denoise: str = "auto",
+                       table_crop: bool = False,
+                       pyramid: int = 0,
+                       tile_rows: int = 0,
+                       color: bool = False,
+                       image: Optional[np.ndarray] = None) -> Tuple[np.ndarray, List[Cell]]:
     """
     Vrátí (originální_BW_obrázek, list buněk se souřadnicemi).
     Detekce mřížky přes morfologii a projekce horizontálních/vertikálních linek.
+
+    template: soubor šablony mřížky (viz save_grid_template). Pokud existuje a sken na ni
+    jde zaregistrovat, přeskočí se odšum, deskew, morfologie i seskupování čar.
+    Pokud neexistuje, uloží se do něj mřížka detekovaná plnou cestou.
+
+    denoise: viz denoise_page ("auto" vybere podle odhadu šumu; "roi" nechá odšum na OCR výřezy).
+
+    table_crop: tabulka se nejdřív najde na náhledu (find_table_region) a všechno další
+    (šablona, odšum, deskew, morfologie, OCR) běží jen na jejím výřezu => vrácený obrázek
+    i souřadnice buněk jsou v souřadnicích výřezu.
+
+    pyramid: počet úrovní pyramidy pro detekci čar (0 = plné rozlišení, viz detect_lines_pyramid).
+
+    tile_rows > 0: paměťově omezený režim – obrázek se načte rovnou šedý (bez BGR kopie),
+    odšum / binarizace / morfologie čar běží po pásech této výšky.
+
+    color=True: z originálu se před převodem na šedou odloží malý barevný náhled a buňky
+    dostanou Cell.color (viz cell_colors); výřez / deskew / šablona se zaznamenají jako
+    afinní zobrazení zpět do originálu, barevný obrázek se nikam nedeformuje.
+
+    image: už načtený obrázek (BGR, v dlaždicovém režimu šedý) – načítání pak může běžet
+    v jiném vlákně (run_pipeline); volající si na něj nemá nechávat referenci.
     """
     # Načtení a předzpracování
-    image = cv2.imread(img_path)
-    if image is None:
-        raise FileNotFoundError(f"Nelze načíst obrázek: {img_path}")
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    thumb = None
+    with PROFILE.stage("load"):
+        if image is None:
+            image = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE if tile_rows else cv2.IMREAD_COLOR)
+            if image is None:
+                raise FileNotFoundError(f"Nelze načíst obrázek: {img_path}")
+        if image.ndim == 2:
+            gray = image
+            if color:  # dekódování rovnou ve 1/4 => žádná plná BGR kopie
+                thumb = color_thumbnail(cv2.imread(img_path, cv2.IMREAD_REDUCED_COLOR_4))
+        else:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            if color:
+                thumb = color_thumbnail(image)
+        del image  # BGR už není potřeba => paměť se uvolní hned
+    src_shape = gray.shape[:2]
+    to_src = np.eye(3)  # souřadnice buněk -> souřadnice originálu (pro barvy)
 
-    # adaptivní kontrast / odšum
-    gray = cv2.fastNlMeansDenoising(gray, h=12)
-    gray = deskew(gray)
+    if table_crop:
+        with PROFILE.stage("table_region"):
+            region = find_table_region(gray, debug_dir)
+        if region is not None:
+            x1, y1, x2, y2 = region
+            print(f"Tabulka: {x2 - x1}x{y2 - y1} z {gray.shape[1]}x{gray.shape[0]} "
+                  f"({100.0 * (x2 - x1) * (y2 - y1) / gray.size:.0f} % stránky)")
+            gray = gray[y1:y2, x1:x2].copy()  # kopie => celá stránka se může uvolnit
+            to_src = to_src @ np.array([[1.0, 0, x1], [0, 1.0, y1], [0, 0, 1.0]])
+        else:
+            print("Tabulka: oblast nenalezena, zpracuje se celá stránka")
+
+    # adaptivní kontrast / odšum (podle odhadnutého šumu); i před šablonou, ta vrací rovnou obrázek pro OCR
+    with PROFILE.stage("denoise"):
+        gray = denoise_page(gray, denoise, tile_rows)
+
+    if template and os.path.exists(template):
+        try:
+            tpl = load_grid_template(template)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Šablona {template} nejde načíst ({e}), plná detekce mřížky")
+            tpl = None
+        with PROFILE.stage("template_register"):
+            reg = register_to_template(gray, tpl, with_matrix=True) if tpl is not None else None
+        PROFILE.count("template_registered" if reg is not None else "template_rejected")
+        if reg is not None:
+            aligned, M = reg
+            cells = cells_from_lines(tpl["row_lines"], tpl["col_lines"])
+            print(f"Šablona {template}: zaregistrováno, {len(cells)} buněk")
+            if thumb is not None:
+                with PROFILE.stage("color"):
+                    cell_colors(cells, thumb, src_shape, to_src @ np.vstack([M, [0, 0, 1]]))
+            return aligned, cells
+        if tpl is not None:
+            print(f"Šablona {template}: sken nesedí, plná detekce mřížky")
+
+    with PROFILE.stage("deskew"):
+        gray, M = deskew(gray, with_matrix=True)
+        to_src = to_src @ np.vstack([M, [0, 0, 1]])
 
     # binarizace
-    bw = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
-                               cv2.THRESH_BINARY_INV, 31, 10)
+    with PROFILE.stage("binarize"):
+        bw = tiled_rows(lambda g: cv2.adaptiveThreshold(g, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                                        cv2.THRESH_BINARY_INV, 31, 10), gray, 16, tile_rows)
 
     if debug_dir:
         os.makedirs(debug_dir, exist_ok=True)
         cv2.imwrite(os.path.join(debug_dir, "01_bw.png"), bw)
 
-    # Oddělení horizontálních a vertikálních linek (morfologie)
-    scale = max(8, min(gray.shape[1], gray.shape[0]) // 60)
-    horiz_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (scale*4, 1))
-    vert_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, scale*3))
+    if pyramid > 0:
+        # hrubě na zmenšené úrovni, jemně jen v úzkých pásech kolem nalezených čar
+        with PROFILE.stage("pyramid_lines"):
+            row_lines, col_lines = detect_lines_pyramid(gray, bw, pyramid, debug_dir)
+    else:
+        # Oddělení horizontálních a vertikálních linek (morfologie)
+        scale = max(8, min(gray.shape[1], gray.shape[0]) // 60)
+        horiz_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (scale*4, 1))
+        vert_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, scale*3))
 
-    horizontal = cv2.morphologyEx(bw, cv2.MORPH_OPEN, horiz_kernel, iterations=2)
-    vertical = cv2.morphologyEx(bw, cv2.MORPH_OPEN, vert_kernel, iterations=2)
+        if tile_rows:
+            # po pásech, plné masky čar nikdy neexistují
+            with PROFILE.stage("morphology"):
+                h_prof, v_prof = line_profiles_tiled(bw, horiz_kernel, vert_kernel, tile_rows)
+        else:
+            with PROFILE.stage("morphology"):
+                horizontal = cv2.morphologyEx(bw, cv2.MORPH_OPEN, horiz_kernel, iterations=2)
+                vertical = cv2.morphologyEx(bw, cv2.MORPH_OPEN, vert_kernel, iterations=2)
 
-    if debug_dir:
-        cv2.imwrite(os.path.join(debug_dir, "02_horizontal.png"), horizontal)
-        cv2.imwrite(os.path.join(debug_dir, "03_vertical.png"), vertical)
+            if debug_dir:
+                cv2.imwrite(os.path.join(debug_dir, "02_horizontal.png"), horizontal)
+                cv2.imwrite(os.path.join(debug_dir, "03_vertical.png"), vertical)
+
+            h_prof = cv2.reduce(horizontal, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+            v_prof = cv2.reduce(vertical, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel()
+            del horizontal, vertical  # masky čar už nejsou potřeba
+
+        # Najdeme souřadnice potenciálních čar
+        # Horizontální čáry ⇒ y souřadnice, vertikální ⇒ x souřadnice
+        with PROFILE.stage("line_grouping"):
+            row_lines, _, _ = find_lines(h_prof, tol=12, span=gray.shape[1])
+            col_lines, _, _ = find_lines(v_prof, tol=8, span=gray.shape[0])
 
-    # Najdeme souřadnice potenciálních čar
-    # Horizontální čáry ⇒ y souřadnice, vertikální ⇒ x souřadnice
-    ys = list(np.where(np.sum(horizontal, axis=1) > 0)[0])
-    xs = list(np.where(np.sum(vertical, axis=0) > 0)[0])
+    if len(row_lines) < 2 or len(col_lines) < 2:
+        # fallback: mřížka z rozložení textu (bez čar)
+        PROFILE.count("fallback_components")
+        with PROFILE.stage("fallback_components"):
+            gray, cells = fallback_cells_from_components(gray, bw, debug_dir, tile_rows)
+    else:
+        row_lines, col_lines = row_lines.tolist(), col_lines.tolist()
 
-    if not ys or not xs:
-        # fallback: zkusit najít kontury buněk bez čar
-        return fallback_cells_from_contours(gray, bw, debug_dir)
+        cells = cells_from_lines(row_lines, col_lines)
+        if template and not os.path.exists(template) and cells:
+            save_grid_template(template, gray, row_lines, col_lines)
+            print(f"Šablona mřížky uložena: {template}")
 
-    row_lines = sort_with_tolerance(ys, tol=12)
-    col_lines = sort_with_tolerance(xs, tol=8)
+        n_rows = max(c.r for c in cells) + 1 if cells else 0
+        n_cols = max(c.c for c in cells) + 1 if cells else 0
+        print(f"Detekováno řádků: {n_rows}, sloupců: {n_cols}")
 
-    # Vytvoříme bounding boxy buněk mezi sousedními čarami
+    if thumb is not None:
+        with PROFILE.stage("color"):
+            cell_colors(cells, thumb, src_shape, to_src)
+    return gray, cells
+
+def cells_from_lines(row_lines, col_lines) -> List[Cell]:
+    """Vytvoříme bounding boxy buněk mezi sousedními čarami."""
     cells = []
     for ri in range(len(row_lines) - 1):
-        y1, y2 = row_lines[ri], row_lines[ri+1]
+        y1, y2 = int(row_lines[ri]), int(row_lines[ri+1])
         if y2 - y1 < 10:
             continue  # příliš tenké
         for ci in range(len(col_lines) - 1):
-            x1, x2 = col_lines[ci], col_lines[ci+1]
+            x1, x2 = int(col_lines[ci]), int(col_lines[ci+1])
             if x2 - x1 < 10:
                 continue
             w = x2 - x1
             h = y2 - y1
             cells.append(Cell(r=ri, c=ci, bbox=(x1, y1, w, h)))
+    return cells
 
-    n_rows = max(c.r for c in cells) + 1 if cells else 0
-    n_cols = max(c.c for c in cells) + 1 if cells else 0
-    print(f"Detekováno řádků: {n_rows}, sloupců: {n_cols}")
+# ===== Šablony mřížky =====
+# Rozpisy chodí každý měsíc ze stejné tabulky => jednou detekované čáry se uloží
+# i s náhledem stránky (kotva pro registraci) a další skeny se na náhled jen
+# zarovnají (ECC, afinní) místo plné detekce.
 
-    return gray, cells
+TEMPLATE_THUMB = 600     # max. rozměr náhledu pro registraci
+TEMPLATE_MIN_CC = 0.75   # min. korelace ECC, jinak plná detekce
+
+def _thumbnail(gray: np.ndarray, max_dim: int) -> Tuple[np.ndarray, float]:
+    f = min(1.0, max_dim / max(gray.shape[:2]))
+    if f >= 1.0:
+        return gray.copy(), 1.0
+    return cv2.resize(gray, None, fx=f, fy=f, interpolation=cv2.INTER_AREA), f
+
+def save_grid_template(path: str, gray: np.ndarray, row_lines, col_lines):
+    thumb, f = _thumbnail(gray, TEMPLATE_THUMB)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fh:  # přes handle, ať np.savez nepřidává .npz
+        np.savez_compressed(fh, row_lines=np.asarray(row_lines, dtype=np.int32),
+                            col_lines=np.asarray(col_lines, dtype=np.int32),
+                            shape=np.asarray(gray.shape[:2], dtype=np.int32),
+                            thumb=thumb, scale=np.float64(f))
+    os.replace(tmp, path)  # atomicky (batch může ukládat z víc procesů)
+
+def load_grid_template(path: str) -> dict:
+    d = np.load(path, allow_pickle=False)
+    return {"row_lines": d["row_lines"].tolist(), "col_lines": d["col_lines"].tolist(),
+            "shape": tuple(int(v) for v in d["shape"]), "thumb": d["thumb"], "scale": float(d["scale"])}
+
+def _coarse_shift(t_thumb: np.ndarray, thumb: np.ndarray) -> Tuple[float, float]:
+    """
+    Hrubý posun náhledu skenu vůči náhledu šablony: křížová korelace (přes FFT) rozmazaného
+    inkoustu. ECC z identity konverguje jen na pár px posunu => tohle je jeho počáteční odhad.
+    Rozmazání smaže periodickou mřížku buněk (falešná maxima o celou buňku vedle) a zůstane
+    poloha bloku tabulky; fázová korelace by ho normalizací spektra zase zrušila.
+    """
+    h, w = t_thumb.shape[:2]
+    sigma = max(h, w) / 150.0
+    a = cv2.GaussianBlur(255.0 - t_thumb.astype(np.float32), (0, 0), sigma)
+    b = cv2.GaussianBlur(255.0 - thumb.astype(np.float32), (0, 0), sigma)
+    shape = (2 * h, 2 * w)  # nulové doplnění => bez cyklického přetečení
+    corr = np.fft.irfft2(np.conj(np.fft.rfft2(a - a.mean(), shape)) * np.fft.rfft2(b - b.mean(), shape), shape)
+    iy, ix = np.unravel_index(int(np.argmax(corr)), corr.shape)
+    return float(ix if ix < w else ix - 2 * w), float(iy if iy < h else iy - 2 * h)
+
+def register_to_template(gray: np.ndarray, tpl: dict, min_cc: float = TEMPLATE_MIN_CC,
+                         with_matrix: bool = False):
+    """
+    Zarovná sken na šablonu (hrubý posun křížovou korelací, pak ECC na náhledech) a vrátí
+    ho v plném rozlišení v souřadnicích šablony; None když registrace selže.
+    with_matrix=True: vrací (obrázek, 2x3 matice ze souřadnic šablony do skenu).
+    """
+    t_thumb = tpl["thumb"]
+    th, tw = t_thumb.shape[:2]
+    H, W = gray.shape[:2]
+    # nový sken do stejné velikosti náhledu (jiné DPI se tím vyrovná)
+    sx, sy = tw / W, th / H
+    thumb = cv2.resize(gray, (tw, th), interpolation=cv2.INTER_AREA)
 
-def fallback_cells_from_contours(gray: np.ndarray, bw: np.ndarray, debug_dir: Optional[str]):
-    """Fallback varianta: detekce mřížky jen z kontur (když chybí jasné čáry)."""
-    contours, _ = cv2.findContours(bw, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    rects = []
-    for cnt in contours:
-        x, y, w, h = cv2.boundingRect(cnt)
-        if w * h < 200:  # malý šum pryč
+    coarse = np.eye(2, 3, dtype=np.float32)
+    coarse[0, 2], coarse[1, 2] = _coarse_shift(t_thumb, thumb)
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 60, 1e-5)
+    cc, warp = -1.0, None
+    # start z hrubého posunu; identita jen jako záloha, když ten selže
+    for init in (coarse, np.eye(2, 3, dtype=np.float32)):
+        try:
+            cc, warp = cv2.findTransformECC(t_thumb.astype(np.float32), thumb.astype(np.float32),
+                                            init, cv2.MOTION_AFFINE, criteria, None, 5)
+        except cv2.error:
             continue
-        rects.append((x, y, w, h))
-    # Seřadit do gridu podle y,x
-    rects.sort(key=lambda t: (t[1], t[0]))
-    if not rects:
-        raise RuntimeError("Nepodařilo se detekovat tabulku ani kontury.")
-    # Heuristicky vytvoříme řádky
-    rows = []
-    current = [rects[0]]
-    for r in rects[1:]:
-        if abs(r[1] - current[-1][1]) < 20:  # podobná výška => stejný řádek
-            current.append(r)
-        else:
-            rows.append(sorted(current, key=lambda t: t[0]))
-            current = [r]
-    rows.append(sorted(current, key=lambda t: t[0]))
+        if cc >= min_cc:
+            break
+    if warp is None:
+        return None
+    if cc < min_cc:
+        print(f"Šablona: ECC korelace {cc:.2f} < {min_cc}")
+        return None
 
-    cells = []
-    for ri, row in enumerate(rows):
-        for ci, (x, y, w, h) in enumerate(row):
-            cells.append(Cell(r=ri, c=ci, bbox=(x, y, w, h)))
+    # warp: náhled šablony -> náhled skenu; převod na plné rozlišení obou
+    st = tpl["scale"]
+    full = np.array([
+        [warp[0, 0] * st / sx, warp[0, 1] * st / sx, warp[0, 2] / sx],
+        [warp[1, 0] * st / sy, warp[1, 1] * st / sy, warp[1, 2] / sy],
+    ], dtype=np.float32)
+    Ht, Wt = tpl["shape"]
+    aligned = cv2.warpAffine(gray, full, (Wt, Ht), flags=cv2.INTER_CUBIC | cv2.WARP_INVERSE_MAP,
+                             borderMode=cv2.BORDER_REPLICATE)
+    return (aligned, full) if with_matrix else aligned
+# ===== /Šablony mřížky =====
+
+def _cluster_intervals(lo: np.ndarray, hi: np.ndarray, gap: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vektorové 1-D shlukování intervalů [lo, hi): seřadí podle lo a nový shluk začne tam,
+    kde lo přesáhne dosavadní maximum hi o víc než `gap`. Vrací (začátky, konce) shluků.
+    """
+    order = np.argsort(lo, kind="stable")
+    lo, hi = lo[order], hi[order]
+    reach = np.maximum.accumulate(hi)
+    new = np.concatenate(([True], lo[1:] > reach[:-1] + gap))
+    label = np.cumsum(new) - 1
+    n = int(label[-1]) + 1
+    starts = np.full(n, np.inf)
+    ends = np.full(n, -np.inf)
+    np.minimum.at(starts, label, lo)
+    np.maximum.at(ends, label, hi)
+    return starts, ends
+
+def _cluster_bounds(starts: np.ndarray, ends: np.ndarray, limit: int) -> List[int]:
+    """Hranice buněk mezi shluky (středy mezer); krajní hranice o půl typické mezery ven."""
+    mids = (ends[:-1] + starts[1:]) / 2
+    half = float(np.median(starts[1:] - ends[:-1])) / 2 if len(mids) else 4.0
+    bounds = np.concatenate(([starts[0] - half], mids, [ends[-1] + half]))
+    return np.clip(np.round(bounds), 0, limit - 1).astype(int).tolist()
+
+def _banded_component_stats(img: np.ndarray, rows: int, overlap: int, prep=None) -> np.ndarray:
+    """
+    Statistiky komponent (řádky stats z connectedComponentsWithStats bez pozadí, TOP
+    v souřadnicích stránky) po vodorovných pásech výšky `rows` s překryvem `overlap`:
+    komponenta patří pásu, ve kterém leží její horní řádek => každá se započítá jednou
+    a je přesná, pokud je nižší než `overlap`. Mapa labelů existuje jen pro jeden pás.
+    prep: volitelná transformace pásu před rozkladem (musí zachovat rozměr).
+    rows <= 0 => celý obrázek najednou.
+    """
+    H = img.shape[0]
+    step = rows if 0 < rows < H else H
+    out = []
+    for a in range(0, H, step):
+        b = min(H, a + step)
+        a0, b0 = (a, b) if step == H else (max(0, a - overlap), min(H, b + overlap))
+        band = img[a0:b0] if prep is None else prep(img[a0:b0])
+        _, _, st, _ = cv2.connectedComponentsWithStats(band, connectivity=8)
+        st = st[1:].copy()
+        st[:, cv2.CC_STAT_TOP] += a0
+        out.append(st[(st[:, cv2.CC_STAT_TOP] >= a) & (st[:, cv2.CC_STAT_TOP] < b)])
+    return np.concatenate(out)
+
+def _glyph_components(stats: np.ndarray, H: int, hc: Optional[float] = None) -> np.ndarray:
+    """Které komponenty jsou znaky: dost velké, ne přes 1/20 stránky; s hc i bez zbytků čar a velkých bloků."""
+    w, h, area = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT], stats[:, cv2.CC_STAT_AREA]
+    glyph = (area >= BLANK_MIN_BLOB) & (h < H / 20)
+    if hc is not None:
+        glyph &= ~((w > 4 * hc) & (h < 0.5 * hc)) & (h <= 3 * hc)
+    return glyph
+
+def fallback_cells_from_components(gray: np.ndarray, bw: np.ndarray, debug_dir: Optional[str],
+                                   tile_rows: int = 0):
+    """
+    Fallback detekce mřížky bez čar (typicky focené rozpisy): text se přes
+    connectedComponentsWithStats rozloží na bloby (písmena spojená dilatací do slov),
+    středy / rozsahy blobů se vektorově shluknou do řádků a sloupců a hranice buněk
+    leží uprostřed mezer mezi shluky. bw = binárka s textem = 255.
+    tile_rows > 0: komponenty po pásech (viz _banded_component_stats) => žádná
+    celostránková mapa labelů; výsledek je stejný jako najednou.
+    """
+    H, W = bw.shape[:2]
+    # 1) komponenty bez dilatace => typická výška znaku, zbytky čar a šum pryč
+    overlap = H // 20 + 1  # vyšší komponenta stejně není znak
+    stats = _banded_component_stats(bw, tile_rows, overlap)
+    glyph = _glyph_components(stats, H)
+    if not glyph.any():
+        raise RuntimeError("Nepodařilo se detekovat tabulku ani text.")
+    hc = float(np.median(stats[glyph, cv2.CC_STAT_HEIGHT]))
+
+    # 2) dilatace spojí písmena (i diakritiku) do slov, ne přes hranice buněk
+    kx, ky = max(3, int(hc * 0.6)), max(3, int(hc * 0.5))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kx, ky))
+
+    def words(band):
+        _, labels, st, _ = cv2.connectedComponentsWithStats(band, connectivity=8)
+        keep = _glyph_components(st, H, hc)
+        keep[0] = False
+        return cv2.dilate(keep[labels].astype(np.uint8) * 255, kernel)
+
+    # znak má nejvýš 3 hc, slovo po dilataci 3 hc + ky => s takovým překryvem je každé celé v pásu, kam patří
+    st = _banded_component_stats(bw, tile_rows, max(overlap, int(3 * hc) + ky + 2), prep=words)
+    if not len(st):
+        raise RuntimeError("Nepodařilo se detekovat tabulku ani text.")
+    # dilatace zvětšila bloby o polovinu jádra na každou stranu
+    x1 = st[:, cv2.CC_STAT_LEFT] + kx // 2
+    y1 = st[:, cv2.CC_STAT_TOP] + ky // 2
+    x2 = st[:, cv2.CC_STAT_LEFT] + st[:, cv2.CC_STAT_WIDTH] - kx // 2
+    y2 = st[:, cv2.CC_STAT_TOP] + st[:, cv2.CC_STAT_HEIGHT] - ky // 2
+
+    # 3) řádky / sloupce = shluky překrývajících se rozsahů
+    r_start, r_end = _cluster_intervals(y1.astype(float), y2.astype(float), gap=0.2 * hc)
+    c_start, c_end = _cluster_intervals(x1.astype(float), x2.astype(float), gap=0.2 * hc)
+    if len(r_start) < 2 or len(c_start) < 2:
+        raise RuntimeError("Nepodařilo se detekovat tabulku ani text.")
+    row_lines = _cluster_bounds(r_start, r_end, H)
+    col_lines = _cluster_bounds(c_start, c_end, W)
+
+    if debug_dir:
+        os.makedirs(debug_dir, exist_ok=True)
+        vis = cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR)
+        for y in row_lines:
+            cv2.line(vis, (0, y), (W - 1, y), (0, 0, 255), 1)
+        for x in col_lines:
+            cv2.line(vis, (x, 0), (x, H - 1), (0, 0, 255), 1)
+        cv2.imwrite(os.path.join(debug_dir, "04_fallback_grid.png"), vis)
+
+    cells = cells_from_lines(row_lines, col_lines)
+    print(f"Fallback (komponenty): řádků {len(row_lines) - 1}, sloupců {len(col_lines) - 1}")
     return gray, cells
 
 # ===== zůstaň u svých helperů (ALLOWED_BODY, normalize_name, normalize_body_token, ocr_cell) =====
 
+WL_DIGITS = "0123456789"
+WL_NAME   = "ABCDEFGHIJKLMNOPQRSTUVWXYZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽabcdefghijklmnopqrstuvwxyzáčďéěíňóřšťúůýž-.'’"
+WL_BODY   = "RDNOVSCPO/"
+NAME_CFG  = "-c preserve_interword_spaces=1 -c load_system_dawg=0 -c load_freq_dawg=0"
+
+STRIP_MIN_CONF = 50  # pod touto jistotou jde buňka ze stripu radši na OCR po buňkách
+BLANK_INK      = 0.01 # max. podíl inkoustu (úlomky znaků, ne tečky šumu) ve vnitřku buňky, aby byla "prázdná"
+BLANK_MIN_BLOB = 12   # nejmenší komponenta (px při BLANK_REF_CELL), která se už počítá jako znak
+BLANK_REF_CELL = 30   # kratší strana buňky (px), pro kterou platí BLANK_MIN_BLOB; větší buňky => úměrně víc
+
+def upscale(img, target_min=80):
+    h, w = img.shape[:2]
+    k = max(1.0, target_min / max(h, w))
+    return cv2.resize(img, None, fx=k, fy=k, interpolation=cv2.INTER_CUBIC) if k > 1.01 else img
+
+def header_day(raw: str) -> str:
+    """Z OCR výstupu hlavičky vytáhne číslo dne 1..31 (jinak '')."""
+    import re
+    m = re.search(r"\d{1,2}", raw)
+    return m.group(0) if (m and 1 <= int(m.group(0)) <= 31) else ""
+
+RETRY_CONF = 60  # buňky s jistotou prvního průchodu pod touto hranicí jdou na re-OCR
+
+# první (levný) průchod po zónách: (cílová min. velikost pro upscale, PSM)
+FIRST_PASS = {"header": (60, 7), "name": (120, 7), "body": (50, 6)}
+
+def _ocr_cell_task(task):
+    """
+    OCR jedné (už předzpracované) buňky podle zóny – levný první průchod.
+    Top-level funkce, aby šla poslat do procesového poolu.
+    task = (kind, img, lang); vrací (text, sekundy, jistota, podezřelé).
+    """
+    t0 = time.perf_counter()
+    kind, img, lang = task
+    text, conf, garbled = _zone_ocr(kind, img, lang, FIRST_PASS[kind][1])
+    return text, time.perf_counter() - t0, conf, garbled
+
+def _clean_name_roi(roi_gray):
+    """Jména: lokální prahování + odmazání vertikálních čar (zbytky mřížky)."""
+    roi_loc = cv2.adaptiveThreshold(
+        roi_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 29, 5
+    )
+    k = max(3, roi_loc.shape[0] // 8)
+    vert = cv2.morphologyEx(roi_loc, cv2.MORPH_OPEN,
+                            cv2.getStructuringElement(cv2.MORPH_RECT, (1, k)), iterations=1)
+    roi_clean = cv2.subtract(roi_loc, vert)
+    if np.mean(roi_clean) < 127:
+        roi_clean = 255 - roi_clean
+    return roi_clean
+
+def _zone_ocr(kind, img, lang, psm):
+    """OCR výřezu se whitelistem zóny; vrací (text, jistota, podezřelé = něco přečteno, ale nevalidní)."""
+    if kind == "header":
+        raw, conf = cached_ocr_cell(img, lang=lang, whitelist=WL_DIGITS, psm=psm, with_conf=True)
+        text = header_day(raw)
+        return text, conf, bool(raw) and not text
+    if kind == "name":
+        raw, conf = cached_ocr_cell(img, lang=lang, whitelist=WL_NAME, psm=psm, extra_cfg=NAME_CFG, with_conf=True)
+        text = normalize_name(raw)
+        return text, conf, bool(raw) and len(text) <= 1
+    raw, conf = cached_ocr_cell(img, lang=lang, whitelist=WL_BODY, psm=psm, with_conf=True)
+    text = normalize_body_token(raw)
+    return text, conf, bool(raw) and not text
+
+PREP_PAD    = 2  # replikovaný okraj dlaždice (okolí INTER_CUBIC) => sousední dlaždice se neovlivňují
+
+def preprocess_cells_batched(kind: str, rois: list) -> list:
+    """
+    Předzpracování prvního průchodu pro celou dávku buněk jedné zóny najednou.
+    Buňky se stejnou delší stranou (=> stejné zvětšení jako upscale po buňkách) se složí
+    pod sebe do jedné mozaiky (dlaždice s replikovaným okrajem PREP_PAD), INTER_CUBIC
+    upscale proběhne jednou na mozaiku a výsledky jsou jen řezy (views) do ní; od upscale
+    po buňkách se liší jen posunem hran o < 0.5 px (zaokrouhlení polohy dlaždice).
+    rois = binárky (header/body) nebo šedé výřezy (name).
+    Jména se čistí po buňkách (_clean_name_roi): je jich jen jedno na řádek a okraj pro
+    přesné adaptivní prahování v mozaice by stál víc, než ušetří. Vrací obrázky v pořadí `rois`.
+    """
+    target = FIRST_PASS[kind][0]
+    if kind == "name":
+        rois = [_clean_name_roi(r) for r in rois]
+    out = [None] * len(rois)
+    groups = {}
+    for i, r in enumerate(rois):
+        h, w = r.shape[:2]
+        groups.setdefault(max(h, w), []).append(i)
+    p = PREP_PAD
+    for idx in groups.values():
+        H = max(rois[i].shape[0] for i in idx)
+        W = max(rois[i].shape[1] for i in idx)
+        k = max(1.0, target / max(H, W))
+        if k <= 1.01:
+            for i in idx:
+                out[i] = rois[i]  # bez zvětšení => beze změny (jako upscale)
+            continue
+        Ht, Wt = H + 2 * p, W + 2 * p
+        mosaic = np.vstack([cv2.copyMakeBorder(rois[i], p, p + H - rois[i].shape[0], p,
+                                               p + W - rois[i].shape[1], cv2.BORDER_REPLICATE)
+                            for i in idx])
+        Hk, Wk = int(round(Ht * k)), int(round(Wt * k))
+        mosaic = cv2.resize(mosaic, (Wk, Hk * len(idx)), interpolation=cv2.INTER_CUBIC)
+        ky, kx = Hk / Ht, Wk / Wt
+        x1 = int(round(p * kx))
+        for j, i in enumerate(idx):
+            h, w = rois[i].shape[:2]
+            y0 = j * Hk + int(round(p * ky))
+            out[i] = mosaic[y0: y0 + max(1, int(round(h * ky))), x1: x1 + max(1, int(round(w * kx)))]
+    return out
+
+# Těžší varianty pro re-OCR (zkouší se po pořadí, dokud některá nedá validní text
+# s jistotou >= retry_conf): větší zvětšení, jiné PSM, měkký práh místo binárky.
+RETRY_VARIANTS = {
+    "header": [("bin_x2", "bin", 120, 8), ("soft", "soft", 120, 7)],
+    "name":   [("soft", "soft", 120, 6), ("otsu", "otsu", 160, 7)],
+    "body":   [("bin_x2", "bin", 100, 8), ("soft", "soft", 100, 8), ("otsu", "otsu", 120, 10)],
+}
+
+def _retry_roi(kind, prep, roi_gray, roi_bin, target):
+    if prep == "bin":
+        return upscale(_clean_name_roi(roi_gray) if kind == "name" else roi_bin, target_min=target)
+    soft = cv2.GaussianBlur(upscale(roi_gray, target), (3, 3), 0)
+    if prep == "soft":
+        return soft
+    return cv2.threshold(soft, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)[1]
+
+def _ocr_retry_task(task):
+    """
+    Re-OCR buňky s nízkou jistotou / nevalidním výsledkem přes RETRY_VARIANTS.
+    task = (kind, roi_gray, roi_bin, lang, text, conf, garbled, retry_conf).
+    Vrací (text, obrázek_pro_debug_nebo_None, sekundy, jistota, použitá_varianta_nebo_None);
+    původní výsledek zůstává, pokud žádná varianta není lepší.
+    """
+    t0 = time.perf_counter()
+    kind, roi_gray, roi_bin, lang, text, conf, garbled, retry_conf = task
+    best, best_ok = (text, None, conf, None), bool(text) and not garbled
+    for name, prep, target, psm in RETRY_VARIANTS[kind]:
+        img = _retry_roi(kind, prep, roi_gray, roi_bin, target)
+        t, c, bad = _zone_ocr(kind, img, lang, psm)
+        if not t or bad:
+            continue
+        if not best_ok or c > best[2]:
+            best, best_ok = (t, img, c, name), True
+        if c >= retry_conf:
+            break
+    return best[0], best[1], time.perf_counter() - t0, best[2], best[3]
+
+def _ocr_strip_task(task):
+    """
+    OCR celého řádku najednou (image_to_data) a rozřazení slov do sloupců.
+    task = (kind, strip, k, spans, lang); spans = [(x1, x2), ...] buněk v souřadnicích stripu.
+    Vrací (texty, sekundy); text pro každý span, nebo None = nejednoznačné -> OCR po buňkách.
+    """
+    t0 = time.perf_counter()
+    kind, strip, k, spans, lang = task
+    img = cv2.resize(strip, None, fx=k, fy=k, interpolation=cv2.INTER_CUBIC) if k > 1.01 else strip
+    wl = WL_DIGITS if kind == "header" else WL_BODY
+    words = cached_image_to_data(img, lang=lang, psm=7, whitelist=wl)
+
+    starts = [a for a, _ in spans]
+    hits = [[] for _ in spans]
+    ambiguous = set()
+    for wd in words:
+        x1 = wd["left"] / k
+        x2 = (wd["left"] + wd["width"]) / k
+        i = bisect.bisect_right(starts, (x1 + x2) / 2) - 1
+        inside = i >= 0 and (x1 + x2) / 2 <= spans[i][1]
+        if not inside or x1 < spans[i][0] - 2 or x2 > spans[i][1] + 2:
+            # box přetéká (víc než 2 px) do sousední buňky, nebo leží přes mezeru mezi dvěma
+            # buňkami => nevíme, komu patří; zbytek čáry v mezeře do žádné buňky nezasahuje
+            ambiguous.update(j for j, (a, b) in enumerate(spans) if a < x2 - 2 and b > x1 + 2)
+            if not inside:
+                continue
+        hits[i].append(wd)
+
+    out = []
+    for i, hs in enumerate(hits):
+        if i in ambiguous or len(hs) > 1:
+            out.append(None)
+        elif not hs:
+            out.append("")
+        else:
+            text = header_day(hs[0]["text"]) if kind == "header" else normalize_body_token(hs[0]["text"])
+            out.append(text if (text and hs[0]["conf"] >= STRIP_MIN_CONF) else None)
+    return out, time.perf_counter() - t0
+
+def _build_strip(row: list):
+    """
+    Složí řádek buněk do jednoho stripu: vnitřky buněk z binárky, zbytek (mřížka) bílý,
+    aby Tesseract nečetl svislé čáry. row = [(cell, roi_bin), ...]. Vrací (strip, spans, k).
+    """
+    row_cells = [c for c, _ in row]
+    x0 = min(c.bbox[0] for c in row_cells)
+    x1 = max(c.bbox[0] + c.bbox[2] for c in row_cells)
+    y0 = min(c.bbox[1] for c in row_cells) + 2
+    y1 = max(c.bbox[1] + c.bbox[3] for c in row_cells) - 2
+    strip = np.full((max(1, y1 - y0), max(1, x1 - x0)), 255, dtype=np.uint8)
+    spans = []
+    for c, roi in row:
+        x, y, w, h = c.bbox
+        ty = max(0, y+2) - y0
+        tx = max(0, x+2) - x0
+        strip[ty: ty + roi.shape[0], tx: tx + roi.shape[1]] = roi[: strip.shape[0] - ty]
+        spans.append((tx, tx + roi.shape[1]))
+    # stejné zvětšení jako u OCR po buňkách (podle typické velikosti buňky)
+    sizes = sorted(max(c.bbox[2], c.bbox[3]) - 4 for c in row_cells)
+    k = max(1.0, 50 / max(1, sizes[len(sizes) // 2]))
+    return strip, spans, k
+
+def blank_cell_mask(bw_for_ocr: np.ndarray, cells: List[Cell],
+                    ink_thr: float = BLANK_INK, min_blob: int = BLANK_MIN_BLOB,
+                    margin: float = 0.12) -> np.ndarray:
+    """
+    Rychlý prefiltr prázdných buněk nad binárkou (text = 0), počítaný po výřezech buněk
+    (žádné celostránkové mapy komponent ani integrální obraz => paměť O(buňka)).
+    Buňka je prázdná, když v ní není žádná komponenta >= min_blob px celá uvnitř buňky
+    se středem ve vnitřku (bez okraje `margin` kvůli zbytkům mřížky) a úlomky znaků
+    (komponenty >= min_blob / 4) pokrývají vnitřek méně než ink_thr.
+    Prahy platí pro buňku s kratší stranou BLANK_REF_CELL; u větších buněk (vyšší DPI)
+    roste min_blob s plochou a tečky šumu se před počítáním smažou otevřením úměrným
+    tloušťce tahu. Vrací bool pole v pořadí `cells`.
+    """
+    out = np.zeros(len(cells), dtype=bool)
+    H, W = bw_for_ocr.shape[:2]
+    for i, cell in enumerate(cells):
+        x, y, w, h = cell.bbox
+        x0, y0 = max(0, x), max(0, y)
+        roi = bw_for_ocr[y0:min(H, y + h), x0:min(W, x + w)]
+        if roi.size == 0:
+            out[i] = True
+            continue
+        f = max(1.0, min(w, h) / BLANK_REF_CELL)
+        ink = (roi == 0).astype(np.uint8)
+        k = int(round(f))
+        if k > 1:
+            ink = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (k, k)))
+        n, labels, stats, centroids = cv2.connectedComponentsWithStats(ink, connectivity=8)
+        if n == 1:
+            out[i] = True
+            continue
+        rh, rw = ink.shape
+        mx, my = int(w * margin) + 2, int(h * margin) + 2
+        st, cx, cy = stats[1:], centroids[1:, 0], centroids[1:, 1]
+        area = st[:, cv2.CC_STAT_AREA]
+        # komponenta dotýkající se okraje výřezu = čára mřížky / přesah ze sousední buňky
+        inside = ((st[:, cv2.CC_STAT_LEFT] > 0) & (st[:, cv2.CC_STAT_TOP] > 0) &
+                  (st[:, cv2.CC_STAT_LEFT] + st[:, cv2.CC_STAT_WIDTH] < rw) &
+                  (st[:, cv2.CC_STAT_TOP] + st[:, cv2.CC_STAT_HEIGHT] < rh))
+        centred = (cx >= mx) & (cx < rw - mx) & (cy >= my) & (cy < rh - my)
+        min_px = min_blob * f * f
+        if (inside & centred & (area >= min_px)).any():
+            continue
+        frag = np.concatenate(([False], inside & (area >= min_px / 4)))
+        interior = frag[labels[my:rh - my, mx:rw - mx]]
+        out[i] = interior.size == 0 or interior.mean() < ink_thr
+    return out
+
+def _map_tasks(fn, tasks, ex, workers):
+    """Spustí úlohy sériově nebo v poolu; map() drží pořadí => deterministický výsledek."""
+    if ex is None or len(tasks) < 2:
+        return [fn(t) for t in tasks]
+    chunksize = max(1, len(tasks) // (workers * 4))
+    return list(ex.map(fn, tasks, chunksize=chunksize))
+
 def run_ocr_on_cells(gray: np.ndarray, cells: List[Cell], lang="ces",
                      debug_dir: Optional[str]=None,
                      header_row_idx: int = 0,
-                     name_col_idx: int = 0) -> List[Cell]:
-    # Globální binárka pro hlavičku a tělo
-    bw_for_ocr = cv2.adaptiveThreshold(
-        gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2
-    )
+                     name_col_idx: int = 0,
+                     workers: int = 1,
+                     strip: bool = False,
+                     prefilter: bool = True,
+                     blank_ink: float = BLANK_INK,
+                     blank_min_blob: int = BLANK_MIN_BLOB,
+                     classifier: Optional["ShiftCodeClassifier"] = None,
+                     clf_min_conf: float = 0.8,
+                     denoise_roi_cells: bool = False,
+                     retry_conf: float = RETRY_CONF,
+                     tile_rows: int = 0,
+                     names: Optional["NameIndex"] = None,
+                     palette: Optional["ColorPalette"] = None,
+                     color_confirm: bool = False) -> List[Cell]:
+    """
+    OCR všech buněk. Při workers > 1 se buňky posílají do omezeného procesového
+    poolu (každé volání Tesseractu je samostatný proces, takže se to dobře škáluje
+    přes jádra). Pořadí výsledků je vždy stejné jako pořadí `cells`.
 
-    WL_DIGITS = "0123456789"
-    WL_NAME   = "ABCDEFGHIJKLMNOPQRSTUVWXYZÁČĎÉĚÍŇÓŘŠŤÚŮÝŽabcdefghijklmnopqrstuvwxyzáčďéěíňóřšťúůýž-.'’"
-    WL_BODY   = "RDNOVSCPO/"
+    strip=True: hlavička a řádky těla se čtou po celých řádcích (jedno OCR na řádek,
+    slova se rozřadí do sloupců podle hranic buněk); po buňkách jde jen to, co
+    zůstalo nejednoznačné. Jména jdou vždy po buňkách.
 
-    def upscale(img, target_min=80):
-        h, w = img.shape[:2]
-        k = max(1.0, target_min / max(h, w))
-        return cv2.resize(img, None, fx=k, fy=k, interpolation=cv2.INTER_CUBIC) if k > 1.01 else img
+    prefilter=True: prázdné buňky (viz blank_cell_mask) se na Tesseract vůbec neposílají.
 
+    classifier: buňky těla nejdřív zkusí ShiftCodeClassifier; Tesseract dostanou jen ty,
+    kde je jistota < clf_min_conf.
+
+    denoise_roi_cells=True: stránka nebyla odšuměná (denoise="roi") => NL-means se pustí
+    jen na výřezy buněk, které opravdu jdou na OCR (po prefiltru).
+
+    retry_conf: OCR po buňkách jde nejdřív levnou variantou; buňky s jistotou < retry_conf,
+    nevalidním výsledkem nebo prázdným textem přes inkoust (po prefiltru) se pak znovu
+    (paralelně) čtou těžšími variantami z RETRY_VARIANTS. 0 = bez re-OCR.
+
+    tile_rows > 0: globální binárka se počítá po pásech (viz tiled_rows).
+
+    names: NameIndex známých jmen => jméno z prvního průchodu se přichytí k nejbližšímu
+    jménu ze seznamu a re-OCR jde jen na jména bez dost blízkého kandidáta.
+
+    palette: ColorPalette => buňky těla s jednoznačnou barvou (Cell.color z extract_grid_cells
+    s color=True) dostanou zkratku rovnou z barvy a na OCR nejdou. color_confirm=True: jdou
+    na OCR i tak; barva doplní buňky, kde OCR nic nepřečetlo, přečtený text má přednost.
+    """
+    # Globální binárka pro hlavičku a tělo
+    with PROFILE.stage("ocr_binarize"):
+        bw_for_ocr = tiled_rows(lambda g: cv2.adaptiveThreshold(
+            g, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2
+        ), gray, 16, tile_rows)
+
+    prepared = []  # (cell, kind, roi_gray, roi_bin)
     for cell in cells:
         x, y, w, h = cell.bbox
         roi_gray = gray[max(0, y+2): y+h-2, max(0, x+2): x+w-2]
@@ -226,135 +1477,1311 @@ def run_ocr_on_cells(gray: np.ndarray, cells: List[Cell], lang="ces",
             continue
 
         roi_bin = bw_for_ocr[max(0, y+2): y+h-2, max(0, x+2): x+w-2]
+        if cell.r == header_row_idx:
+            kind = "header"
+        elif cell.c == name_col_idx:
+            kind = "name"
+        else:
+            kind = "body"
+        prepared.append((cell, kind, roi_gray, roi_bin))
 
-        # proměnné pro bezpečné debug ukládání
-        roi = None
-        roi_name = None
-        to_save = None
+    color_hits, colored = {}, []  # id(cell) -> zkratka z barvy buňky
+    if palette is not None:
+        with PROFILE.stage("color_match"):
+            for cell, kind, _, _ in prepared:
+                code = palette.match(cell.color) if kind == "body" else None
+                if code:
+                    color_hits[id(cell)] = code
+        PROFILE.count("color_hits", len(color_hits))
+        n_body = sum(1 for p in prepared if p[1] == "body")
+        print(f"Barvy: {len(color_hits)}/{n_body} buněk těla podle barvy"
+              f"{' (OCR je potvrdí)' if color_confirm else ' bez Tesseractu'}")
+        if not color_confirm:
+            colored = [p for p in prepared if id(p[0]) in color_hits]
+            prepared = [p for p in prepared if id(p[0]) not in color_hits]
+    for cell, _, _, roi_bin in colored:
+        cell.text = color_hits[id(cell)]
+        if debug_dir:
+            _save_debug_cell(debug_dir, cell, roi_bin)
 
-        if cell.r == header_row_idx:
-            # HLAVIČKA: jen čísla 1..31
-            roi = upscale(roi_bin, target_min=60)
-            raw = ocr_cell(roi, lang=lang, whitelist=WL_DIGITS, psm=7)
-            import re
-            m = re.search(r"\d{1,2}", raw)
-            cell.text = m.group(0) if (m and 1 <= int(m.group(0)) <= 31) else ""
-            to_save = roi
+    blank = []
+    if prefilter and prepared:
+        with PROFILE.stage("prefilter"):
+            mask = blank_cell_mask(bw_for_ocr, [p[0] for p in prepared], blank_ink, blank_min_blob)
+        PROFILE.count("prefilter_blank", int(mask.sum()))
+        blank = [p for p, m in zip(prepared, mask) if m]
+        prepared = [p for p, m in zip(prepared, mask) if not m]
+        total = len(blank) + len(prepared)
+        print(f"Prefiltr: přeskočeno {len(blank)}/{total} prázdných buněk "
+              f"({100.0 * len(blank) / max(1, total):.1f} %)")
+    for cell, _, _, roi_bin in blank:
+        cell.text = ""
+        if debug_dir:
+            _save_debug_cell(debug_dir, cell, roi_bin)
 
-        elif cell.c == name_col_idx:
-            # JMÉNA: lokální prahování + odmazání vertikálních čar + zvětšení + PSM 7
-            roi_loc = cv2.adaptiveThreshold(
-                roi_gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 29, 5
-            )
-            k = max(3, roi_loc.shape[0] // 8)
-            vert = cv2.morphologyEx(roi_loc, cv2.MORPH_OPEN,
-                                    cv2.getStructuringElement(cv2.MORPH_RECT, (1, k)), iterations=1)
-            roi_clean = cv2.subtract(roi_loc, vert)
-            if np.mean(roi_clean) < 127:
-                roi_clean = 255 - roi_clean
-            roi_name = upscale(roi_clean, target_min=120)
-
-            raw = ocr_cell(
-                roi_name, lang=lang, whitelist=WL_NAME, psm=7,
-                extra_cfg="-c preserve_interword_spaces=1 -c load_system_dawg=0 -c load_freq_dawg=0"
-            )
-            txt = normalize_name(raw)
-
-            # fallback když vyjde moc krátké
-            if len(txt) <= 1:
-                roi_soft = cv2.GaussianBlur(upscale(roi_gray, 120), (3,3), 0)
-                raw2 = ocr_cell(
-                    roi_soft, lang=lang, whitelist=WL_NAME, psm=6,
-                    extra_cfg="-c preserve_interword_spaces=1 -c load_system_dawg=0 -c load_freq_dawg=0"
-                )
-                txt2 = normalize_name(raw2)
-                cell.text = txt2 if len(txt2) > len(txt) else txt
-                to_save = roi_soft
-            else:
-                cell.text = txt
-                to_save = roi_name
+    if denoise_roi_cells:
+        with PROFILE.stage("denoise_roi"):
+            for i, (cell, kind, _, _) in enumerate(prepared):
+                x, y, w, h = cell.bbox
+                roi_gray, roi_bin = denoise_roi(gray, max(0, y+2), y+h-2, max(0, x+2), x+w-2)
+                prepared[i] = (cell, kind, roi_gray, roi_bin)
 
-        else:
-            # TĚLO: jen povolené zkratky
-            roi = upscale(roi_bin, target_min=50)
-            raw = ocr_cell(roi, lang=lang, whitelist=WL_BODY, psm=6)
-            cell.text = normalize_body_token(raw)
-            to_save = roi
+    resolved = {}  # id(cell) -> text vyřešený bez OCR po buňkách (klasifikátor / strip)
+    if classifier is not None:
+        body = [p for p in prepared if p[1] == "body"]
+        with PROFILE.stage("classifier"):
+            preds = classifier.predict([p[3] for p in body])
+        for (cell, _, _, _), (label, conf) in zip(body, preds):
+            if conf >= clf_min_conf and (label in ALLOWED_BODY or label == ""):
+                resolved[id(cell)] = label
+        PROFILE.count("classifier_fallback", len(body) - len(resolved))
+        print(f"Klasifikátor: {len(resolved)}/{len(body)} buněk těla bez Tesseractu")
+
+    ex = None
+    if workers > 1:
+        cache_args = (_CACHE.path, _CACHE.max_bytes / (1024 * 1024)) if _CACHE is not None else (None, 0)
+        from concurrent.futures import ProcessPoolExecutor  # ~20 ms importu => až když je potřeba
+        ex = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(get_engine().name,) + cache_args)
+    try:
+        if strip:
+            n_before = len(resolved)
+            rows = {}
+            for cell, kind, _, roi_bin in prepared:
+                if kind != "name" and id(cell) not in resolved:
+                    rows.setdefault((cell.r, kind), []).append((cell, roi_bin))
+            strip_tasks, strip_rows = [], []
+            for (r, kind), row in sorted(rows.items(), key=lambda kv: kv[0]):
+                if len(row) < 2:
+                    continue
+                row.sort(key=lambda p: p[0].bbox[0])
+                img, spans, k = _build_strip(row)
+                strip_tasks.append((kind, img, k, spans, lang))
+                strip_rows.append([c for c, _ in row])
+                if debug_dir:
+                    os.makedirs(debug_dir, exist_ok=True)
+                    cv2.imwrite(os.path.join(debug_dir, f"strip_r{r}.png"), img)
+            with PROFILE.stage("ocr_strip"):
+                strip_results = _map_tasks(_ocr_strip_task, strip_tasks, ex, workers)
+            for task, row_cells, (texts, secs) in zip(strip_tasks, strip_rows, strip_results):
+                PROFILE.add_ocr(f"strip_{task[0]}", secs)
+                PROFILE.count("strip_cell_fallback", sum(1 for t in texts if t is None))
+                for cell, text in zip(row_cells, texts):
+                    if text is not None:
+                        resolved[id(cell)] = text
+            print(f"Strip OCR: {len(strip_tasks)} řádků, {len(resolved) - n_before} buněk vyřešeno, "
+                  f"{sum(1 for p in prepared if p[1] != 'name') - len(resolved)} jde na OCR po buňkách")
 
+        todo = [p for p in prepared if id(p[0]) not in resolved]
+        imgs = [None] * len(todo)
+        with PROFILE.stage("ocr_prep"):
+            # předzpracování po dávkách (zóna + velikost), ne buňku po buňce
+            for kind in ("header", "name", "body"):
+                idx = [i for i, p in enumerate(todo) if p[1] == kind]
+                if idx:
+                    rois = [todo[i][2] if kind == "name" else todo[i][3] for i in idx]
+                    for i, img in zip(idx, preprocess_cells_batched(kind, rois)):
+                        imgs[i] = img
+        tasks = [(kind, img, lang) for (_, kind, _, _), img in zip(todo, imgs)]
+        with PROFILE.stage("ocr_cells"):
+            results = _map_tasks(_ocr_cell_task, tasks, ex, workers)
+
+        snapped = set()  # indexy jmen přichycených k seznamu => bez re-OCR
+        if names is not None:
+            with PROFILE.stage("names_match"):
+                for i, (task, (text, secs, conf, _)) in enumerate(zip(tasks, results)):
+                    if task[0] == "name" and text:
+                        hit, score = names.match(text)
+                        if hit:
+                            results[i] = (hit, secs, max(conf, 100.0 * score), False)
+                            snapped.add(i)
+
+        retry_idx = []
+        if retry_conf > 0:
+            for i, (task, (text, _, conf, garbled)) in enumerate(zip(tasks, results)):
+                if i in snapped:
+                    continue
+                # prázdný výsledek je podezřelý jen tam, kde víme, že v buňce je inkoust
+                if garbled or (text and conf < retry_conf) or (not text and (prefilter or task[0] == "name")):
+                    retry_idx.append(i)
+        if retry_idx:
+            retry_tasks = [(todo[i][1], todo[i][2], todo[i][3], lang) + (results[i][0], results[i][2],
+                                                                         results[i][3], retry_conf)
+                           for i in retry_idx]
+            with PROFILE.stage("ocr_retry"):
+                retry_results = _map_tasks(_ocr_retry_task, retry_tasks, ex, workers)
+            improved = 0
+            for i, (text, to_save, secs, conf, variant) in zip(retry_idx, retry_results):
+                PROFILE.add_ocr(f"{tasks[i][0]}_retry", secs)
+                if names is not None and tasks[i][0] == "name" and text:
+                    hit, _ = names.match(text)
+                    if hit:
+                        text = hit
+                        snapped.add(i)
+                if variant:
+                    improved += 1
+                    PROFILE.count(f"retry_{variant}")
+                    results[i] = (text, results[i][1], conf, False)
+                    imgs[i] = to_save
+            PROFILE.count("retry", len(retry_idx))
+            PROFILE.count("retry_improved", improved)
+            print(f"Re-OCR: {len(retry_idx)}/{len(tasks)} buněk s nízkou jistotou, {improved} zlepšeno")
+        if names is not None:
+            n_names = sum(1 for t in tasks if t[0] == "name")
+            PROFILE.count("names_snapped", len(snapped))
+            PROFILE.count("names_unmatched", n_names - len(snapped))
+            print(f"Jména: {len(snapped)}/{n_names} přichyceno ke známým jménům")
+    finally:
+        if ex is not None:
+            ex.shutdown()
+
+    for (cell, kind, _, _), img, (text, secs, _, _) in zip(todo, imgs, results):
+        cell.text = text
+        PROFILE.add_ocr(kind, secs)
         if debug_dir:
-            os.makedirs(debug_dir, exist_ok=True)
-            if to_save is None:
-                to_save = roi_bin  # krajní fallback
-            if len(to_save.shape) == 2:
-                cv2.imwrite(os.path.join(debug_dir, f"cell_r{cell.r}_c{cell.c}.png"), to_save)
-            else:
-                cv2.imwrite(os.path.join(debug_dir, f"cell_r{cell.r}_c{cell.c}.png"),
-                            cv2.cvtColor(to_save, cv2.COLOR_GRAY2BGR))
+            _save_debug_cell(debug_dir, cell, img)
+    for cell, _, _, roi_bin in prepared:
+        if id(cell) in resolved:
+            cell.text = resolved[id(cell)]
+            if debug_dir:
+                _save_debug_cell(debug_dir, cell, roi_bin)
+
+    if color_confirm and color_hits:
+        conflicts = 0
+        for cell, _, _, _ in blank + prepared:
+            code = color_hits.get(id(cell))
+            if code is None:
+                continue
+            if not cell.text:
+                cell.text = code
+            elif cell.text != code:
+                conflicts += 1  # přečtená zkratka má přednost před barvou
+        PROFILE.count("color_conflict", conflicts)
+        if conflicts:
+            print(f"Barvy: {conflicts} buněk, kde OCR nesouhlasí s barvou (ponechán text z OCR)")
+
+    if debug_dir:
+        # popisky k dumpnutým výřezům (ručně opravitelné) => trénink ShiftCodeClassifier
+        labels = {}
+        for cell, kind, _, _ in blank + colored + prepared:
+            labels[f"cell_r{cell.r}_c{cell.c}.png"] = {"kind": kind, "text": cell.text}
+        with open(os.path.join(debug_dir, "labels.json"), "w", encoding="utf-8") as f:
+            json.dump(labels, f, ensure_ascii=False, indent=1)
 
     return cells
 
+def _save_debug_cell(debug_dir: str, cell: Cell, to_save: np.ndarray):
+    os.makedirs(debug_dir, exist_ok=True)
+    if len(to_save.shape) == 2:
+        cv2.imwrite(os.path.join(debug_dir, f"cell_r{cell.r}_c{cell.c}.png"), to_save)
+    else:
+        cv2.imwrite(os.path.join(debug_dir, f"cell_r{cell.r}_c{cell.c}.png"),
+                    cv2.cvtColor(to_save, cv2.COLOR_GRAY2BGR))
+
+
+
+
+# ===== Klasifikátor zkratek (tělo) =====
+# Buňky těla obsahují jen ALLOWED_BODY => místo LSTM OCR stačí malý kNN nad
+# normalizovaným výřezem (zoning + HOG-like histogramy gradientů).
+
+CLF_SIZE = 24  # normalizovaný výřez CLF_SIZE x CLF_SIZE
+
+def _glyph_mask(img: np.ndarray) -> np.ndarray:
+    """Inkoust (text = 0 v binárce) bez drobného šumu a zbytků mřížky u okraje."""
+    ink = (img < 128).astype(np.uint8)
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    H, W = ink.shape
+    keep = np.zeros(n, dtype=bool)
+    for i in range(1, n):
+        x, y, w, h, area = stats[i]
+        if area < BLANK_MIN_BLOB:
+            continue
+        touches = x == 0 or y == 0 or x + w >= W or y + h >= H
+        if touches and ((w >= 0.8 * W and h <= 3) or (h >= 0.8 * H and w <= 3)):
+            continue  # zbytek čáry mřížky
+        keep[i] = True
+    return keep[labels]
+
+def glyph_features(img: np.ndarray) -> Optional[np.ndarray]:
+    """Vektor příznaků výřezu buňky, nebo None když v buňce nic není."""
+    ink = _glyph_mask(img)
+    ys, xs = np.nonzero(ink)
+    if ys.size == 0:
+        return None
+    crop = ink[ys.min():ys.max() + 1, xs.min():xs.max() + 1].astype(np.float32)
+    h, w = crop.shape
+    side = max(h, w)
+    canvas = np.zeros((side, side), dtype=np.float32)
+    oy, ox = (side - h) // 2, (side - w) // 2
+    canvas[oy:oy + h, ox:ox + w] = crop
+    g = cv2.resize(canvas, (CLF_SIZE, CLF_SIZE), interpolation=cv2.INTER_AREA)
+
+    zones = g.reshape(6, CLF_SIZE // 6, 6, CLF_SIZE // 6).mean(axis=(1, 3)).ravel()
+    gx = cv2.Sobel(g, cv2.CV_32F, 1, 0, ksize=3)
+    gy = cv2.Sobel(g, cv2.CV_32F, 0, 1, ksize=3)
+    mag, ang = cv2.cartToPolar(gx, gy)
+    bins = np.minimum((np.mod(ang, np.pi) / np.pi * 8).astype(np.int32), 7)
+    cs = CLF_SIZE // 4
+    hog = np.stack([np.where(bins == b, mag, 0).reshape(4, cs, 4, cs).sum(axis=(1, 3))
+                    for b in range(8)], axis=-1).ravel()
+    hog /= (np.linalg.norm(hog) + 1e-6)
+    return np.concatenate([zones, hog, [math.log(w / h)]]).astype(np.float32)
+
+class ShiftCodeClassifier:
+    """kNN nad glyph_features; predict() vrací (zkratka, jistota 0..1) pro každý výřez."""
+
+    def __init__(self, feats: np.ndarray, labels: List[str], k: int = 3, reject_dist: float = None):
+        self.mean = feats.mean(axis=0)
+        self.std = feats.std(axis=0) + 1e-6
+        self.X = (feats - self.mean) / self.std
+        self.labels = np.array(labels)
+        self.k = min(k, len(labels))
+        if reject_dist is None:
+            # leave-one-out vzdálenost k nejbližšímu sousedovi => co je "daleko od všeho"
+            d = self._dist2(self.X)
+            np.fill_diagonal(d, np.inf)
+            nn = np.sqrt(d.min(axis=1)) if len(labels) > 1 else np.array([1.0])
+            reject_dist = float(np.percentile(nn, 95) * 1.5)
+        self.reject_dist = reject_dist
+
+    def _dist2(self, Q):
+        return np.maximum(0, (Q ** 2).sum(1)[:, None] + (self.X ** 2).sum(1)[None, :] - 2 * Q @ self.X.T)
+
+    def predict(self, imgs) -> List[Tuple[str, float]]:
+        out = [("", 1.0)] * len(imgs)
+        feats, idx = [], []
+        for i, img in enumerate(imgs):
+            f = glyph_features(img)
+            if f is not None:
+                feats.append(f)
+                idx.append(i)
+        if not feats:
+            return out
+        Q = (np.stack(feats) - self.mean) / self.std
+        d = np.sqrt(self._dist2(Q))
+        nn = np.argsort(d, axis=1)[:, :self.k]
+        for row, i in enumerate(idx):
+            votes = {}
+            for j in nn[row]:
+                votes[self.labels[j]] = votes.get(self.labels[j], 0.0) + 1.0 / (d[row, j] + 1e-3)
+            label = max(votes, key=votes.get)
+            conf = votes[label] / sum(votes.values())
+            if d[row, nn[row, 0]] > self.reject_dist:
+                conf = 0.0
+            out[i] = (str(label), float(conf))
+        return out
+
+    def save(self, path: str):
+        with open(path, "wb") as fh:  # přes handle, ať np.savez nepřidává .npz (load čte přesně `path`)
+            np.savez_compressed(fh, X=self.X * self.std + self.mean, labels=self.labels,
+                                k=self.k, reject_dist=self.reject_dist)
+
+    @classmethod
+    def load(cls, path: str) -> "ShiftCodeClassifier":
+        with np.load(path, allow_pickle=False) as d:  # NpzFile drží soubor otevřený až do close
+            return cls(d["X"], [str(x) for x in d["labels"]], k=int(d["k"]),
+                       reject_dist=float(d["reject_dist"]))
+
+    @classmethod
+    def train_from_debug(cls, debug_dir: str, labels_csv: Optional[str] = None,
+                         header_row_idx: int = 0) -> "ShiftCodeClassifier":
+        """
+        Natrénuje z výřezů, které dumpne --debug (cell_r*_c*.png).
+        Popisky: labels.json z téhož běhu, nebo (ručně opravené) výstupní CSV.
+        """
+        import re
+        labels = {}
+        with open(os.path.join(debug_dir, "labels.json"), encoding="utf-8") as f:
+            for fname, info in json.load(f).items():
+                if info["kind"] == "body":
+                    labels[fname] = info["text"]
+        if labels_csv:
+            import csv
+            with open(labels_csv, encoding="utf-8-sig", newline="") as f:
+                rows = list(csv.reader(f))[1:]  # 1. řádek = hlavička CSV
+            for fname in list(labels):
+                m = re.match(r"cell_r(\d+)_c(\d+)\.png", fname)
+                r, c = int(m.group(1)), int(m.group(2))
+                ri = r - 1 if r > header_row_idx else r
+                if ri < len(rows) and c < len(rows[ri]):
+                    labels[fname] = rows[ri][c].strip().upper()
+
+        feats, ys = [], []
+        for fname, text in sorted(labels.items()):
+            if text not in ALLOWED_BODY:
+                continue
+            img = cv2.imread(os.path.join(debug_dir, fname), cv2.IMREAD_GRAYSCALE)
+            f = glyph_features(img) if img is not None else None
+            if f is not None:
+                feats.append(f)
+                ys.append(text)
+        if not feats:
+            raise RuntimeError(f"V {debug_dir} nejsou žádné popsané výřezy těla.")
+        print(f"Klasifikátor: {len(ys)} vzorků, třídy: {sorted(set(ys))}")
+        return cls(np.stack(feats), ys)
+# ===== /Klasifikátor zkratek =====
+
+# ===== Index známých jmen =====
+# Se seznamem zaměstnanců (--names) stačí na jméno jeden levný průchod OCR: výsledek
+# se přes trigramový index přichytí k nejbližšímu známému jménu a těžké re-OCR
+# (RETRY_VARIANTS["name"]) dostanou jen buňky, ke kterým žádné jméno blízko není.
+
+NAME_MIN_SCORE = 0.75  # min. podobnost (1 - Levenshtein / délka) pro přichycení
+NAME_MARGIN    = 0.1   # o kolik musí nejlepší kandidát předběhnout druhého (Novák vs. Nováková)
+NAME_SHORTLIST = 8     # kolik kandidátů s nejvíc společnými trigramy se porovná přesně
+
+def fold_name(s: str) -> str:
+    """Porovnávací tvar jména: bez diakritiky, malá písmena, jen písmena a jednoduché mezery."""
+    import unicodedata
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch if ch.isalpha() else " " for ch in s if not unicodedata.combining(ch))
+    return " ".join(s.lower().split())
 
+def _trigrams(folded: str) -> set:
+    padded = f"  {folded} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
 
+def levenshtein(a: str, b: str, max_dist: Optional[int] = None) -> int:
+    """Editační vzdálenost; s max_dist skončí dřív a vrátí max_dist + 1, jakmile je jasné, že ji překročí."""
+    if len(a) < len(b):
+        a, b = b, a
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        if max_dist is not None and min(cur) > max_dist:
+            return max_dist + 1
+        prev = cur
+    return prev[-1]
 
-def cells_to_table_zoned(cells: List[Cell], header_row_idx: int = 0, name_col_idx: int = 0) -> pd.DataFrame:
+class NameIndex:
+    """
+    Trigramový index známých jmen; match() vrací (jméno ze seznamu, podobnost 0..1)
+    nebo (None, nejlepší podobnost), když žádný kandidát není dost blízko / jednoznačný.
+    Porovnává se i s prohozeným pořadím slov (Jan Novák x Novák Jan).
+    """
+
+    def __init__(self, names: List[str], min_score: float = NAME_MIN_SCORE):
+        self.names = list(dict.fromkeys(n.strip() for n in names if n.strip()))
+        self.folded = [fold_name(n) for n in self.names]
+        self.swapped = [" ".join(sorted(f.split())) for f in self.folded]  # pořadí slov nehraje roli
+        self.min_score = min_score
+        self.postings = {}
+        for i, f in enumerate(self.folded):
+            for g in _trigrams(f):
+                self.postings.setdefault(g, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _score(self, q: str, q_swapped: str, i: int) -> float:
+        n = max(len(q), len(self.folded[i]), 1)
+        max_dist = int((1.0 - self.min_score) * n)  # horší kandidáti se dopočítávat nemusí
+        if abs(len(q) - len(self.folded[i])) > max_dist:
+            return 0.0
+        dist = levenshtein(q, self.folded[i], max_dist)
+        if dist and (q_swapped != q or self.swapped[i] != self.folded[i]):
+            dist = min(dist, levenshtein(q_swapped, self.swapped[i], max_dist))
+        return 1.0 - dist / n if dist <= max_dist else 0.0
+
+    def match(self, text: str) -> Tuple[Optional[str], float]:
+        q = fold_name(text)
+        if not q or not self.names:
+            return None, 0.0
+        if len(self.names) <= NAME_SHORTLIST:
+            shortlist = range(len(self.names))
+        else:
+            hits = {}
+            for g in _trigrams(q):
+                for i in self.postings.get(g, ()):
+                    hits[i] = hits.get(i, 0) + 1
+            shortlist = sorted(hits, key=hits.get, reverse=True)[:NAME_SHORTLIST]
+        q_swapped = " ".join(sorted(q.split()))
+        scored = sorted(((self._score(q, q_swapped, i), i) for i in shortlist), reverse=True)
+        if not scored:
+            return None, 0.0
+        best, i = scored[0]
+        second = scored[1][0] if len(scored) > 1 else 0.0
+        if best >= self.min_score and best - second >= NAME_MARGIN:
+            return self.names[i], best
+        return None, best
+
+    @classmethod
+    def load(cls, path: str, min_score: float = NAME_MIN_SCORE) -> "NameIndex":
+        """Textový soubor (jméno na řádek, # = komentář) nebo CSV / JSON z image_extract_v3 (sloupec JMENO)."""
+        if path.lower().endswith(".csv"):
+            t = Table.read_csv(path)
+            col = t.columns.index("JMENO") if "JMENO" in t.columns else 0
+            names = [r[col] for r in t.rows if col < len(r)]
+        elif path.lower().endswith(".json"):
+            with open(path, encoding="utf-8") as f:
+                names = [str(r.get("JMENO", "")) for r in json.load(f)]
+        else:
+            with open(path, encoding="utf-8-sig") as f:
+                names = [ln for ln in (l.strip() for l in f) if ln and not ln.startswith("#")]
+        index = cls(names, min_score)
+        if not len(index):
+            raise RuntimeError(f"V {path} nejsou žádná jména.")
+        return index
+# ===== /Index známých jmen =====
+
+# ===== Barevné kódy směn =====
+# Rozpisy, kde je směna vyznačená barvou buňky: barva každé buňky se spočítá jedním
+# vektorovým průchodem (integrální obraz nad barevným náhledem originálu) a buňka těla,
+# jejíž barva jednoznačně odpovídá zkratce z palety (--color-codes), Tesseract nepotřebuje.
+
+COLOR_THUMB      = 1200  # max. rozměr barevného náhledu v px
+COLOR_MIN_CHROMA = 12    # min. sytost pixelu (vzdálenost a*b* od šedé, 8bit Lab), aby byl "barevný"
+COLOR_MIN_COVER  = 0.35  # min. podíl barevných pixelů ve vnitřku buňky
+COLOR_MAX_DIST   = 22.0  # max. vzdálenost průměrné barvy buňky od barvy z palety (a*b*)
+COLOR_MARGIN     = 1.5   # barva jiné zkratky musí být aspoň COLOR_MARGIN x dál => jednoznačné
+COLOR_INSET      = 0.15  # okraj buňky (podíl šířky/výšky), který se nepočítá => bez čar mřížky
+
+def color_thumbnail(image_bgr: np.ndarray) -> np.ndarray:
+    h, w = image_bgr.shape[:2]
+    f = COLOR_THUMB / max(h, w)
+    if f >= 1.0:
+        return image_bgr.copy()
+    return cv2.resize(image_bgr, None, fx=f, fy=f, interpolation=cv2.INTER_AREA)
+
+def cell_colors(cells: List[Cell], thumb: np.ndarray, src_shape: Tuple[int, int], to_src: np.ndarray):
+    """
+    Cell.color = (podíl barevných pixelů, průměrné a*, průměrné b* barevných pixelů) pro vnitřek
+    každé buňky. Součty z integrálního obrazu => O(1) na buňku bez ohledu na její velikost.
+    to_src: 3x3 afinní zobrazení ze souřadnic buněk do originálu (výřez, deskew, šablona);
+    malé natočení se zanedbá, do originálu se převádí jen střed buňky.
+    """
     if not cells:
-        return pd.DataFrame()
+        return
+    lab = cv2.cvtColor(thumb, cv2.COLOR_BGR2Lab).astype(np.float32)
+    a, b = lab[..., 1] - 128.0, lab[..., 2] - 128.0
+    m = (a * a + b * b > COLOR_MIN_CHROMA ** 2).astype(np.float32)
+    ii = cv2.integral(np.dstack([m, m * a, m * b]), sdepth=cv2.CV_64F)
+    th, tw = thumb.shape[:2]
+    fy, fx = th / src_shape[0], tw / src_shape[1]
+
+    box = np.array([c.bbox for c in cells], dtype=np.float64)
+    cx, cy = box[:, 0] + box[:, 2] / 2, box[:, 1] + box[:, 3] / 2
+    sx = (to_src[0, 0] * cx + to_src[0, 1] * cy + to_src[0, 2]) * fx
+    sy = (to_src[1, 0] * cx + to_src[1, 1] * cy + to_src[1, 2]) * fy
+    hw, hh = box[:, 2] * (0.5 - COLOR_INSET) * fx, box[:, 3] * (0.5 - COLOR_INSET) * fy
+    x1 = np.clip(np.round(sx - hw), 0, tw - 1).astype(int)
+    y1 = np.clip(np.round(sy - hh), 0, th - 1).astype(int)
+    x2 = np.clip(np.maximum(np.round(sx + hw), x1 + 1), 1, tw).astype(int)
+    y2 = np.clip(np.maximum(np.round(sy + hh), y1 + 1), 1, th).astype(int)
+    sums = ii[y2, x2] - ii[y1, x2] - ii[y2, x1] + ii[y1, x1]
+    cover = sums[:, 0] / ((x2 - x1) * (y2 - y1))
+    n = np.maximum(sums[:, 0], 1.0)
+    for cell, cv_, ca, cb in zip(cells, cover, sums[:, 1] / n, sums[:, 2] / n):
+        cell.color = (float(cv_), float(ca), float(cb))
+
+class ColorPalette:
+    """
+    Paleta zkratka -> barva(y) z JSONu, např. {"D": "#FFE699", "N": ["#9DC3E6", "#BDD7EE"]}.
+    match(cell.color) vrací zkratku z ALLOWED_BODY, nebo None (bez barvy / nejednoznačné).
+    """
+
+    def __init__(self, codes: dict):
+        import re
+        self.codes, ab = [], []
+        for code, colors in codes.items():
+            code = str(code).strip().upper()
+            if code not in ALLOWED_BODY:
+                raise ValueError(f"zkratka '{code}' není v ALLOWED_BODY")
+            for hexcol in ([colors] if isinstance(colors, str) else colors):
+                h = hexcol.lstrip("#")
+                if not re.fullmatch(r"[0-9A-Fa-f]{6}", h):
+                    raise ValueError(f"barva '{hexcol}' u '{code}' není #RRGGBB")
+                bgr = np.uint8([[[int(h[4:6], 16), int(h[2:4], 16), int(h[0:2], 16)]]])
+                lab = cv2.cvtColor(bgr, cv2.COLOR_BGR2Lab)[0, 0].astype(np.float64)
+                if math.hypot(lab[1] - 128, lab[2] - 128) <= COLOR_MIN_CHROMA:
+                    print(f"Varování: barva {hexcol} u '{code}' je skoro šedá, barvou se nerozliší")
+                    continue
+                self.codes.append(code)
+                ab.append((lab[1] - 128, lab[2] - 128))
+        self.ab = np.array(ab, dtype=np.float64).reshape(-1, 2)
+
+    def match(self, color: Optional[Tuple[float, float, float]]) -> Optional[str]:
+        if color is None or color[0] < COLOR_MIN_COVER or not self.codes:
+            return None
+        d = np.hypot(self.ab[:, 0] - color[1], self.ab[:, 1] - color[2])
+        best = int(np.argmin(d))
+        if d[best] > COLOR_MAX_DIST:
+            return None
+        others = [d[i] for i, c in enumerate(self.codes) if c != self.codes[best]]
+        if others and min(others) < COLOR_MARGIN * d[best]:
+            return None
+        return self.codes[best]
+
+    @classmethod
+    def load(cls, path: str) -> "ColorPalette":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+# ===== /Barevné kódy směn =====
+
+# -------- Tabulka bez pandas --------
+
+class Table:
+    """
+    Výsledná tabulka: názvy sloupců + řádky řetězců. CSV/JSON se zapisují bez pandas
+    (stejný tvar jako dřív DataFrame.to_csv / to_json(orient="records")), DataFrame
+    jde získat přes to_dataframe().
+    """
+    def __init__(self, columns: List[str], rows: List[List[str]]):
+        self.columns = list(columns)
+        self.rows = [list(r) for r in rows]
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return len(self.rows), len(self.columns)
+
+    @property
+    def empty(self) -> bool:
+        return not self.rows or not self.columns
+
+    def _keys(self) -> List[Tuple[str, int]]:
+        """(název, pořadí výskytu) – duplicitní názvy sloupců (dvakrát přečtený den) zůstanou odlišené."""
+        keys, seen = [], {}
+        for c in self.columns:
+            keys.append((c, seen.get(c, 0)))
+            seen[c] = seen.get(c, 0) + 1
+        return keys
+
+    def records(self) -> List[dict]:
+        # duplicitní sloupce => "5", "5.1" (jako pandas.read_csv)
+        keys = [c if n == 0 else f"{c}.{n}" for c, n in self._keys()]
+        return [dict(zip(keys, r)) for r in self.rows]
+
+    def to_csv(self, path: str):
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            w = csv.writer(f, lineterminator=os.linesep)
+            w.writerow(self.columns)
+            w.writerows(self.rows)
+
+    def to_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.records(), f, ensure_ascii=False, indent=2)
+
+    @classmethod
+    def read_csv(cls, path: str) -> "Table":
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.reader(f))
+        return cls(rows[0], rows[1:]) if rows else cls([], [])
+
+    @classmethod
+    def concat(cls, tables: List["Table"]) -> "Table":
+        """Spojí tabulky pod sebe; sloupce = sjednocení v pořadí výskytu, chybějící = ""."""
+        keys = []
+        for t in tables:
+            keys += [k for k in t._keys() if k not in keys]
+        rows = []
+        for t in tables:
+            idx = {k: i for i, k in enumerate(t._keys())}
+            rows += [[r[idx[k]] if k in idx and idx[k] < len(r) else "" for k in keys] for r in t.rows]
+        return cls([c for c, _ in keys], rows)
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.rows, columns=self.columns)
+
+    def preview(self, n: int = 10, max_colwidth: int = 40, width: int = 120) -> str:
+        """Textový náhled prvních n řádků (sloupce, které se nevejdou do `width`, se vynechají)."""
+        cells = [self.columns] + self.rows[:n]
+        cells = [[(v if len(v) <= max_colwidth else v[:max_colwidth - 3] + "...") for v in r] for r in cells]
+        widths = [max(len(r[i]) if i < len(r) else 0 for r in cells) for i in range(len(self.columns))]
+        shown, total = [], 0
+        for i, wd in enumerate(widths):
+            if total + wd + 1 > width and shown:
+                break
+            shown.append(i)
+            total += wd + 1
+        lines = [" ".join((r[i] if i < len(r) else "").ljust(widths[i]) for i in shown).rstrip() for r in cells]
+        if len(shown) < len(self.columns):
+            lines[0] += f"  ... (+{len(self.columns) - len(shown)} sloupců)"
+        if len(self.rows) > n:
+            lines.append(f"... ({len(self.rows)} řádků)")
+        return "\n".join(lines)
+
+def _cells_grid(cells: List[Cell]) -> List[List[str]]:
     max_r = max(c.r for c in cells); max_c = max(c.c for c in cells)
     data = [["" for _ in range(max_c + 1)] for _ in range(max_r + 1)]
     for c in cells:
         data[c.r][c.c] = c.text
-    df = pd.DataFrame(data)
-    header = df.iloc[header_row_idx].tolist()
-    df.columns = [str(h) if h else f"col_{i}" for i, h in enumerate(header)]
-    df = df.drop(index=header_row_idx).reset_index(drop=True)
+    return data
+
+def cells_to_table_zoned(cells: List[Cell], header_row_idx: int = 0, name_col_idx: int = 0) -> Table:
+    if not cells:
+        return Table([], [])
+    data = _cells_grid(cells)
+    header = data[header_row_idx]
+    columns = [str(h) if h else f"col_{i}" for i, h in enumerate(header)]
     # pojmenuj 1. sloupec
-    if df.columns.tolist():
-        df = df.rename(columns={df.columns[0]: "JMENO"})
-    return df
+    columns[0] = "JMENO"
+    return Table(columns, data[:header_row_idx] + data[header_row_idx + 1:])
 
-def cells_to_table(cells: List[Cell]) -> pd.DataFrame:
+def cells_to_table(cells: List[Cell]) -> Table:
     if not cells:
-        return pd.DataFrame()
-    max_r = max(c.r for c in cells)
-    max_c = max(c.c for c in cells)
-    data = [["" for _ in range(max_c + 1)] for _ in range(max_r + 1)]
-    for c in cells:
-        data[c.r][c.c] = c.text
-    df = pd.DataFrame(data)
+        return Table([], [])
+    data = _cells_grid(cells)
     # Heuristika: první řádek jako header, pokud vypadá “hlavičkově”
-    header = df.iloc[0].tolist()
-    if sum(1 for x in header if x) >= max(2, df.shape[1] // 2):
-        df.columns = [h if h else f"col_{i}" for i, h in enumerate(header)]
-        df = df.iloc[1:].reset_index(drop=True)
+    header = data[0]
+    if sum(1 for x in header if x) >= max(2, len(header) // 2):
+        return Table([h if h else f"col_{i}" for i, h in enumerate(header)], data[1:])
+    return Table([str(i) for i in range(len(header))], data)
+
+# -------- Zpracování jednoho obrázku / batch --------
+
+_CLASSIFIERS = {}
+
+def _load_classifier(path: Optional[str]) -> Optional[ShiftCodeClassifier]:
+    """Model klasifikátoru načtený jednou na proces."""
+    if not path:
+        return None
+    if path not in _CLASSIFIERS:
+        _CLASSIFIERS[path] = ShiftCodeClassifier.load(path)
+    return _CLASSIFIERS[path]
+
+_NAME_INDEXES = {}
+_PALETTES = {}
+
+def _load_palette(path: Optional[str]) -> Optional[ColorPalette]:
+    """Paleta barevných kódů načtená jednou na proces."""
+    if not path:
+        return None
+    if path not in _PALETTES:
+        _PALETTES[path] = ColorPalette.load(path)
+    return _PALETTES[path]
+
+def _load_names(path: Optional[str], min_score: float = NAME_MIN_SCORE) -> Optional[NameIndex]:
+    """Index známých jmen načtený jednou na proces."""
+    if not path:
+        return None
+    if (path, min_score) not in _NAME_INDEXES:
+        _NAME_INDEXES[path, min_score] = NameIndex.load(path, min_score)
+    return _NAME_INDEXES[path, min_score]
+
+def memory_plan(img_path: str, tiled: bool = False, max_memory_mb: float = 0) -> int:
+    """
+    Výška pásu pro extract_grid_cells / run_ocr_on_cells (0 = běžný režim).
+    Rozměry se čtou jen z hlavičky obrázku; s limitem paměti se dlaždicový režim
+    zapne sám, když by odhad běžného režimu limit překročil.
+    """
+    if not tiled and max_memory_mb <= 0:
+        return 0
+    try:
+        with Image.open(img_path) as im:  # PIL čte jen hlavičku, pixely nenačte
+            w, h = im.size
+    except Exception:
+        return TILE_ROWS if tiled else 0  # chybu načtení nahlásí až extract_grid_cells
+    mb = w * h / (1024 * 1024)
+    # špička = horší z fází detekce mřížky a OCR (obě drží celou stránku)
+    full_mb = max(FULL_BYTES_PER_PX, OCR_BYTES_PER_PX) * mb
+    if not tiled and full_mb <= max_memory_mb:
+        return 0
+    rows = tile_rows_for((h, w), max_memory_mb)
+    # mapy pásu (pás + překryvy fallbacku h/20) vznikají nad šedou + bw, ne nad výstupem filtru
+    band_mb = BAND_BYTES_PER_PX * w * min(h, rows + h // 10) / (1024 * 1024)
+    tiled_mb = max(TILED_BYTES_PER_PX * mb, OCR_BYTES_PER_PX * mb + band_mb)
+    print(f"Dlaždicový režim: {w}x{h} px, pásy po {rows} řádcích "
+          f"(odhad špičky {tiled_mb:.0f} MB místo {full_mb:.0f} MB)")
+    if max_memory_mb > 0 and tiled_mb > max_memory_mb:
+        print(f"Varování: ani dlaždicový režim se nejspíš nevejde do {max_memory_mb:.0f} MB")
+    PROFILE.count("tiled")
+    return rows
+
+def prepare_image(img_path: str, args, debug_dir: Optional[str] = None, tile_rows: int = 0,
+                  image: Optional[np.ndarray] = None) -> Tuple[np.ndarray, List[Cell]]:
+    """Předzpracování a mřížka jednoho obrázku (extract_grid_cells) podle voleb z CLI."""
+    return extract_grid_cells(img_path, debug_dir=debug_dir, template=args.template,
+                              denoise=args.denoise, table_crop=args.table_crop,
+                              pyramid=args.pyramid, tile_rows=tile_rows,
+                              color=args.color_codes is not None, image=image)
+
+def ocr_cells_to_table(gray: np.ndarray, cells: List[Cell], args, workers: int = 1,
+                       debug_dir: Optional[str] = None, tile_rows: int = 0) -> Table:
+    """OCR buněk z prepare_image a složení tabulky podle voleb z CLI."""
+    # cache je sdílená napříč obrázky (batch, watch) => do profilu jen přírůstek za tento obrázek
+    hits0, misses0 = (_CACHE.hits, _CACHE.misses) if _CACHE is not None else (0, 0)
+    # cells = run_ocr_on_cells(gray, cells, lang=args.lang, debug_dir=args.debug)
+    cells = run_ocr_on_cells(gray, cells, lang=args.lang, debug_dir=debug_dir,
+                         header_row_idx=0, name_col_idx=0, workers=workers,
+                         strip=args.strip, prefilter=not args.no_prefilter,
+                         blank_ink=args.blank_ink, blank_min_blob=args.blank_min_blob,
+                         classifier=_load_classifier(args.classifier), clf_min_conf=args.clf_min_conf,
+                         denoise_roi_cells=args.denoise == "roi", retry_conf=args.retry_conf,
+                         tile_rows=tile_rows, names=_load_names(args.names, args.names_min_score),
+                         palette=_load_palette(args.color_codes), color_confirm=args.color_confirm)
+    del gray  # stránka už není potřeba, buňky nesou jen text
+    if _CACHE is not None:
+        hits, misses = _CACHE.hits - hits0, _CACHE.misses - misses0
+        if hits or misses:
+            print(f"OCR cache: {hits} zásahů / {hits + misses} dotazů")
+            PROFILE.count("cache_hits", hits)
+            PROFILE.count("cache_misses", misses)
+    with PROFILE.stage("table"):
+        # df = cells_to_table(cells)
+        df = cells_to_table_zoned(cells, header_row_idx=0, name_col_idx=0)
+    rss = peak_rss_mb()
+    if rss is not None and PROFILE.enabled:
+        PROFILE.counters["peak_rss_mb"] = round(rss)
     return df
 
+def process_image(img_path: str, args, workers: int = 1,
+                  debug_dir: Optional[str] = None) -> Table:
+    """Celá pipeline pro jeden obrázek (extract -> OCR -> tabulka) podle voleb z CLI."""
+    tile_rows = memory_plan(img_path, args.tiled, args.max_memory_mb)
+    # bez lokální reference na stránku => ocr_cells_to_table ji může uvolnit hned po OCR
+    return ocr_cells_to_table(*prepare_image(img_path, args, debug_dir, tile_rows), args, workers, debug_dir, tile_rows)
+
+def save_table(df: Table, csv_path: str, json_path: str):
+    with PROFILE.stage("write"):
+        df.to_csv(csv_path)
+        df.to_json(json_path)
+
+def profile_path_for(csv_path: str) -> str:
+    """Report profilování leží vedle CSV: timetable.csv -> timetable.profile.json."""
+    return os.path.splitext(csv_path)[0] + ".profile.json"
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+# volby, které mění výsledek => jiná hodnota znamená znovu zpracovat
+BATCH_OPT_KEYS = ("lang", "engine", "strip", "no_prefilter", "blank_ink", "blank_min_blob",
+                  "classifier", "clf_min_conf", "template", "denoise", "retry_conf", "table_crop", "pyramid",
+                  "tiled", "max_memory_mb", "names", "names_min_score", "color_codes", "color_confirm")
+
+def is_batch_input(spec: str) -> bool:
+    return os.path.isdir(spec) or any(ch in spec for ch in "*?[")
+
+def collect_images(spec: str) -> List[str]:
+    """Složka (všechny obrázky v ní) nebo glob => seřazený seznam cest."""
+    if os.path.isdir(spec):
+        paths = [os.path.join(spec, f) for f in os.listdir(spec)]
+    else:
+        paths = glob.glob(spec, recursive=True)
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTS))
+
+def file_sha1(path: str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_manifest(path: str) -> dict:
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"images": {}}
+
+def save_manifest(path: str, manifest: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)  # přerušení uprostřed zápisu nerozbije manifest
+
+def _batch_entry(job) -> dict:
+    """Záznam manifestu pro úlohu (klíč, cesta, sha1, stat, stem, out_dir, args) – zatím bez výsledku."""
+    key, img_path, sha, stat, stem, out_dir, args = job
+    return {"path": img_path, "sha1": sha, "stat": stat,
+            "csv": os.path.join(out_dir, stem + ".csv"), "json": os.path.join(out_dir, stem + ".json"),
+            "opts": {k: getattr(args, k) for k in BATCH_OPT_KEYS}}
+
+def _batch_task(job):
+    """Worker batch režimu: jeden obrázek -> CSV/JSON. Vrací (klíč, záznam manifestu)."""
+    key, img_path, sha, stat, stem, out_dir, args = job
+    entry = _batch_entry(job)
+    csv_path, json_path = entry["csv"], entry["json"]
+    try:
+        debug_dir = os.path.join(args.debug, stem) if args.debug else None
+        PROFILE.enabled = args.profile
+        PROFILE.reset()
+        t0 = time.perf_counter()
+        df = process_image(img_path, args, workers=1, debug_dir=debug_dir)
+        save_table(df, csv_path, json_path)
+        if PROFILE.enabled:
+            PROFILE.save(profile_path_for(csv_path), total_s=time.perf_counter() - t0, image=img_path)
+        entry.update(status="ok", rows=int(len(df)))
+    except Exception as e:
+        entry.update(status="error", error=f"{type(e).__name__}: {e}")
+    entry["done_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    return key, entry
+
+# -------- Pipeline po fázích (batch --pipeline) --------
+# Místo "celý obrázek v jednom procesu" běží fáze v samostatných vláknech spojených
+# omezenými frontami: načtení (I/O) -> předzpracování + mřížka (OpenCV) -> OCR
+# (subprocess / tesserocr, obojí pouští GIL) -> zápis. Plná fronta brzdí předchozí
+# fázi (backpressure) => v paměti je najednou jen pár rozpracovaných stránek.
+
+PIPELINE_STAGES = ("load", "prep", "ocr", "write")
+_PIPE_END = object()  # konec proudu (jeden na každé vlákno další fáze)
+_PIPE_POLL_S = 0.1    # jak často vlákno čekající na frontu kontroluje zastavení pipeline
+
+class StagePipeline:
+    """
+    Fáze [(název, funkce, vláken)] spojené frontami velikosti queue_size. Funkce dostane
+    a vrací kontext (dict) úlohy; výjimka se zapíše do ctx["error"] a další fáze ho
+    jen propustí. Chyba mimo funkci fáze (vstupní iterátor, vadný kontext) pipeline
+    zastaví a run() ji znovu vyhodí – vlákna čekající na plné frontě se přitom
+    ukončí, nic nevisí. Po běhu stats() vrací vytížení každé fáze.
+    """
+
+    def __init__(self, stages: list, queue_size: int = 2):
+        import queue
+        self.stages = stages
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in range(len(stages) + 1)]
+        self._left = [n for _, _, n in stages]  # živá vlákna fáze
+        self._lock = threading.Lock()
+        self._abort = threading.Event()
+        self._error = None  # první chyba mimo funkci fáze
+        self._stats = {name: {"workers": n, "items": 0, "busy_s": 0.0, "wait_in_s": 0.0, "wait_out_s": 0.0}
+                       for name, _, n in stages}
+        self.wall_s = 0.0
+
+    def _fail(self, e: BaseException):
+        with self._lock:
+            if self._error is None:
+                self._error = e
+        self._abort.set()
+
+    def _put(self, q, item) -> bool:
+        """q.put, které se vzdá po zastavení pipeline (False) místo věčného čekání na plnou frontu."""
+        from queue import Full
+        while not self._abort.is_set():
+            try:
+                q.put(item, timeout=_PIPE_POLL_S)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _get(self, q):
+        """q.get; po zastavení pipeline vrátí _PIPE_END."""
+        from queue import Empty
+        while not self._abort.is_set():
+            try:
+                return q.get(timeout=_PIPE_POLL_S)
+            except Empty:
+                pass
+        return _PIPE_END
+
+    def _worker(self, i: int):
+        name, fn, _ = self.stages[i]
+        q_in, q_out = self.queues[i], self.queues[i + 1]
+        busy = wait_in = wait_out = 0.0
+        items = 0
+        try:
+            while True:
+                t0 = time.perf_counter()
+                ctx = self._get(q_in)
+                t1 = time.perf_counter()
+                wait_in += t1 - t0
+                if ctx is _PIPE_END:
+                    break
+                if "error" not in ctx:
+                    try:
+                        ctx = fn(ctx) or ctx
+                    except Exception as e:
+                        ctx["error"] = f"{type(e).__name__}: {e}"
+                t2 = time.perf_counter()
+                if not self._put(q_out, ctx):
+                    break
+                busy += t2 - t1
+                wait_out += time.perf_counter() - t2
+                items += 1
+        except BaseException as e:
+            self._fail(e)
+        with self._lock:
+            st = self._stats[name]
+            st["items"] += items
+            st["busy_s"] += busy
+            st["wait_in_s"] += wait_in
+            st["wait_out_s"] += wait_out
+            self._left[i] -= 1
+            last = self._left[i] == 0
+        if last:  # poslední vlákno fáze ukončí další fázi (nebo výstup)
+            n_next = self.stages[i + 1][2] if i + 1 < len(self.stages) else 1
+            for _ in range(n_next):
+                self._put(q_out, _PIPE_END)
+
+    def run(self, items):
+        """Generátor hotových kontextů (v pořadí dokončení)."""
+        t0 = time.perf_counter()
+        threads = [threading.Thread(target=self._worker, args=(i,), daemon=True,
+                                    name=f"pipeline-{name}-{k}")
+                   for i, (name, _, n) in enumerate(self.stages) for k in range(n)]
+
+        def feed():
+            try:
+                for item in items:
+                    if not self._put(self.queues[0], item):
+                        return
+            except BaseException as e:
+                self._fail(e)
+                return
+            for _ in range(self.stages[0][2]):
+                self._put(self.queues[0], _PIPE_END)
+
+        threads.append(threading.Thread(target=feed, daemon=True, name="pipeline-feed"))
+        for t in threads:
+            t.start()
+        try:
+            while True:
+                ctx = self._get(self.queues[-1])
+                if ctx is _PIPE_END:
+                    break
+                yield ctx
+        finally:
+            # i při předčasném ukončení odběratelem: vlákna se odblokují a skončí
+            self._abort.set()
+            for t in threads:
+                t.join()
+            self.wall_s = time.perf_counter() - t0
+        if self._error is not None:
+            raise self._error
+
+    def stats(self) -> dict:
+        """Vytížení = busy / (wall * vláken); čekání na vstup = hladovění, na výstup = backpressure."""
+        out = {}
+        for name, st in self._stats.items():
+            cap = max(1e-9, self.wall_s * st["workers"])
+            out[name] = {**{k: (round(v, 3) if isinstance(v, float) else v) for k, v in st.items()},
+                         "utilization": round(st["busy_s"] / cap, 3)}
+        return out
+
+def parse_stage_workers(spec: Optional[str], ocr_default: int = 1) -> dict:
+    """'prep=2,ocr=4' -> počet vláken pro každou fázi PIPELINE_STAGES (nezadané = výchozí)."""
+    counts = {"load": 1, "prep": 2, "ocr": max(1, ocr_default), "write": 1}
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        name, _, n = part.partition("=")
+        name = name.strip()
+        if name not in counts or not n.strip().isdigit() or int(n) < 1:
+            raise ValueError(f"--stage-workers čeká např. 'load=1,prep=2,ocr=4,write=1', dostal: {spec}")
+        counts[name] = int(n)
+    return counts
+
+def _pipe_load(ctx):
+    key, img_path, sha, stat, stem, out_dir, args = ctx["job"]
+    ctx["tile_rows"] = memory_plan(img_path, args.tiled, args.max_memory_mb)
+    image = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE if ctx["tile_rows"] else cv2.IMREAD_COLOR)
+    if image is None:
+        raise FileNotFoundError(f"Nelze načíst obrázek: {img_path}")
+    ctx["image"] = image
+    return ctx
+
+def _pipe_prep(ctx):
+    key, img_path, sha, stat, stem, out_dir, args = ctx["job"]
+    ctx["debug_dir"] = os.path.join(args.debug, stem) if args.debug else None
+    # pop => načtený obrázek drží jen extract_grid_cells a po převodu na šedou ho uvolní
+    ctx["gray"], ctx["cells"] = prepare_image(img_path, args, ctx["debug_dir"], ctx["tile_rows"],
+                                              image=ctx.pop("image"))
+    return ctx
+
+def _pipe_ocr(ctx):
+    args = ctx["job"][-1]
+    ctx["table"] = ocr_cells_to_table(ctx.pop("gray"), ctx.pop("cells"), args, 1, ctx["debug_dir"], ctx["tile_rows"])
+    return ctx
+
+def _pipe_write(ctx):
+    save_table(ctx["table"], ctx["entry"]["csv"], ctx["entry"]["json"])
+    ctx["entry"].update(status="ok", rows=len(ctx.pop("table")))
+    return ctx
+
+def run_pipeline(jobs: list, args, workers: int = 1):
+    """
+    Úlohy batch režimu přes StagePipeline ve vláknech tohoto procesu (sdílí engine,
+    OCR cache i načtené modely). Generuje (klíč, záznam manifestu) v pořadí dokončení
+    a na konci vypíše vytížení fází (s --profile i do <batch-out>/pipeline.profile.json).
+    """
+    counts = parse_stage_workers(args.stage_workers, workers)
+    # profiler je globální => časy fází jednotlivých obrázků by se ve vláknech míchaly
+    PROFILE.enabled = False
+    pipe = StagePipeline([("load", _pipe_load, counts["load"]), ("prep", _pipe_prep, counts["prep"]),
+                          ("ocr", _pipe_ocr, counts["ocr"]), ("write", _pipe_write, counts["write"])],
+                         queue_size=args.queue_size)
+    print("Pipeline: " + ", ".join(f"{n}={counts[n]}" for n in PIPELINE_STAGES) + f", fronty po {args.queue_size}")
+    for ctx in pipe.run({"job": job, "entry": _batch_entry(job)} for job in jobs):
+        entry = ctx["entry"]
+        if "error" in ctx:
+            entry.update(status="error", error=ctx["error"])
+        entry["done_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        yield ctx["job"][0], entry
+
+    stats = pipe.stats()
+    print(f"Pipeline: {len(jobs)} obrázků za {pipe.wall_s:.1f} s")
+    print(f"  {'fáze':<6} {'vláken':>6} {'položek':>8} {'vytížení':>9} {'čeká na vstup':>14} {'čeká na výstup':>15}")
+    for name in PIPELINE_STAGES:
+        st = stats[name]
+        print(f"  {name:<6} {st['workers']:>6} {st['items']:>8} {100 * st['utilization']:>8.0f} % "
+              f"{st['wait_in_s']:>12.1f} s {st['wait_out_s']:>13.1f} s")
+    bottleneck = max(PIPELINE_STAGES, key=lambda n: stats[n]["utilization"])
+    print(f"  Úzké hrdlo: {bottleneck} ({100 * stats[bottleneck]['utilization']:.0f} %) "
+          f"=> víc vláken pro '{bottleneck}' v --stage-workers")
+    if args.profile and jobs:
+        path = os.path.join(jobs[0][5], "pipeline.profile.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"wall_s": round(pipe.wall_s, 3), "images": len(jobs), "queue_size": args.queue_size,
+                       "bottleneck": bottleneck, "stages": stats}, f, ensure_ascii=False, indent=2)
+        print(f"  Profil pipeline: {path}")
+
+def run_batch(images: List[str], args, out_dir: str, workers: int = 1) -> dict:
+    """
+    Zpracuje seznam obrázků v procesovém poolu (paralelně po obrázcích),
+    s args.pipeline po fázích ve vláknech (run_pipeline).
+    manifest.json v out_dir drží hash vstupu a výstupy každého obrázku; hotové
+    obrázky se stejným obsahem i volbami se při dalším běhu přeskočí.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    manifest = load_manifest(manifest_path)
+    opts = {k: getattr(args, k) for k in BATCH_OPT_KEYS}
+
+    jobs, order, used_stems = [], [], set()
+    for img_path in images:
+        key = os.path.abspath(img_path)
+        stem = os.path.splitext(os.path.basename(img_path))[0]
+        entry = manifest["images"].get(key)
+        try:
+            st = os.stat(img_path)
+            stat = [st.st_size, st.st_mtime_ns]
+            # stejná velikost i mtime jako minule => hash z manifestu, soubor se znovu nečte
+            sha = entry["sha1"] if entry and entry.get("stat") == stat and entry.get("sha1") else file_sha1(img_path)
+        except (FileNotFoundError, PermissionError) as e:
+            # smazaný / přesunutý / zamčený mezi výpisem složky a čtením (typicky ve watch režimu)
+            print(f"  {os.path.basename(img_path)}: přeskočeno ({type(e).__name__})")
+            continue
+        if stem in used_stems:
+            stem = f"{stem}_{sha[:8]}"
+        used_stems.add(stem)
+        order.append(key)
+        if (entry and entry.get("status") == "ok" and entry.get("sha1") == sha and entry.get("opts") == opts
+                and os.path.exists(entry["csv"]) and os.path.exists(entry["json"])):
+            if entry.get("stat") != stat:
+                entry["stat"] = stat  # jen "touch" bez změny obsahu
+            continue
+        jobs.append((key, img_path, sha, stat, stem, out_dir, args))
+
+    print(f"Batch: {len(images)} obrázků, {len(images) - len(jobs)} už hotových, zpracuji {len(jobs)}")
+    if jobs and args.pipeline:
+        for key, entry in run_pipeline(jobs, args, workers):
+            manifest["images"][key] = entry
+            save_manifest(manifest_path, manifest)
+            state = "OK" if entry["status"] == "ok" else f"CHYBA ({entry['error']})"
+            print(f"  {os.path.basename(entry['path'])}: {state}")
+    elif jobs:
+        cache_args = (_CACHE.path, _CACHE.max_bytes / (1024 * 1024)) if _CACHE is not None else (None, 0)
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=max(1, min(workers, len(jobs))), initializer=_init_worker,
+                                 initargs=(get_engine().name,) + cache_args) as ex:
+            futures = [ex.submit(_batch_task, job) for job in jobs]
+            for fut in as_completed(futures):
+                key, entry = fut.result()
+                manifest["images"][key] = entry
+                save_manifest(manifest_path, manifest)  # průběžně => jde navázat po přerušení
+                state = "OK" if entry["status"] == "ok" else f"CHYBA ({entry['error']})"
+                print(f"  {os.path.basename(entry['path'])}: {state}")
+
+    # souhrnná tabulka ze všech hotových obrázků (v pořadí vstupu)
+    frames = []
+    for key in order:
+        entry = manifest["images"].get(key)
+        if entry and entry.get("status") == "ok":
+            t = Table.read_csv(entry["csv"])
+            name = os.path.basename(entry["path"])
+            frames.append(Table(["SOUBOR"] + t.columns, [[name] + r for r in t.rows]))
+    if frames:
+        combined = Table.concat(frames)
+        save_table(combined, os.path.join(out_dir, "combined.csv"), os.path.join(out_dir, "combined.json"))
+    if not jobs:
+        save_manifest(manifest_path, manifest)  # aktualizované "stat" u nezměněných souborů
+    failed = sum(1 for k in order if manifest["images"].get(k, {}).get("status") != "ok")
+    print(f"Batch hotov: {len(order) - failed} OK, {failed} chyb; výstupy v {out_dir}")
+    return manifest
+
+def watch_folder(spec: str, args, out_dir: str, workers: int = 1,
+                 interval: float = 1.0, settle: float = 2.0):
+    """
+    Sleduje složku (nebo glob) se skeny pollingem mtime/velikosti a nové či změněné
+    obrázky hned zpracuje přes run_batch (manifest => hotové se nepřepočítávají).
+    Soubor je "hotový" (dokopírovaný), když se jeho velikost ani mtime nezměnily
+    aspoň `settle` s od chvíle, kdy jsme je poprvé viděli (podle vlastních hodin, ne
+    podle mtime – kopírování s zachováním mtime by jinak vypadalo hned hotové).
+    Chyba jednoho průchodu (síťová složka, vadný soubor…) se vypíše a sleduje se dál;
+    ukončení Ctrl+C.
+    """
+    print(f"Sleduji {spec} (interval {interval} s), výstupy v {out_dir}; ukončení Ctrl+C")
+    seen, done = {}, {}  # cesta -> ((velikost, mtime_ns), od kdy beze změny) / (velikost, mtime_ns) naposledy zpracováno
+    try:
+        while True:
+            try:
+                now = time.monotonic()
+                current = {}
+                for p in collect_images(spec):
+                    try:
+                        st = os.stat(p)
+                    except (FileNotFoundError, PermissionError):
+                        continue  # smazaný mezi listdir a stat / ještě zamčený kopírováním
+                    sig = (st.st_size, st.st_mtime_ns)
+                    prev = seen.get(p)
+                    current[p] = (sig, prev[1] if prev and prev[0] == sig else now)
+                seen = current
+                ready = [p for p, (sig, since) in current.items() if since < now and now - since >= settle]
+                changed = [p for p in ready if done.get(p) != current[p][0]]
+                removed = [p for p in done if p not in current]
+                if changed or removed:
+                    t0 = time.perf_counter()
+                    print(f"{time.strftime('%H:%M:%S')} změny: {len(changed)} nových/změněných, {len(removed)} odebraných")
+                    run_batch(sorted(ready), args, out_dir, workers=workers)
+                    done = {p: current[p][0] for p in ready}
+                    print(f"{time.strftime('%H:%M:%S')} hotovo za {time.perf_counter() - t0:.1f} s")
+            except Exception as e:
+                # done se neaktualizuje => změny se zkusí znovu v dalším průchodu
+                print(f"{time.strftime('%H:%M:%S')} chyba průchodu: {type(e).__name__}: {e}")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Sledování ukončeno.")
+
 # -------- CLI --------
 
+def add_pipeline_args(ap: argparse.ArgumentParser):
+    """Volby pipeline sdílené CLI a benchmarkem (roster_benchmark.py)."""
+    ap.add_argument("--lang", default="eng", help="Jazyk pro Tesseract (např. 'ces' nebo 'ces+eng').")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Počet procesů pro OCR buněk, v batch režimu pro obrázky (1 = sériově, 0 = počet jader).")
+    ap.add_argument("--engine", default="auto", choices=["auto", "tesserocr", "pytesseract"],
+                    help="OCR engine: tesserocr (teplý in-process handle) nebo pytesseract (subprocess).")
+    ap.add_argument("--strip", action="store_true",
+                    help="OCR hlavičky a těla po celých řádcích (po buňkách jen nejednoznačné).")
+    ap.add_argument("--no-prefilter", action="store_true",
+                    help="Neposílat prázdné buňky mimo Tesseract (vypne prefiltr).")
+    ap.add_argument("--blank-ink", type=float, default=BLANK_INK,
+                    help="Max. hustota inkoustu (úlomky znaků, bez teček šumu) prázdné buňky (0..1).")
+    ap.add_argument("--blank-min-blob", type=int, default=BLANK_MIN_BLOB,
+                    help=f"Nejmenší komponenta v px, která se počítá jako znak (pro buňku {BLANK_REF_CELL} px; větší buňky úměrně ploše).")
+    ap.add_argument("--classifier", default=None,
+                    help="Model klasifikátoru zkratek (.npz); buňky těla s jistotou >= --clf-min-conf obejdou Tesseract.")
+    ap.add_argument("--clf-min-conf", type=float, default=0.8, help="Min. jistota klasifikátoru (0..1).")
+    ap.add_argument("--names", default=None,
+                    help="Seznam známých jmen (TXT jméno na řádek, nebo CSV/JSON se sloupcem JMENO); "
+                         "přečtené jméno se přichytí k nejbližšímu, re-OCR jen bez blízkého kandidáta.")
+    ap.add_argument("--names-min-score", type=float, default=NAME_MIN_SCORE,
+                    help="Min. podobnost (0..1) pro přichycení ke známému jménu.")
+    ap.add_argument("--color-codes", default=None,
+                    help='Paleta barevných směn (JSON, např. {"D": "#FFE699", "N": ["#9DC3E6"]}); '
+                         "buňky s jednoznačnou barvou dostanou zkratku bez Tesseractu.")
+    ap.add_argument("--color-confirm", action="store_true",
+                    help="S --color-codes pustit OCR i na obarvené buňky (barva jen doplní, co OCR nepřečte).")
+    ap.add_argument("--template", default=None,
+                    help="Šablona mřížky (.npz): když existuje, sken se na ni zaregistruje; jinak se do ní uloží detekovaná mřížka.")
+    ap.add_argument("--denoise", default="auto", choices=["auto", "none", "median", "bilateral", "nlm", "roi"],
+                    help="Odšum stránky: auto podle odhadu šumu; roi = odšumit jen výřezy buněk pro OCR.")
+    ap.add_argument("--table-crop", action="store_true",
+                    help="Najít tabulku na náhledu a zpracovat jen její výřez (okraje, logo, podpisy se přeskočí).")
+    ap.add_argument("--pyramid", type=int, default=0,
+                    help="Detekce čar na zmenšené úrovni pyramidy (počet úrovní, každá = 1/2) + zpřesnění v plném rozlišení; 0 = vypnuto.")
+    ap.add_argument("--retry-conf", type=float, default=RETRY_CONF,
+                    help="Buňky s jistotou OCR pod touto hranicí (0..100) se znovu čtou těžšími variantami; 0 = vypnout.")
+    ap.add_argument("--tiled", action="store_true",
+                    help="Paměťově omezený režim: šedé načtení, odšum/binarizace/čáry po pásech s překryvem.")
+    ap.add_argument("--max-memory-mb", type=float, default=0,
+                    help="Limit paměti na jeden proces v MB; při překročení odhadu se sám zapne --tiled. 0 = bez limitu.")
+
 def main():
     ap = argparse.ArgumentParser(description="Extrakce textu z tabulky (rozvrh) v obrázku pomocí OpenCV + Tesseract.")
-    ap.add_argument("image", help="Cesta k obrázku rozvrhu (JPG/PNG/PDF -> nejlépe nejprve převést na PNG).")
+    ap.add_argument("image", nargs="?", help="Cesta k obrázku rozvrhu (JPG/PNG/PDF -> nejlépe nejprve převést na PNG). "
+                                             "Složka nebo glob => batch režim.")
     ap.add_argument("--out", default="timetable.csv", help="CSV výstupní soubor.")
     ap.add_argument("--json", default="timetable.json", help="JSON výstupní soubor.")
-    ap.add_argument("--lang", default="eng", help="Jazyk pro Tesseract (např. 'ces' nebo 'ces+eng').")
+    ap.add_argument("--batch-out", default="batch_out",
+                    help="Batch režim: složka pro výstupy po obrázcích, combined.csv/json a manifest.json.")
+    ap.add_argument("--pipeline", action="store_true",
+                    help="Batch po fázích (načtení -> mřížka -> OCR -> zápis) ve vláknech s omezenými frontami; "
+                         "vypíše vytížení fází.")
+    ap.add_argument("--stage-workers", default=None, metavar="FÁZE=N,...",
+                    help="Vlákna pro fáze pipeline, např. 'load=1,prep=2,ocr=4,write=1' (výchozí ocr = --workers).")
+    ap.add_argument("--queue-size", type=int, default=2,
+                    help="Kapacita fronty mezi fázemi pipeline (víc = víc stránek v paměti).")
+    ap.add_argument("--watch", action="store_true",
+                    help="Sledovat složku/glob a nové či změněné skeny průběžně zpracovávat do --batch-out.")
+    ap.add_argument("--watch-interval", type=float, default=1.0, help="Interval kontroly složky v s.")
+    ap.add_argument("--watch-settle", type=float, default=2.0,
+                    help="Jak dlouho (s) se velikost a mtime souboru nesmí měnit, než se bere jako dokopírovaný.")
     ap.add_argument("--debug", default=None, help="Složka pro debug snímky (volitelné).")
+    ap.add_argument("--train-classifier", default=None, metavar="DEBUG_DIR",
+                    help="Natrénuje klasifikátor z výřezů v DEBUG_DIR (z běhu s --debug) a uloží do --classifier.")
+    ap.add_argument("--labels", default=None,
+                    help="Pro --train-classifier: opravené výstupní CSV jako popisky (jinak labels.json).")
+    add_pipeline_args(ap)
+    ap.add_argument("--bench-deskew", action="store_true",
+                    help="Jen porovná čas/úhel původního a rychlého deskew na zadaných obrázcích.")
+    ap.add_argument("--profile", action="store_true",
+                    help="Změří čas po fázích a latenci OCR po kategoriích buněk; report JSON vedle CSV.")
+    ap.add_argument("--cache", default=DEFAULT_CACHE_PATH, help="Soubor perzistentní OCR cache (sqlite).")
+    ap.add_argument("--cache-max-mb", type=float, default=256, help="Limit velikosti OCR cache v MB (LRU).")
+    ap.add_argument("--no-cache", action="store_true", help="Nepoužívat OCR cache.")
     args = ap.parse_args()
 
-    gray, cells = extract_grid_cells(args.image, debug_dir=args.debug)
-    # cells = run_ocr_on_cells(gray, cells, lang=args.lang, debug_dir=args.debug)
-    cells = run_ocr_on_cells(gray, cells, lang=args.lang, debug_dir=args.debug,
-                         header_row_idx=0, name_col_idx=0)
-    # df = cells_to_table(cells)
-    df = cells_to_table_zoned(cells, header_row_idx=0, name_col_idx=0)
+    if args.train_classifier:
+        if not args.classifier:
+            ap.error("--train-classifier potřebuje --classifier (kam uložit model)")
+        ShiftCodeClassifier.train_from_debug(args.train_classifier, args.labels).save(args.classifier)
+        print(f"Model uložen: {args.classifier}")
+        return
+    if not args.image:
+        ap.error("chybí cesta k obrázku")
+    if args.bench_deskew:
+        compare_deskew(collect_images(args.image) if is_batch_input(args.image) else [args.image])
+        return
+
+    set_engine(args.engine)
+    set_cache(None if args.no_cache else args.cache, args.cache_max_mb)
+    PROFILE.enabled = args.profile
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+    if args.pipeline:
+        try:
+            parse_stage_workers(args.stage_workers, workers)
+        except ValueError as e:
+            ap.error(str(e))
+
+    if args.watch:
+        if not is_batch_input(args.image):
+            ap.error("--watch potřebuje složku nebo glob")
+        watch_folder(args.image, args, args.batch_out, workers=workers,
+                     interval=args.watch_interval, settle=args.watch_settle)
+        return
+    if is_batch_input(args.image):
+        images = collect_images(args.image)
+        if not images:
+            ap.error(f"žádné obrázky: {args.image}")
+        run_batch(images, args, args.batch_out, workers=workers)
+        return
+
+    t0 = time.perf_counter()
+    df = process_image(args.image, args, workers=workers, debug_dir=args.debug)
 
     # Uložení
-    df.to_csv(args.out, index=False, encoding="utf-8-sig")
-    df.to_json(args.json, orient="records", force_ascii=False, indent=2)
+    save_table(df, args.out, args.json)
+    if PROFILE.enabled:
+        report = PROFILE.save(profile_path_for(args.out), total_s=time.perf_counter() - t0, image=args.image)
+        print(f"Profil: {profile_path_for(args.out)}")
+        for name, secs in sorted(report["stages_s"].items(), key=lambda kv: -kv[1]):
+            print(f"  {name:<18} {secs * 1000:8.1f} ms")
 
     # Vytiskneme malý náhled do konzole
     print("Hotovo ✅")
     print(f"Uloženo do: {args.out} a {args.json}")
-    with pd.option_context("display.max_colwidth", 40, "display.width", 120):
-        print(df.head(10))
+    rss = peak_rss_mb()
+    if rss is not None and (args.tiled or args.max_memory_mb > 0):
+        over = " – nad limitem!" if 0 < args.max_memory_mb < rss else ""
+        print(f"Špička paměti (RSS): {rss:.0f} MB{over}")
+    print(df.preview(10))
 
 if __name__ == "__main__":
+    # nutné pro procesový pool v exe z PyInstalleru (Windows)
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,291 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+import image_extract_v3 as ie
+
+# ===== Syntetické rozpisy =====
+# Generátor tabulek se známým obsahem (jména + zkratky z ALLOWED_BODY) a řízeným
+# poškozením (natočení, šum, rozmazání, rozlišení) => přesnost i rychlost pipeline
+# jde měřit proti ground truth a porovnávat mezi běhy.
+
+NAMES = ["Novák Jan", "Svobodová Eva", "Dvořák Petr", "Černá Lucie", "Procházka Tomáš",
+         "Kučerová Marie", "Veselý Jiří", "Horáková Jana", "Němec Pavel", "Marková Tereza",
+         "Pokorný Martin", "Růžičková Anna", "Beneš Lukáš", "Fialová Kateřina", "Šťastný Ondřej",
+         "Kolářová Věra", "Zeman Karel", "Říhová Zdeňka", "Doležal Aleš", "Šimková Ivana"]
+CODES = sorted(ie.ALLOWED_BODY)
+
+FONT_CANDIDATES = ["DejaVuSans.ttf", "arial.ttf", "Arial.ttf", "LiberationSans-Regular.ttf",
+                   "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"]
+
+def load_font(size: int):
+    for name in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default(size=size)
+
+def render_roster(people: int = 20, days: int = 31, seed: int = 0, fill: float = 0.5,
+                  cell_w: int = 34, cell_h: int = 30, name_w: int = 210,
+                  skew: float = 0.0, noise: float = 0.0, blur: float = 0.0, scale: float = 1.0,
+                  lines: bool = True, colors: Optional[dict] = None, shift: Tuple[int, int] = (0, 0)):
+    """
+    Vykreslí rozpis people x days. Vrací (BGR obrázek, truth), kde truth je tabulka ve
+    tvaru výstupu cells_to_table_zoned: {"columns": [...], "rows": [[jméno, zkratky...], ...]}.
+    fill = podíl neprázdných buněk těla; lines=False => bez čar mřížky (fallback detekce).
+    colors = {zkratka: "#RRGGBB"} => buňky s těmito zkratkami mají barevné pozadí (--color-codes).
+    shift = (dx, dy) v px => posunutý/oříznutý list (jiné okraje skenu, test registrace na šablonu).
+    """
+    rnd = random.Random(seed)
+    margin = 60
+    W = margin * 2 + name_w + days * cell_w
+    H = margin * 2 + (people + 1) * cell_h
+    img = Image.new("RGB" if colors else "L", (W, H), "white")
+    draw = ImageDraw.Draw(img)
+    font = load_font(int(cell_h * 0.55))
+
+    xs = [margin, margin + name_w] + [margin + name_w + (d + 1) * cell_w for d in range(days)]
+    ys = [margin + r * cell_h for r in range(people + 2)]
+    for y in ys if lines else []:
+        draw.line([(xs[0], y), (xs[-1], y)], fill="black", width=2)
+    for x in xs if lines else []:
+        draw.line([(x, ys[0]), (x, ys[-1])], fill="black", width=2)
+
+    def put(text, x1, x2, y1, left=False):
+        bx = draw.textbbox((0, 0), text, font=font)
+        tw, th = bx[2] - bx[0], bx[3] - bx[1]
+        tx = x1 + 6 if left else x1 + (x2 - x1 - tw) // 2
+        draw.text((tx - bx[0], y1 + (cell_h - th) // 2 - bx[1]), text, fill="black", font=font)
+
+    for d in range(days):
+        put(str(d + 1), xs[d + 1], xs[d + 2], ys[0])
+    names = [NAMES[i % len(NAMES)] for i in range(people)]
+    rows = []
+    for r, name in enumerate(names):
+        put(name, xs[0], xs[1], ys[r + 1], left=True)
+        row = [name]
+        for d in range(days):
+            code = rnd.choice(CODES) if rnd.random() < fill else ""
+            if code and colors and code in colors:
+                draw.rectangle([xs[d + 1] + 2, ys[r + 1] + 2, xs[d + 2] - 1, ys[r + 2] - 1], fill=colors[code])
+            if code:
+                put(code, xs[d + 1], xs[d + 2], ys[r + 1])
+            row.append(code)
+        rows.append(row)
+
+    arr = np.array(img)
+    if scale != 1.0:
+        arr = cv2.resize(arr, None, fx=scale, fy=scale,
+                         interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+    if skew:
+        h, w = arr.shape[:2]
+        M = cv2.getRotationMatrix2D((w // 2, h // 2), skew, 1.0)
+        arr = cv2.warpAffine(arr, M, (w, h), flags=cv2.INTER_LINEAR, borderValue=(255, 255, 255))
+    if any(shift):
+        h, w = arr.shape[:2]
+        M = np.float32([[1, 0, shift[0]], [0, 1, shift[1]]])
+        arr = cv2.warpAffine(arr, M, (w, h), flags=cv2.INTER_NEAREST, borderValue=(255, 255, 255))
+    if blur:
+        arr = cv2.GaussianBlur(arr, (0, 0), blur)
+    if noise:
+        nr = np.random.default_rng(seed)
+        arr = np.clip(arr.astype(np.float32) + nr.normal(0, noise, arr.shape), 0, 255).astype(np.uint8)
+    truth = {"columns": ["JMENO"] + [str(d + 1) for d in range(days)], "rows": rows}
+    return cv2.cvtColor(arr, cv2.COLOR_RGB2BGR if colors else cv2.COLOR_GRAY2BGR), truth
+
+# předdefinované scénáře (parametry render_roster)
+CASES = {
+    "clean":   {},
+    "skew":    {"skew": 1.5},
+    "noisy":   {"noise": 18.0},
+    "blurred": {"blur": 1.2},
+    "lowres":  {"scale": 0.7},
+    "hires":   {"scale": 2.0},
+    "photo":   {"skew": -1.0, "noise": 12.0, "blur": 0.8, "scale": 1.5},
+    "nolines": {"lines": False, "noise": 8.0},
+    # barevné pozadí směn; stejnou paletu (jako JSON) předat benchmarku přes --color-codes
+    "colored": {"colors": {"D": "#FFE699", "N": "#9DC3E6", "R": "#A9D08E", "DO": "#F4B183"},
+                "skew": 0.8, "noise": 6.0},
+    # "template": nejdřív se z rovného listu (jiný seed) uloží šablona mřížky, pak se na ni
+    # registruje posunutý a mírně pootočený list; v counters má být template_registered
+    "template": {"template": True, "shift": (30, -22), "skew": 0.5, "noise": 6.0},
+}
+
+# ===== Vyhodnocení =====
+
+def score_table(df: Optional[ie.Table], truth: dict) -> dict:
+    """Přesnost po buňkách proti ground truth (poziční srovnání; chybějící = chyba)."""
+    stats = {"header": [0, 0], "name": [0, 0], "body": [0, 0], "body_nonblank": [0, 0]}
+    got_cols = [str(c) for c in df.columns] if df is not None else []
+    for i, col in enumerate(truth["columns"][1:], start=1):
+        stats["header"][1] += 1
+        stats["header"][0] += int(i < len(got_cols) and got_cols[i] == col)
+    values = df.rows if df is not None else []
+    for r, row in enumerate(truth["rows"]):
+        got = values[r] if r < len(values) else []
+        for c, want in enumerate(row):
+            have = got[c].strip() if c < len(got) else None
+            key = "name" if c == 0 else "body"
+            stats[key][1] += 1
+            stats[key][0] += int(have == want)
+            if key == "body" and want:
+                stats["body_nonblank"][1] += 1
+                stats["body_nonblank"][0] += int(have == want)
+    out = {k: round(ok / n, 4) if n else None for k, (ok, n) in stats.items()}
+    ok_all = sum(v[0] for k, v in stats.items() if k != "body_nonblank")
+    n_all = sum(v[1] for k, v in stats.items() if k != "body_nonblank")
+    out["overall"] = round(ok_all / n_all, 4) if n_all else None
+    return out
+
+def run_case(name: str, params: dict, args, workers: int, tmp_dir: str) -> dict:
+    render = {k: v for k, v in params.items() if k != "template"}
+    if params.get("template"):
+        # referenční list => šablona; měřený běh pak jede přes registraci na ni
+        tpl_path = os.path.join(tmp_dir, f"{name}_template.npz")
+        if os.path.exists(tpl_path):
+            os.remove(tpl_path)
+        ref, _ = render_roster(people=args.people, days=args.days, seed=args.seed + 1)
+        ref_path = os.path.join(tmp_dir, f"{name}_ref.png")
+        cv2.imwrite(ref_path, ref)
+        args = argparse.Namespace(**{**vars(args), "template": tpl_path})
+        ie.process_image(ref_path, args, workers=workers)
+    img, truth = render_roster(people=args.people, days=args.days, seed=args.seed, **render)
+    path = os.path.join(tmp_dir, f"{name}.png")
+    cv2.imwrite(path, img)
+
+    ie.PROFILE.enabled = True
+    ie.PROFILE.reset()
+    t0 = time.perf_counter()
+    try:
+        df = ie.process_image(path, args, workers=workers)
+        error = None
+    except Exception as e:  # i selhání detekce je výsledek benchmarku
+        df, error = None, f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - t0
+    n_cells = (len(truth["rows"]) + 1) * len(truth["columns"])
+    prof = ie.PROFILE.report()
+    return {"case": name, "params": params, "image": list(img.shape[:2]), "seconds": round(elapsed, 3),
+            "cells": n_cells, "cells_per_s": round(n_cells / elapsed, 1), "error": error,
+            "accuracy": score_table(df, truth), "stages_s": prof["stages_s"],
+            "ocr": {k: {"count": v["count"], "mean_ms": v["mean_ms"]} for k, v in prof["ocr"].items()},
+            "counters": prof["counters"]}
+
+STARTUP_BUDGET_S = 0.25  # rozpočet na start CLI (image_extract_v3.py --help)
+
+def measure_startup(runs: int = 5) -> dict:
+    """
+    Čas startu CLI (nový interpret + import + --help) a samotného importu modulu;
+    medián z `runs` běhů v podprocesech, aby se neměřil už naimportovaný modul.
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(ie.__file__)), "image_extract_v3.py")
+    cmds = {"help_s": [sys.executable, script, "--help"],
+            "import_s": [sys.executable, "-c", "import image_extract_v3"],
+            "python_s": [sys.executable, "-c", "pass"]}
+    out = {}
+    for key, cmd in cmds.items():
+        times = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            subprocess.run(cmd, cwd=os.path.dirname(script), stdout=subprocess.DEVNULL, check=True)
+            times.append(time.perf_counter() - t0)
+        out[key] = round(float(np.median(times)), 4)
+    return out
+
+def compare_runs(current: dict, previous: dict):
+    prev = {r["case"]: r for r in previous["results"]}
+    print(f"\nSrovnání s {previous['started']}:")
+    for r in current["results"]:
+        p = prev.get(r["case"])
+        if not p:
+            continue
+        acc, pacc = r["accuracy"]["overall"] or 0, p["accuracy"]["overall"] or 0
+        print(f"  {r['case']:<8} cells/s {p['cells_per_s']:>7} -> {r['cells_per_s']:>7} "
+              f"({r['cells_per_s'] / max(p['cells_per_s'], 1e-9):.2f}x), "
+              f"přesnost {pacc:.3f} -> {acc:.3f} ({acc - pacc:+.3f})")
+    if current.get("startup") and previous.get("startup"):
+        print(f"  start CLI {previous['startup']['help_s']:.3f} s -> {current['startup']['help_s']:.3f} s")
+
+def latest_run(runs_dir: str, exclude: Optional[str] = None) -> Optional[str]:
+    if not os.path.isdir(runs_dir):
+        return None
+    files = sorted(f for f in os.listdir(runs_dir) if f.endswith(".json") and f != exclude)
+    return os.path.join(runs_dir, files[-1]) if files else None
+
+# ===== CLI =====
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark OCR pipeline na syntetických rozpisech (rychlost + přesnost).")
+    ap.add_argument("--cases", default=",".join(CASES), help=f"Scénáře oddělené čárkou: {', '.join(CASES)}.")
+    ap.add_argument("--people", type=int, default=20)
+    ap.add_argument("--days", type=int, default=31)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--runs-dir", default="bench_runs", help="Kam ukládat výsledky běhů (JSON).")
+    ap.add_argument("--compare", default="latest",
+                    help="Běh pro srovnání: cesta k JSON, 'latest' = poslední uložený, 'none' = nesrovnávat.")
+    ap.add_argument("--keep-images", default=None, help="Složka pro uložení vygenerovaných obrázků.")
+    ap.add_argument("--startup-runs", type=int, default=5, help="Počet měření startu CLI (0 = neměřit).")
+    ap.add_argument("--startup-budget", type=float, default=STARTUP_BUDGET_S,
+                    help="Rozpočet na start CLI v s; překročení = nenulový exit kód.")
+    ie.add_pipeline_args(ap)  # stejné volby pipeline jako image_extract_v3
+    ap.add_argument("--cache", default=None, help="OCR cache (výchozí vypnutá, aby měření nebylo zkreslené).")
+    args = ap.parse_args()
+
+    names = [c.strip() for c in args.cases.split(",") if c.strip()]
+    unknown = [c for c in names if c not in CASES]
+    if unknown:
+        ap.error(f"neznámé scénáře: {', '.join(unknown)}")
+
+    ie.set_engine(args.engine)
+    ie.set_cache(args.cache)
+    workers = args.workers if args.workers > 0 else (os.cpu_count() or 1)
+
+    run = {"started": datetime.now().isoformat(timespec="seconds"),
+           "options": {k: v for k, v in vars(args).items() if k not in ("runs_dir", "compare", "keep_images")},
+           "engine": ie.get_engine().name, "results": []}
+    over_budget = False
+    if args.startup_runs > 0:
+        run["startup"] = measure_startup(args.startup_runs)
+        over_budget = run["startup"]["help_s"] > args.startup_budget
+        print(f"Start CLI: --help {run['startup']['help_s']:.3f} s, import {run['startup']['import_s']:.3f} s "
+              f"(samotný python {run['startup']['python_s']:.3f} s), rozpočet {args.startup_budget:.3f} s"
+              + ("  PŘEKROČENO" if over_budget else ""))
+    with tempfile.TemporaryDirectory() as tmp:
+        img_dir = args.keep_images or tmp
+        os.makedirs(img_dir, exist_ok=True)
+        for name in names:
+            res = run_case(name, CASES[name], args, workers, img_dir)
+            run["results"].append(res)
+            acc = res["accuracy"]
+            print(f"{name:<8} {res['image'][1]}x{res['image'][0]}  {res['seconds']:7.2f} s  "
+                  f"{res['cells_per_s']:8.1f} buněk/s  přesnost {acc['overall']}  "
+                  f"(hlavička {acc['header']}, jména {acc['name']}, tělo {acc['body']})"
+                  + (f"  CHYBA {res['error']}" if res["error"] else ""))
+
+    os.makedirs(args.runs_dir, exist_ok=True)
+    fname = f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(os.path.join(args.runs_dir, fname), "w", encoding="utf-8") as f:
+        json.dump(run, f, ensure_ascii=False, indent=2)
+    print(f"Uloženo: {os.path.join(args.runs_dir, fname)}")
+
+    prev_path = latest_run(args.runs_dir, exclude=fname) if args.compare == "latest" else (
+        None if args.compare == "none" else args.compare)
+    if prev_path and os.path.exists(prev_path):
+        with open(prev_path, encoding="utf-8") as f:
+            compare_runs(run, json.load(f))
+    if over_budget:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
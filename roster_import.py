@@ -0,0 +1,212 @@
+import argparse
+import calendar
+import csv
+import json
+import re
+import unicodedata
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+# ===== Import OCR rozpisu do kalendáře =====
+# Výstup image_extract_v3 (CSV/JSON: JMENO + sloupce dní 1..31 se zkratkami) ->
+# měsíční JSON ve formátu calendar_manager_gui (data/internal/calendar_<m>_<y>.json)
+# + volitelně ICS (data/calendars/...), pro jednoho člověka nebo celý tým najednou.
+
+TZ = ZoneInfo("Europe/Prague")
+
+# typy směn a časy stejně jako v calendar_manager_gui (Month_handler.export_data)
+SHIFT_TYPES = ["Denní", "Noční", "Ranní/ stacionář", "Volno", "Dovolená", "Osobní volno"]
+SHIFT_TIMES = {"Denní": ("07:00", "19:00"), "Noční": ("19:00", "07:00"), "Ranní/ stacionář": ("07:00", "15:00")}
+
+# zkratka z rozpisu -> typ směny; None = přeskočit (volno se do kalendáře neukládá)
+CODE_MAP = {"D": "Denní", "N": "Noční", "R": "Ranní/ stacionář", "DO": "Dovolená", "OV": "Osobní volno",
+            "V": None, "/": None}
+# zkratky bez ekvivalentu v GUI (SC, PN, O, SV): přeskočí se s varováním, lze namapovat přes --map
+
+NAME_COLS = ("JMENO",)
+IGNORED_COLS = ("SOUBOR",)
+
+def fold(s: str) -> str:
+    """Porovnávací tvar jména: bez diakritiky, malá písmena, jednoduché mezery."""
+    s = unicodedata.normalize("NFKD", s)
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    return " ".join(s.lower().split())
+
+def slugify(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", fold(name)).strip("_") or "bez_jmena"
+
+def load_roster(path: str) -> list:
+    """Načte CSV (utf-8-sig) nebo JSON (orient=records) z image_extract_v3 jako list dictů."""
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+    return [{str(k): ("" if v is None else str(v)).strip() for k, v in r.items()} for r in rows]
+
+def parse_map(items: list) -> dict:
+    """--map KOD=Typ (Typ z SHIFT_TYPES nebo 'skip')."""
+    mapping = dict(CODE_MAP)
+    for item in items or []:
+        if "=" not in item:
+            raise ValueError(f"--map čeká KOD=Typ, dostal: {item}")
+        code, target = (p.strip() for p in item.split("=", 1))
+        if target.lower() == "skip":
+            mapping[code.upper()] = None
+        elif target in SHIFT_TYPES:
+            mapping[code.upper()] = target
+        else:
+            raise ValueError(f"neznámý typ směny '{target}' (povolené: {', '.join(SHIFT_TYPES)}, skip)")
+    return mapping
+
+def person_shifts(row: dict, year: int, month: int, mapping: dict, warnings: list) -> list:
+    """Řádek rozpisu -> seznam směn ve formátu GUI: 'YYYY-MM-DD,start,konec,Typ'."""
+    n_days = calendar.monthrange(year, month)[1]
+    name = row.get("JMENO", "")
+    shifts = []
+    for col, code in row.items():
+        if not col.isdigit() or not code:
+            continue
+        day = int(col)
+        if not 1 <= day <= n_days:
+            warnings.append(f"{name}: den {day} mimo {month}/{year}, přeskočeno")
+            continue
+        code = code.upper()
+        if code not in mapping:
+            warnings.append(f"{name}: {day}. zkratka '{code}' nemá typ směny, přeskočeno (viz --map)")
+            continue
+        shift_type = mapping[code]
+        if shift_type is None or shift_type == "Volno":
+            continue  # volno GUI do JSON neukládá
+        start, end = SHIFT_TIMES.get(shift_type, ("", ""))
+        shifts.append((day, f"{year:04d}-{month:02d}-{day:02d},{start},{end},{shift_type}"))
+    return [s for _, s in sorted(shifts)]
+
+def ics_escape(text: str) -> str:
+    return (text
+            .replace("\\", "\\\\")
+            .replace(";", r"\;")
+            .replace(",", r"\,")
+            .replace("\n", r"\n"))
+
+def make_ics(shifts: list, all_day: bool = False) -> str:
+    """ICS ve stejném tvaru jako calendar_manager_gui.generate_ics."""
+    dtstamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    events = []
+    for line in shifts:
+        parts = [p.strip() for p in line.split(",")]
+        d = datetime.strptime(parts[0], "%Y-%m-%d").date()
+        start_s, end_s, summary = parts[1], parts[2], parts[3]
+        ev = ["BEGIN:VEVENT", f"UID:{uuid.uuid4()}@json-calendar", f"DTSTAMP:{dtstamp}"]
+        if not start_s or all_day:
+            ev += [f"DTSTART;VALUE=DATE:{d.strftime('%Y%m%d')}",
+                   f"DTEND;VALUE=DATE:{(d + timedelta(days=1)).strftime('%Y%m%d')}"]  # neinkluzivní
+        else:
+            h1, m1 = map(int, start_s.split(":"))
+            h2, m2 = map(int, end_s.split(":"))
+            start_local = datetime(d.year, d.month, d.day, h1, m1, tzinfo=TZ)
+            end_local = datetime(d.year, d.month, d.day, h2, m2, tzinfo=TZ)
+            if end_local <= start_local:  # směna přes půlnoc
+                end_local += timedelta(days=1)
+            ev += [f"DTSTART;TZID=Europe/Prague:{start_local.strftime('%Y%m%dT%H%M%S')}",
+                   f"DTEND;TZID=Europe/Prague:{end_local.strftime('%Y%m%dT%H%M%S')}"]
+        ev += [f"SUMMARY:{ics_escape(summary)}", "END:VEVENT"]
+        events.append("\r\n".join(ev))
+    return "\r\n".join([
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//Calendar JSON to ICS//CZ//",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        *events,
+        "END:VCALENDAR",
+        ""
+    ])
+
+def write_month(dump_dir: Path, year: int, month: int, shifts: list, ics: bool, all_day: bool,
+                force: bool) -> bool:
+    """Zapíše internal/calendar_<m>_<y>.json (+ calendars/...ics) pod dump_dir; False = existuje."""
+    json_path = dump_dir / "internal" / f"calendar_{month}_{year}.json"
+    if json_path.exists() and not force:
+        print(f"  {json_path} už existuje, přeskočeno (přepsat: --force)")
+        return False
+    json_path.parent.mkdir(parents=True, exist_ok=True)
+    with json_path.open("w", encoding="utf-8") as f:
+        json.dump({"year_and_month": f"{year:04d}-{month:02d}", "shifts": shifts}, f,
+                  ensure_ascii=False, indent=4)
+    print(f"  {json_path}: {len(shifts)} směn")
+    if ics:
+        ics_path = dump_dir / "calendars" / f"calendar_{month}_{year}.ics"
+        ics_path.parent.mkdir(parents=True, exist_ok=True)
+        # newline="" => CRLF z make_ics zůstanou beze změny i na Windows
+        with ics_path.open("w", encoding="utf-8", newline="") as f:
+            f.write(make_ics(shifts, all_day))
+        print(f"  {ics_path}")
+    return True
+
+def main():
+    ap = argparse.ArgumentParser(description="Import rozpisu z OCR (image_extract_v3) do dat calendar_manageru.")
+    ap.add_argument("table", help="CSV nebo JSON z image_extract_v3 (JMENO + sloupce dní).")
+    ap.add_argument("--month", required=True, help="Měsíc rozpisu ve tvaru RRRR-MM.")
+    who = ap.add_mutually_exclusive_group(required=True)
+    who.add_argument("--person", help="Jméno člověka (bez ohledu na diakritiku/velikost) => zápis přímo do --dump-dir.")
+    who.add_argument("--all", action="store_true", help="Všichni z rozpisu => <dump-dir>/<jmeno>/internal/...")
+    ap.add_argument("--dump-dir", default="data", help="Kořen dat kalendáře (jako dump_dir v GUI).")
+    ap.add_argument("--ics", action="store_true", help="Vygenerovat i ICS do calendars/.")
+    ap.add_argument("--all-day", action="store_true", help="V ICS všechny události jako celodenní.")
+    ap.add_argument("--map", action="append", metavar="KOD=Typ",
+                    help="Vlastní mapování zkratky, např. SC=Dovolená nebo PN=skip (lze opakovat).")
+    ap.add_argument("--force", action="store_true", help="Přepsat existující měsíční JSON.")
+    args = ap.parse_args()
+
+    try:
+        year, month = (int(p) for p in args.month.split("-"))
+        if not 1 <= month <= 12:
+            raise ValueError
+    except ValueError:
+        ap.error(f"--month čeká RRRR-MM, dostal: {args.month}")
+    try:
+        mapping = parse_map(args.map)
+    except ValueError as e:
+        ap.error(str(e))
+
+    rows = load_roster(args.table)
+    rows = [r for r in rows if any(r.get(c) for c in NAME_COLS)]
+    if not rows:
+        raise SystemExit(f"V {args.table} nejsou žádné řádky se jménem (sloupec JMENO).")
+    odd = sorted({c for r in rows for c in r if not c.isdigit() and c not in NAME_COLS + IGNORED_COLS})
+    if odd:
+        print(f"Varování: sloupce bez čísla dne se ignorují: {', '.join(odd)}")
+
+    if args.person:
+        wanted = fold(args.person)
+        rows = [r for r in rows if fold(r["JMENO"]) == wanted]
+        if not rows:
+            raise SystemExit(f"'{args.person}' v rozpisu není.")
+        if len(rows) > 1:
+            print(f"Varování: '{args.person}' je v rozpisu {len(rows)}x, použit první řádek.")
+        targets = [(rows[0], Path(args.dump_dir))]
+    else:
+        targets, used = [], {}
+        for r in rows:
+            slug = slugify(r["JMENO"])
+            used[slug] = used.get(slug, 0) + 1
+            if used[slug] > 1:
+                print(f"Varování: '{r['JMENO']}' je v rozpisu víckrát, další výskyt jako {slug}_{used[slug]}")
+                slug = f"{slug}_{used[slug]}"
+            targets.append((r, Path(args.dump_dir) / slug))
+
+    warnings, written = [], 0
+    for row, dump_dir in targets:
+        print(row["JMENO"])
+        shifts = person_shifts(row, year, month, mapping, warnings)
+        written += write_month(dump_dir, year, month, shifts, args.ics, args.all_day, args.force)
+    for w in warnings:
+        print(f"Varování: {w}")
+    print(f"Hotovo: {written}/{len(targets)} kalendářů zapsáno.")
+
+if __name__ == "__main__":
+    main()
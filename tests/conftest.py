@@ -0,0 +1,5 @@
+import os
+import sys
+
+# skripty leží v kořeni repa (bez balíčku) => import image_extract_v3 / roster_import odtud
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
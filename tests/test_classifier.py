@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+import pytest
+
+import image_extract_v3 as ie
+
+CODES = ["D", "N", "R", "DO", "SC", "V"]
+
+
+def _glyph(code, rng):
+    # výřez buňky jako z binárky: bílé pozadí, kód s náhodným písmem, tloušťkou a posunem
+    img = np.full((30, 34), 255, np.uint8)
+    font = [cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX][int(rng.integers(2))]
+    scale = float(rng.uniform(0.45, 0.6))
+    (tw, th), _ = cv2.getTextSize(code, font, scale, 1)
+    x = (34 - tw) // 2 + int(rng.integers(-2, 3))
+    y = (30 + th) // 2 + int(rng.integers(-2, 3))
+    cv2.putText(img, code, (x, y), font, scale, 0, int(rng.integers(1, 3)), cv2.LINE_AA)
+    return img
+
+
+def _samples(n, seed):
+    rng = np.random.default_rng(seed)
+    labels = [CODES[i % len(CODES)] for i in range(n)]
+    return [_glyph(code, rng) for code in labels], labels
+
+
+@pytest.mark.parametrize("name", ["codes.npz", "codes.clf"])
+def test_save_load_round_trip(tmp_path, name):
+    imgs, labels = _samples(120, seed=0)
+    clf = ie.ShiftCodeClassifier(np.stack([ie.glyph_features(im) for im in imgs]), labels, k=3)
+    test_imgs, test_labels = _samples(36, seed=1)
+    test_imgs.append(np.full((30, 34), 255, np.uint8))  # prázdná buňka
+    before = clf.predict(test_imgs)
+
+    path = tmp_path / name
+    clf.save(str(path))
+    assert [p.name for p in tmp_path.iterdir()] == [name]  # žádná přidaná přípona .npz
+    loaded = ie.ShiftCodeClassifier.load(str(path))
+
+    assert loaded.k == clf.k and loaded.reject_dist == pytest.approx(clf.reject_dist)
+    assert list(loaded.labels) == list(clf.labels)
+    after = loaded.predict(test_imgs)
+    assert [t for t, _ in after] == [t for t, _ in before]
+    assert [c for _, c in after] == pytest.approx([c for _, c in before], abs=1e-4)
+    assert after[-1] == ("", 1.0)
+    # a klasifikátor se opravdu něco naučil (jinak by shoda po načtení nic neznamenala)
+    assert np.mean([t == y for (t, _), y in zip(after, test_labels)]) >= 0.9
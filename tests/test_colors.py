@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+import image_extract_v3 as ie
+
+PALETTE = {"D": "#FFE699", "N": ["#9DC3E6", "#BDD7EE"], "R": "#A9D08E"}
+
+
+def _bgr(hexcol):
+    h = hexcol.lstrip("#")
+    return int(h[4:6], 16), int(h[2:4], 16), int(h[0:2], 16)
+
+
+def _sheet(fills, cell=40):
+    """Jeden řádek buněk s čarami mřížky; fills = barva (#RRGGBB) nebo None = bílá."""
+    img = np.full((cell, cell * len(fills), 3), 255, np.uint8)
+    cells = []
+    for i, fill in enumerate(fills):
+        if fill:
+            img[:, i * cell:(i + 1) * cell] = _bgr(fill)
+        img[:, i * cell] = 0
+        cells.append(ie.Cell(r=1, c=i + 1, bbox=(i * cell, 0, cell, cell)))
+    img[[0, -1]] = 0
+    return img, cells
+
+
+def test_cell_colors_match_palette():
+    pal = ie.ColorPalette(PALETTE)
+    img, cells = _sheet(["#FFE699", "#BDD7EE", "#9DC3E6", "#A9D08E", None, "#D9D9D9", "#FF0000"])
+    ie.cell_colors(cells, img, img.shape[:2], np.eye(3))
+    assert [pal.match(c.color) for c in cells] == ["D", "N", "N", "R", None, None, None]
+    assert cells[4].color[0] == 0.0  # bílá => žádné barevné pixely
+    assert cells[0].color[0] > 0.95
+
+
+def test_cell_colors_maps_through_to_src():
+    # buňky v souřadnicích výřezu (posun 60, 20) a náhled originálu v polovičním rozlišení
+    pal = ie.ColorPalette(PALETTE)
+    img, cells = _sheet(["#A9D08E", None, "#FFE699"])
+    page = np.full((200, 300, 3), 255, np.uint8)
+    page[20:60, 60:180] = img
+    thumb = page[::2, ::2].copy()
+    to_src = np.array([[1.0, 0, 60], [0, 1.0, 20], [0, 0, 1.0]])
+    ie.cell_colors(cells, thumb, page.shape[:2], to_src)
+    assert [pal.match(c.color) for c in cells] == ["R", None, "D"]
+
+
+def test_match_requires_cover_distance_and_margin():
+    pal = ie.ColorPalette({"D": "#FFE699", "DO": "#FFD966"})  # dvě podobné žluté
+    a, b = pal.ab.mean(axis=0)
+    assert pal.match((1.0, a, b)) is None                     # uprostřed mezi nimi => nejednoznačné
+    assert pal.match((1.0,) + tuple(pal.ab[0])) == "D"
+    assert pal.match((0.1,) + tuple(pal.ab[0])) is None       # málo barevných pixelů
+    assert pal.match((1.0, -60.0, -60.0)) is None             # daleko od všech barev
+    assert pal.match(None) is None
+
+
+def test_palette_validation(capsys):
+    with pytest.raises(ValueError):
+        ie.ColorPalette({"X": "#FFE699"})          # není v ALLOWED_BODY
+    with pytest.raises(ValueError):
+        ie.ColorPalette({"D": "yellow"})
+    pal = ie.ColorPalette({"d": "#ffe699", "V": "#F2F2F2"})
+    assert pal.codes == ["D"]                      # šedá se přeskočí s varováním
+    assert "skoro šedá" in capsys.readouterr().out
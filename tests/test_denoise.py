@@ -0,0 +1,44 @@
+import cv2
+import numpy as np
+import pytest
+
+import image_extract_v3 as ie
+import roster_benchmark as rb
+
+
+def _gray(**render):
+    img, _ = rb.render_roster(people=8, days=14, **render)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+
+@pytest.mark.parametrize("render", [{}, {"fill": 0.9}, {"cell_w": 22, "cell_h": 20, "name_w": 150},
+                                    {"scale": 2.0}, {"skew": 1.5}])
+def test_clean_pages_estimate_no_noise(render):
+    # hustota textu ani velikost buněk nesmí vypadat jako šum
+    assert ie.estimate_noise(_gray(**render)) < ie.NOISE_LOW / 4
+
+
+@pytest.mark.parametrize("sigma", [3.0, 6.0, 10.0])
+def test_estimate_matches_known_sigma(sigma):
+    # papír pod 255, ať se šum neořezává
+    g = _gray().astype(np.float32) * 0.8 + 25
+    noisy = np.clip(g + np.random.default_rng(0).normal(0, sigma, g.shape), 0, 255).astype(np.uint8)
+    assert ie.estimate_noise(noisy) == pytest.approx(sigma, rel=0.1)
+
+
+def _blank_recall(tmp_path, denoise, **render):
+    img, truth = rb.render_roster(people=8, days=14, **render)
+    path = str(tmp_path / "page.png")
+    cv2.imwrite(path, img)
+    gray, cells = ie.extract_grid_cells(path, denoise=denoise)
+    bw = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2)
+    body = [c for c in cells if c.r > 0 and c.c > 0]
+    blank = np.array([truth["rows"][c.r - 1][c.c] == "" for c in body])
+    return int((ie.blank_cell_mask(bw, body) & blank).sum())
+
+
+@pytest.mark.parametrize("render", [{"noise": 1.0}, {"noise": 2.0}, {"noise": 3.0}, {"noise": 5.0},
+                                    {"noise": 8.0}, {"noise": 2.0, "scale": 1.25, "seed": 1}])
+def test_auto_binarizes_no_worse_than_nlm(tmp_path, render):
+    # prázdné buňky v binárce po auto odšumu: aspoň tolik jako po plném NL-means
+    assert _blank_recall(tmp_path, "auto", **render) >= _blank_recall(tmp_path, "nlm", **render)
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import image_extract_v3 as ie
+
+
+def sort_with_tolerance(values, tol=10):
+    # původní helper, který find_lines nahradil (zůstává jen jako reference pro test)
+    values = sorted(values)
+    groups = []
+    for v in values:
+        if not groups or abs(v - groups[-1][-1]) > tol:
+            groups.append([v])
+        else:
+            groups[-1].append(v)
+    return [int(np.median(g)) for g in groups]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_matches_old_grouping(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 400))
+    # řídké i husté profily: osamělé pixely, tlusté čáry, shluky blízko u sebe
+    profile = np.where(rng.random(n) < rng.uniform(0.02, 0.6), rng.integers(1, 256, n), 0).astype(np.int64)
+    for tol in (1, 2, 3, 5, 8, 12, 30):
+        pos, thickness, strength = ie.find_lines(profile, tol=tol, min_rel_strength=0)
+        expected = sort_with_tolerance(np.flatnonzero(profile).tolist(), tol=tol)
+        assert pos.tolist() == expected
+        assert len(thickness) == len(strength) == len(expected)
+
+
+def test_empty_profile():
+    pos, thickness, strength = ie.find_lines(np.zeros(50), tol=3)
+    assert len(pos) == len(thickness) == len(strength) == 0
+
+
+def test_rejects_zero_tolerance():
+    # stará verze by při tol=0 rozdělila každou čáru po pixelech => tol=0 nedává smysl
+    with pytest.raises(ValueError):
+        ie.find_lines(np.ones(10), tol=0)
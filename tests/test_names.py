@@ -0,0 +1,63 @@
+import itertools
+
+import image_extract_v3 as ie
+
+NAMES = ["Nováková Eva", "Novák Jan", "Dvořáková Marie", "Černý Tomáš", "Procházka Petr"]
+
+
+def test_snaps_ocr_errors_diacritics_and_word_order():
+    index = ie.NameIndex(NAMES)
+    assert index.match("Novakova Eva") == ("Nováková Eva", 1.0)   # bez diakritiky
+    assert index.match("NOVÁKOVÁ  EVA.")[0] == "Nováková Eva"     # velikost, mezery, interpunkce
+    assert index.match("Dvorakova Marle")[0] == "Dvořáková Marie" # OCR záměna i -> l
+    assert index.match("Tomáš Černý") == ("Černý Tomáš", 1.0)     # prohozené pořadí
+    name, score = index.match("Prochazka Petr")
+    assert name == "Procházka Petr" and score == 1.0
+
+
+def test_rejects_unknown_empty_and_ambiguous():
+    index = ie.NameIndex(NAMES)
+    name, score = index.match("Svoboda Karel")
+    assert name is None and score < ie.NAME_MIN_SCORE
+    assert index.match("") == (None, 0.0)
+    assert index.match("12.") == (None, 0.0)
+
+    # stejně daleko od dvou jmen => nejednoznačné, radši re-OCR než špatné jméno
+    name, score = ie.NameIndex(["Malý Petr", "Malá Petr"]).match("Mal Petr")
+    assert name is None and score >= ie.NAME_MIN_SCORE
+
+
+def test_large_list_uses_trigram_shortlist(monkeypatch):
+    first = ["Jan", "Eva", "Petr", "Marie", "Tomáš", "Lucie", "Martin", "Jana", "Pavel", "Hana"]
+    last = ["Novák", "Svoboda", "Dvořák", "Černý", "Procházka", "Kučera", "Veselý", "Horák",
+            "Němec", "Pokorný", "Marek", "Pospíšil", "Hájek", "Jelínek", "Král", "Růžička"]
+    index = ie.NameIndex([f"{l} {f}" for l, f in itertools.product(last, first)])
+    assert len(index) > ie.NAME_SHORTLIST
+
+    assert index.match("Pospisll Lucle")[0] == "Pospíšil Lucie"
+    assert index.match("Ruzicka Martin")[0] == "Růžička Martin"
+    assert index.match("Jelinek Hana")[0] is None  # Hana x Jana => pod NAME_MARGIN
+
+    # shortlist nesmí dát jiný výsledek než porovnání se všemi jmény
+    queries = ["Kucera Pavel", "Jelinek Hana", "Hajek Mar1e", "Pokorny Tomas", "Nemec Lucle", "Xyz"]
+    got = [index.match(q) for q in queries]
+    monkeypatch.setattr(ie, "NAME_SHORTLIST", len(index))
+    assert got == [index.match(q) for q in queries]
+
+
+def test_duplicates_and_load(tmp_path):
+    assert len(ie.NameIndex(["Novák Jan", " Novák Jan ", ""])) == 1
+    path = tmp_path / "jmena.txt"
+    path.write_text("# zaměstnanci\nNovák Jan\n\nČerný Tomáš\n", encoding="utf-8")
+    index = ie.NameIndex.load(str(path))
+    assert index.names == ["Novák Jan", "Černý Tomáš"]
+
+    csv_path = tmp_path / "rozpis.csv"
+    ie.Table(["JMENO", "1"], [["Novák Jan", "D"], ["Černý Tomáš", "N"]]).to_csv(str(csv_path))
+    assert ie.NameIndex.load(str(csv_path)).names == ["Novák Jan", "Černý Tomáš"]
+
+
+def test_levenshtein_bounded():
+    assert ie.levenshtein("kitten", "sitting") == 3
+    assert ie.levenshtein("kitten", "sitting", max_dist=1) == 2  # předčasný konec => max_dist + 1
+    assert ie.levenshtein("", "abc") == 3
@@ -0,0 +1,81 @@
+import numpy as np
+
+import image_extract_v3 as ie
+
+
+def _cache(tmp_path, max_mb=256):
+    # deterministické časy použití => pořadí LRU nezávisí na rozlišení hodin
+    clock = iter(range(1, 10_000))
+    return ie.OcrCache(str(tmp_path / "cache.sqlite"), max_mb=max_mb, now=lambda: float(next(clock)))
+
+
+def test_key_depends_on_pixels_and_config():
+    img = np.zeros((8, 8), np.uint8)
+    other = img.copy()
+    other[0, 0] = 1
+    k = ie.OcrCache.key(img, lang="eng", psm=7)
+    assert k == ie.OcrCache.key(img.copy(), psm=7, lang="eng")
+    assert k != ie.OcrCache.key(other, lang="eng", psm=7)
+    assert k != ie.OcrCache.key(img, lang="ces", psm=7)
+
+
+def test_hit_and_miss(tmp_path):
+    cache = _cache(tmp_path)
+    assert cache.get("a") is None
+    cache.put("a", ["D", 91.5])
+    assert cache.get("a") == ["D", 91.5]
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+    reopened = ie.OcrCache(str(tmp_path / "cache.sqlite"))
+    assert reopened.get("a") == ["D", 91.5]  # perzistentní mezi běhy
+    reopened.close()
+
+
+def test_evicts_least_recently_used(tmp_path):
+    value = "x" * 1000  # ~1 kB na záznam => limit na 4 záznamy
+    cache = _cache(tmp_path, max_mb=4 * 1050 / (1024 * 1024))
+    for k in "abcd":
+        cache.put(k, value)
+    assert cache.get("a") == value  # "a" je teď naposledy použité, nejstarší je "b"
+    cache.put("e", value)
+    cache.evict()
+
+    assert cache.get("b") is None
+    assert cache.get("a") == value
+    assert cache.get("e") == value
+    total = cache._db.execute("SELECT SUM(size) FROM ocr").fetchone()[0]
+    assert total <= cache.max_bytes * 0.9
+    cache.close()
+
+
+def test_profile_counts_cache_per_image(tmp_path, monkeypatch):
+    # druhý obrázek v témže běhu: do profilu jen jeho zásahy, ne kumulativní čítače cache
+    import argparse
+    import cv2
+    import roster_benchmark as rb
+
+    class Fake:
+        name = "fake"
+
+        def image_to_string_conf(self, img, lang, psm, whitelist=None, extra_cfg=""):
+            return ("5" if whitelist == ie.WL_DIGITS else "D"), 90.0
+
+    monkeypatch.setattr(ie, "_ENGINE", Fake())
+    monkeypatch.setattr(ie, "_CACHE", ie.OcrCache(str(tmp_path / "cache.sqlite")))
+    monkeypatch.setattr(ie.PROFILE, "enabled", True)
+    ap = argparse.ArgumentParser()
+    ie.add_pipeline_args(ap)
+    args = ap.parse_args([])
+    img, _ = rb.render_roster(people=4, days=7)
+    path = str(tmp_path / "page.png")
+    cv2.imwrite(path, img)
+
+    counts = []
+    for _ in range(2):
+        ie.PROFILE.reset()
+        ie.process_image(path, args)
+        counts.append((ie.PROFILE.counters.get("cache_hits", 0), ie.PROFILE.counters.get("cache_misses", 0)))
+    ie._CACHE.close()
+    (h1, m1), (h2, m2) = counts
+    assert m1 > 0 and h2 == h1 + m1 and m2 == 0
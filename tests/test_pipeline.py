@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+import image_extract_v3 as ie
+
+
+def _stage(key, delay=0.0, fail_on=None):
+    def fn(ctx):
+        if delay:
+            time.sleep(delay)
+        if ctx["i"] == fail_on:
+            raise RuntimeError(f"{key} selhal na {ctx['i']}")
+        ctx.setdefault("trace", []).append(key)
+        return ctx
+    return fn
+
+
+def _run(pipe, items, timeout=10.0):
+    # běh ve vlákně => zaseknutá pipeline test shodí, místo aby visel
+    result = {}
+
+    def consume():
+        try:
+            result["out"] = list(pipe.run(items))
+        except BaseException as e:
+            result["error"] = e
+
+    t = threading.Thread(target=consume, daemon=True)
+    t.start()
+    t.join(timeout)
+    assert not t.is_alive(), "pipeline se zasekla"
+    return result
+
+
+def test_single_workers_keep_input_order_and_terminate():
+    pipe = ie.StagePipeline([("a", _stage("a"), 1), ("b", _stage("b"), 1), ("c", _stage("c"), 1)], queue_size=1)
+    out = _run(pipe, ({"i": i} for i in range(50)))["out"]
+    assert [c["i"] for c in out] == list(range(50))
+    assert all(c["trace"] == ["a", "b", "c"] for c in out)
+    stats = pipe.stats()
+    assert [stats[n]["items"] for n in "abc"] == [50, 50, 50]
+    assert not [t for t in threading.enumerate() if t.name.startswith("pipeline-")]
+
+
+def test_parallel_workers_emit_each_item_once():
+    # víc vláken => pořadí dokončení, ale každá položka právě jednou
+    pipe = ie.StagePipeline([("a", _stage("a", 0.001), 3), ("b", _stage("b"), 2)], queue_size=2)
+    out = _run(pipe, [{"i": i} for i in range(40)])["out"]
+    assert sorted(c["i"] for c in out) == list(range(40))
+
+
+def test_empty_input():
+    pipe = ie.StagePipeline([("a", _stage("a"), 2), ("b", _stage("b"), 1)])
+    assert _run(pipe, [])["out"] == []
+
+
+def test_stage_error_is_recorded_and_skips_later_stages():
+    pipe = ie.StagePipeline([("a", _stage("a", fail_on=3), 1), ("b", _stage("b"), 1)], queue_size=1)
+    out = _run(pipe, [{"i": i} for i in range(6)])["out"]
+    failed = [c for c in out if "error" in c]
+    assert [c["i"] for c in failed] == [3]
+    assert failed[0]["error"] == "RuntimeError: a selhal na 3" and "trace" not in failed[0]
+    assert all(c["trace"] == ["a", "b"] for c in out if c["i"] != 3)
+
+
+def test_failing_input_propagates_without_hanging_on_full_queue():
+    def items():
+        for i in range(100):
+            if i == 20:
+                raise OSError("vstup nedostupný")
+            yield {"i": i}
+
+    # pomalá poslední fáze + fronty po 1 => při chybě jsou všechny fronty plné
+    pipe = ie.StagePipeline([("a", _stage("a"), 1), ("b", _stage("b", 0.01), 1)], queue_size=1)
+    result = _run(pipe, items())
+    assert isinstance(result.get("error"), OSError)
+
+
+def test_broken_context_propagates_without_hanging():
+    # fáze vrátí místo kontextu řetězec => chyba mimo funkci fáze, run() ji vyhodí
+    pipe = ie.StagePipeline([("a", lambda ctx: "rozbité" if ctx["i"] == 5 else ctx, 1),
+                             ("b", _stage("b", 0.01), 2)], queue_size=1)
+    result = _run(pipe, [{"i": i} for i in range(100)])
+    assert isinstance(result.get("error"), TypeError)
+
+
+def test_consumer_stopping_early_releases_threads():
+    pipe = ie.StagePipeline([("a", _stage("a"), 2), ("b", _stage("b"), 1)], queue_size=1)
+    gen = pipe.run({"i": i} for i in range(1000))
+    assert next(gen)["i"] == 0
+    gen.close()
+    with pytest.raises(StopIteration):
+        next(gen)
+    assert not [t for t in threading.enumerate() if t.name.startswith("pipeline-")]
@@ -0,0 +1,41 @@
+import cv2
+import numpy as np
+import pytest
+
+import image_extract_v3 as ie
+import roster_benchmark as rb
+
+
+def _blank_recall(tmp_path, denoise="auto", **render):
+    img, truth = rb.render_roster(**render)
+    path = str(tmp_path / "page.png")
+    cv2.imwrite(path, img)
+    gray, cells = ie.extract_grid_cells(path, denoise=denoise)
+    bw = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2)
+    body = [c for c in cells if c.r > 0 and c.c > 0]
+    assert len(body) == len(truth["rows"]) * (len(truth["columns"]) - 1)
+    blank = np.array([truth["rows"][c.r - 1][c.c] == "" for c in body])
+    mask = ie.blank_cell_mask(bw, body)
+    return (mask & blank).sum() / blank.sum(), int((mask & ~blank).sum())
+
+
+@pytest.mark.parametrize("render, denoise", [
+    ({}, "auto"),
+    ({"scale": 2.0, "noise": 12.0}, "auto"),
+    # vysoké rozlišení + šum, který 3x3 medián nevyčistí: tečky šumu v binárce
+    # nesmí dělat z prázdných buněk "text"
+    ({"scale": 3.0, "noise": 5.0}, "median"),
+])
+def test_blank_recall_scales_with_resolution(tmp_path, render, denoise):
+    recall, text_as_blank = _blank_recall(tmp_path, denoise, people=8, days=14, **render)
+    assert recall >= 0.98
+    assert text_as_blank == 0  # buňka s textem nesmí přijít o OCR
+
+
+def test_border_lines_and_small_specks_are_not_text():
+    bw = np.full((90, 300), 255, np.uint8)
+    cells = [ie.Cell(r=1, c=i + 1, bbox=(i * 100, 0, 100, 90)) for i in range(3)]
+    bw[:, ::100] = bw[::89, :] = 0                          # mřížka
+    bw[20:22, 130:132] = bw[60:62, 160:162] = 0             # tečky šumu (4 px) v prázdné buňce
+    cv2.putText(bw, "D", (225, 65), cv2.FONT_HERSHEY_SIMPLEX, 1.5, 0, 6)
+    assert ie.blank_cell_mask(bw, cells).tolist() == [True, True, False]
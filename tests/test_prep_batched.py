@@ -0,0 +1,42 @@
+import cv2
+import numpy as np
+import pytest
+
+import image_extract_v3 as ie
+
+
+def _zone_rois(tmp_path, **render_kw):
+    # výřezy buněk stejně jako run_ocr_on_cells: vnitřek bez 2 px, jména šedá, zbytek binárka
+    import roster_benchmark as rb
+    img, _ = rb.render_roster(people=10, days=14, **render_kw)
+    path = str(tmp_path / "page.png")
+    cv2.imwrite(path, img)
+    gray, cells = ie.extract_grid_cells(path)
+    bw = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2)
+    rois = {"header": [], "name": [], "body": []}
+    for c in cells:
+        x, y, w, h = c.bbox
+        sl = np.s_[max(0, y + 2): y + h - 2, max(0, x + 2): x + w - 2]
+        kind = "header" if c.r == 0 else "name" if c.c == 0 else "body"
+        rois[kind].append(gray[sl] if kind == "name" else bw[sl])
+    return rois
+
+
+@pytest.mark.parametrize("render_kw", [{}, {"scale": 1.3, "skew": 0.8, "noise": 4.0},
+                                       {"scale": 0.7, "skew": 1.5}])
+def test_mosaic_matches_per_cell_upscale(tmp_path, render_kw):
+    kernel = np.ones((3, 3), np.uint8)
+    for kind, rois in _zone_rois(tmp_path, **render_kw).items():
+        assert rois
+        batched = ie.preprocess_cells_batched(kind, rois)
+        for roi, got in zip(rois, batched):
+            ref = ie.upscale(ie._clean_name_roi(roi) if kind == "name" else roi, ie.FIRST_PASS[kind][0])
+            # stejné zvětšení => stejný rozměr (± zaokrouhlení)
+            assert abs(got.shape[0] - ref.shape[0]) <= 1 and abs(got.shape[1] - ref.shape[1]) <= 1
+            got = cv2.resize(got, (ref.shape[1], ref.shape[0]), interpolation=cv2.INTER_NEAREST)
+            ink_got, ink_ref = got < 128, ref < 128
+            # rozdíly jen na hranách tahů (posun dlaždice v mozaice < 0.5 px)
+            ref_u8 = ink_ref.view(np.uint8)
+            edge = (cv2.dilate(ref_u8, kernel) > 0) & ~(cv2.erode(ref_u8, kernel) > 0)
+            assert np.count_nonzero((ink_got != ink_ref) & ~edge) <= 0.005 * ref.size
+            assert abs(np.count_nonzero(ink_got) - np.count_nonzero(ink_ref)) <= 0.03 * ref.size
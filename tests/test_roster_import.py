@@ -0,0 +1,78 @@
+import json
+
+import roster_import as ri
+
+
+ROW = {"JMENO": "Nováková Eva", "1": "D", "2": "N", "3": "V", "4": "", "5": "DO", "6": "pn", "31": "R"}
+
+
+def test_person_shifts_maps_codes_and_skips_rest():
+    warnings = []
+    shifts = ri.person_shifts(ROW, 2026, 2, ri.CODE_MAP, warnings)
+    assert shifts == [
+        "2026-02-01,07:00,19:00,Denní",
+        "2026-02-02,19:00,07:00,Noční",
+        "2026-02-05,,,Dovolená",
+    ]
+    assert any("'PN'" in w for w in warnings)         # bez typu v GUI
+    assert any("den 31 mimo" in w for w in warnings)  # únor nemá 31 dní
+
+
+def test_parse_map_overrides():
+    mapping = ri.parse_map(["pn=Dovolená", "D=skip"])
+    assert mapping["PN"] == "Dovolená" and mapping["D"] is None
+    for bad in ("PN", "PN=Nemoc"):
+        try:
+            ri.parse_map([bad])
+        except ValueError:
+            continue
+        raise AssertionError(f"--map {bad} mělo selhat")
+
+
+def _events(ics):
+    assert ics.startswith("BEGIN:VCALENDAR\r\n") and ics.endswith("END:VCALENDAR\r\n")
+    assert "\n" not in ics.replace("\r\n", "")  # jen CRLF
+    return [dict(l.split(":", 1) for l in ev.split("END:VEVENT")[0].split("\r\n")[1:-1])
+            for ev in ics.split("BEGIN:VEVENT")[1:]]
+
+
+def test_make_ics_timed_overnight_and_all_day():
+    day, night, leave = _events(ri.make_ics(["2026-03-28,07:00,19:00,Denní",
+                                             "2026-03-28,19:00,07:00,Noční",
+                                             "2026-03-30,,,Dovolená"]))
+    assert day["DTSTART;TZID=Europe/Prague"] == "20260328T070000"
+    assert day["DTEND;TZID=Europe/Prague"] == "20260328T190000"
+    assert night["DTEND;TZID=Europe/Prague"] == "20260329T070000"  # přes půlnoc => další den
+    assert leave["DTSTART;VALUE=DATE"] == "20260330"
+    assert leave["DTEND;VALUE=DATE"] == "20260331"                  # neinkluzivní konec
+    assert leave["SUMMARY"] == "Dovolená"
+    assert day["UID"] != night["UID"]
+
+    (ev,) = _events(ri.make_ics(["2026-03-28,07:00,15:00,Ranní/ stacionář"], all_day=True))
+    assert ev["DTSTART;VALUE=DATE"] == "20260328"
+    assert ev["SUMMARY"] == "Ranní/ stacionář"
+
+
+def test_ics_escape():
+    assert ri.ics_escape("a,b;c\\d\ne") == r"a\,b\;c\\d\ne"
+
+
+def test_write_month(tmp_path):
+    shifts = ri.person_shifts(ROW, 2026, 3, ri.CODE_MAP, [])
+    assert ri.write_month(tmp_path, 2026, 3, shifts, ics=True, all_day=False, force=False)
+    data = json.loads((tmp_path / "internal" / "calendar_3_2026.json").read_text(encoding="utf-8"))
+    assert data == {"year_and_month": "2026-03", "shifts": shifts}
+    ics = (tmp_path / "calendars" / "calendar_3_2026.ics").read_bytes()
+    assert ics.count(b"BEGIN:VEVENT") == len(shifts) and b"\r\n" in ics
+
+    # existující měsíc se bez --force nepřepisuje
+    assert not ri.write_month(tmp_path, 2026, 3, [], ics=False, all_day=False, force=False)
+    assert ri.write_month(tmp_path, 2026, 3, [], ics=False, all_day=False, force=True)
+
+
+def test_load_roster_csv_and_fold(tmp_path):
+    path = tmp_path / "rozpis.csv"
+    path.write_text("JMENO,1,2\r\nNováková Eva, D ,\r\n", encoding="utf-8-sig")
+    assert ri.load_roster(str(path)) == [{"JMENO": "Nováková Eva", "1": "D", "2": ""}]
+    assert ri.fold("  NOVÁKOVÁ   Eva ") == "novakova eva"
+    assert ri.slugify("Nováková Eva") == "novakova_eva"
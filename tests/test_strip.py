@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import image_extract_v3 as ie
+
+
+class _Words:
+    """Engine, který pro strip vrátí předem dané boxy slov (v souřadnicích stripu před zvětšením)."""
+    name = "fake"
+
+    def __init__(self, words):
+        self.words = words
+        self.k = 1.0
+
+    def image_to_data(self, img, lang, psm, whitelist=None, extra_cfg=""):
+        return [{"text": t, "left": int(round(x1 * self.k)), "top": 0,
+                 "width": int(round((x2 - x1) * self.k)), "height": img.shape[0], "conf": conf}
+                for t, x1, x2, conf in self.words]
+
+
+def _row(n=5, w=30, h=30, x0=100, y0=50):
+    # buňky vedle sebe; výřez z binárky je vnitřek buňky (bez 2 px okraje)
+    return [(ie.Cell(1, c + 1, (x0 + c * w, y0, w, h)), np.full((h - 4, w - 4), 255, np.uint8))
+            for c in range(n)]
+
+
+def _strip_texts(monkeypatch, words, kind="body", **row_kw):
+    strip, spans, k = ie._build_strip(_row(**row_kw))
+    engine = _Words(words)
+    engine.k = k if k > 1.01 else 1.0
+    monkeypatch.setattr(ie, "_ENGINE", engine)
+    monkeypatch.setattr(ie, "_CACHE", None)
+    texts, _ = ie._ocr_strip_task((kind, strip, k, spans, "eng"))
+    return spans, texts
+
+
+def test_build_strip_spans_and_scale():
+    strip, spans, k = ie._build_strip(_row(n=3))
+    assert spans == [(2, 28), (32, 58), (62, 88)]
+    assert strip.shape == (26, 90)
+    assert k == pytest.approx(50 / 26)
+
+
+def test_words_assigned_to_cells(monkeypatch):
+    # spans: (2,28) (32,58) (62,88) (92,118) (122,148)
+    words = [("D", 10, 20, 91),     # buňka 0
+             ("N", 33, 59.5, 88),   # buňka 1, přesah 1.5 px do mezery je v toleranci
+             ("R", 29, 31, 40),     # zbytek čáry v mezeře => ignorovat
+             ("D", 97, 102, 30)]    # buňka 3, ale nízká jistota
+    _, texts = _strip_texts(monkeypatch, words)
+    assert texts == ["D", "N", "", None, ""]
+
+
+def test_word_straddling_border_marks_both_cells(monkeypatch):
+    # střed slova leží v buňce 1, box přetéká hluboko do buňky 2
+    _, texts = _strip_texts(monkeypatch, [("DN", 42, 70, 90)])
+    assert texts == ["", None, None, "", ""]
+
+
+def test_word_centred_in_gap_marks_both_cells(monkeypatch):
+    # střed v mezeře mezi buňkami 2 a 3 (88..92), ale zasahuje do obou => ne "prázdné"
+    _, texts = _strip_texts(monkeypatch, [("DN", 80, 99, 90)])
+    assert texts == ["", "", None, None, ""]
+
+
+def test_two_words_in_one_cell_fall_back(monkeypatch):
+    _, texts = _strip_texts(monkeypatch, [("D", 93, 102, 90), ("N", 106, 116, 90)])
+    assert texts == ["", "", "", None, ""]
+
+
+def test_header_strip_reads_days(monkeypatch):
+    _, texts = _strip_texts(monkeypatch, [("1", 7, 22, 90), ("12", 35, 54, 90)], kind="header", n=2)
+    assert texts == ["1", "12"]
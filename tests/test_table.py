@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+import image_extract_v3 as ie
+
+pd = pytest.importorskip("pandas")
+
+COLUMNS = ["JMENO", "1", "2", "3"]
+ROWS = [["Nováková Eva", "D", "/", ""],
+        ['Jan "Honza" Malý', "", "N,R", "DO"],
+        ["", "PN", "", "SV"]]
+
+
+def test_csv_matches_pandas(tmp_path):
+    ie.Table(COLUMNS, ROWS).to_csv(str(tmp_path / "t.csv"))
+    pd.DataFrame(ROWS, columns=COLUMNS).to_csv(tmp_path / "p.csv", index=False, encoding="utf-8-sig")
+    assert (tmp_path / "t.csv").read_bytes() == (tmp_path / "p.csv").read_bytes()
+
+
+def test_json_matches_pandas(tmp_path):
+    ie.Table(COLUMNS, ROWS).to_json(str(tmp_path / "t.json"))
+    pd.DataFrame(ROWS, columns=COLUMNS).to_json(tmp_path / "p.json", orient="records",
+                                                force_ascii=False, indent=2)
+    # pandas escapuje "/" a formátuje jinak => porovnává se obsah, ne bajty
+    with open(tmp_path / "t.json", encoding="utf-8") as a, open(tmp_path / "p.json", encoding="utf-8") as b:
+        assert json.load(a) == json.load(b)
+
+
+def test_read_csv_roundtrip_and_dataframe(tmp_path):
+    path = str(tmp_path / "t.csv")
+    ie.Table(COLUMNS, ROWS).to_csv(path)
+    t = ie.Table.read_csv(path)
+    assert (t.columns, t.rows) == (COLUMNS, ROWS)
+    assert len(t) == 3 and t.shape == (3, 4) and not t.empty
+    assert t.to_dataframe().equals(pd.read_csv(path, dtype=str, keep_default_na=False))
+
+
+def test_duplicate_columns_and_concat():
+    t = ie.Table(["JMENO", "5", "5"], [["A", "D", "N"]])
+    assert t.records() == [{"JMENO": "A", "5": "D", "5.1": "N"}]  # jako pandas.read_csv
+
+    u = ie.Table(["JMENO", "6"], [["B", "R"]])
+    c = ie.Table.concat([t, u])
+    assert c.columns == ["JMENO", "5", "5", "6"]
+    assert c.rows == [["A", "D", "N", ""], ["B", "", "", "R"]]
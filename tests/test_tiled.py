@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+import pytest
+
+import image_extract_v3 as ie
+
+
+def _page(h=300, w=220, seed=0):
+    """Šum + mřížka + "text", ať filtry mají na hranách pásů co dělat."""
+    rng = np.random.default_rng(seed)
+    g = np.full((h, w), 230, np.uint8)
+    g[::30, :] = g[:, ::40] = 20
+    for y, x in rng.integers(5, (h - 20, w - 30), size=(40, 2)):
+        cv2.putText(g, "DN", (int(x), int(y) + 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, 0, 1)
+    return np.clip(g + rng.normal(0, 12, g.shape), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("mode", ["median", "bilateral", "nlm"])
+@pytest.mark.parametrize("rows", [37, 64, 128])
+def test_denoise_tiled_matches_full(mode, rows):
+    gray = _page()
+    full = ie.denoise_page(gray, mode)
+    tiled = ie.denoise_page(gray, mode, tile_rows=rows)
+    assert tiled.shape == full.shape and tiled.dtype == full.dtype
+    assert np.array_equal(tiled, full)
+
+
+def test_tiled_rows_binarize_matches_full():
+    gray = _page()
+    fn = lambda g: cv2.adaptiveThreshold(g, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 10)
+    assert np.array_equal(ie.tiled_rows(fn, gray, 16, 50), fn(gray))
+
+
+def test_line_profiles_tiled_match_full():
+    bw = cv2.adaptiveThreshold(_page(), 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 10)
+    hk = cv2.getStructuringElement(cv2.MORPH_RECT, (32, 1))
+    vk = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 24))
+    h_full = cv2.reduce(cv2.morphologyEx(bw, cv2.MORPH_OPEN, hk, iterations=2), 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S)
+    v_full = cv2.reduce(cv2.morphologyEx(bw, cv2.MORPH_OPEN, vk, iterations=2), 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)
+    h_prof, v_prof = ie.line_profiles_tiled(bw, hk, vk, rows=45)
+    assert np.array_equal(h_prof, h_full.ravel())
+    assert np.array_equal(v_prof, v_full.ravel())
+
+
+def test_extract_grid_cells_tiled_matches_full(tmp_path):
+    path = str(tmp_path / "page.png")
+    cv2.imwrite(path, _page(h=420, w=500))
+    gray, cells = ie.extract_grid_cells(path)
+    gray_t, cells_t = ie.extract_grid_cells(path, tile_rows=100)
+    assert cells and [c.bbox for c in cells_t] == [c.bbox for c in cells]
+    assert np.array_equal(gray_t, gray)
+
+
+def test_tile_rows_for_memory_limit():
+    assert ie.tile_rows_for((10_000, 8_000)) == ie.TILE_ROWS
+    rows = ie.tile_rows_for((10_000, 8_000), max_memory_mb=200)
+    assert 64 <= rows < ie.TILE_ROWS
+    assert ie.tile_rows_for((10_000, 8_000), max_memory_mb=1) == 64
+
+
+def test_fallback_grid_tiled_matches_full(tmp_path):
+    import roster_benchmark as rb
+    img, _ = rb.render_roster(people=8, days=14, lines=False, noise=6.0)
+    path = str(tmp_path / "nolines.png")
+    cv2.imwrite(path, img)
+    _, cells = ie.extract_grid_cells(path)
+    _, cells_t = ie.extract_grid_cells(path, tile_rows=64)
+    assert len(cells) > 100 and [c.bbox for c in cells_t] == [c.bbox for c in cells]
+
+
+class _Fake:
+    name = "fake"
+
+    def image_to_string_conf(self, img, lang, psm, whitelist=None, extra_cfg=""):
+        return ("5" if whitelist == ie.WL_DIGITS else "D"), 90.0
+
+
+@pytest.mark.parametrize("lines", [True, False])
+def test_peak_allocation_within_memory_cap(tmp_path, monkeypatch, lines):
+    # detekce mřížky (i fallback bez čar) + OCR fáze včetně prefiltru musí zůstat pod limitem
+    import tracemalloc
+    import roster_benchmark as rb
+    monkeypatch.setattr(ie, "_ENGINE", _Fake())
+    # dost vysoká stránka, ať překryvy pásů (~h/20) nejsou půlka stránky jako u malé
+    img, _ = rb.render_roster(people=40, days=14, scale=3.0, lines=lines, noise=5.0)
+    path = str(tmp_path / "page.png")
+    cv2.imwrite(path, img)
+    cap_mb = 4.0 * img.shape[0] * img.shape[1] / (1024 * 1024)  # mezi TILED a FULL_BYTES_PER_PX
+    del img
+    rows = ie.memory_plan(path, max_memory_mb=cap_mb)
+    assert rows > 0  # běžný režim by se do limitu nevešel
+
+    tracemalloc.start()
+    try:
+        gray, cells = ie.extract_grid_cells(path, tile_rows=rows, denoise="median")
+        ie.run_ocr_on_cells(gray, cells, lang="eng", tile_rows=rows, retry_conf=0)
+        peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+    assert cells and peak_mb <= cap_mb
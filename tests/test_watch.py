@@ -0,0 +1,41 @@
+import argparse
+
+import image_extract_v3 as ie
+
+
+def _args():
+    return argparse.Namespace(pipeline=False, **{k: None for k in ie.BATCH_OPT_KEYS})
+
+
+def test_run_batch_skips_vanished_file(tmp_path):
+    # soubor zmizel mezi výpisem složky a zpracováním => přeskočit, ne spadnout
+    manifest = ie.run_batch([str(tmp_path / "zmizel.png")], _args(), str(tmp_path / "out"))
+    assert manifest["images"] == {}
+
+
+def test_watch_survives_failed_cycle_and_retries(tmp_path, monkeypatch, capsys):
+    scan = tmp_path / "scan.png"
+    scan.write_bytes(b"x")
+    polls, batches = [], []
+
+    def collect(spec):
+        polls.append(spec)
+        if len(polls) == 2:
+            scan.write_bytes(b"xx")  # dokopírovává se => velikost se změnila, čekat dál
+        if len(polls) > 5:
+            raise KeyboardInterrupt
+        return [str(scan)]
+
+    def batch(images, args, out_dir, workers=1):
+        batches.append(list(images))
+        if len(batches) == 1:
+            raise OSError("síťová složka nedostupná")
+        return {}
+
+    monkeypatch.setattr(ie, "collect_images", collect)
+    monkeypatch.setattr(ie, "run_batch", batch)
+    ie.watch_folder(str(tmp_path), _args(), str(tmp_path / "out"), interval=0.01, settle=0)
+    # průchod 1: nový, 2: změna velikosti, 3: stabilní => chyba, 4: znovu => OK, 5: beze změn
+    assert batches == [[str(scan)], [str(scan)]]
+    out = capsys.readouterr().out
+    assert "chyba průchodu: OSError" in out and "Sledování ukončeno." in out